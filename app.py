@@ -7,24 +7,45 @@
 #
 #========================================================================
 
+import sys
 import tkinter as tk
 
 from timeseriesmodel import TimeSeriesModel
+from memmaptimeseriesstorage import MemmapTimeSeriesStorage
 from popsimcontroller import PopSimController
+from foodwebloader import loadFoodWeb
 from specieslistview import SpeciesListView
 from simcontrolview import SimControlView
-from timeseriesgraphview import TimeSeriesGraphView
+from speciesgraphgridview import SEPARATE, SpeciesGraphGridView
+from speciesfilter import SpeciesFilter
+from renderscheduler import RenderScheduler
 
 PADDING = 0
 ALL_DIRS = tk.N + tk.S + tk.E + tk.W
 NUM_COLUMNS_OF_GRAPHS = 4
+# graphs beyond a page of rows x columns are paged through
+NUM_ROWS_OF_GRAPHS = 3
+MAX_GRAPH_FPS = 20
+# draw each graph in its own figure, or set to sharedfigurerenderer.SUBPLOTS or OVERLAID to draw them all in one
+GRAPH_MODE = SEPARATE
+USE_WORKER_THREAD = False
+# set to a file path to time every phase of the run and write the timings there on exit
+PHASE_TIMING_DUMP_PATH = None
+# set to a file path to keep the population history on disk rather than in memory
+TRAJECTORY_FILE_PATH = None
+# set to a food web file (.json, .toml or .csv edge list) to simulate instead of the built-in river
+# food web; a path given on the command line overrides it
+FOOD_WEB_FILE_PATH = None
 
 class App:
-    def __init__(self):
+    def __init__(self, foodWebFilePath=FOOD_WEB_FILE_PATH):
+        self.__foodWebFilePath = foodWebFilePath
         self.__root = None
         self.__views = []
         self.__controller = None
         self.__model = None
+        self.__storage = None
+        self.__renderScheduler = None
 
     def run(self):
         self.__root = tk.Tk()
@@ -34,44 +55,62 @@ class App:
         self.setupController()
         self.setupViews()
 
+        if PHASE_TIMING_DUMP_PATH is not None:
+            self.__controller.setPhaseTimingEnabled(True)
+
         self.__model.informAllSubscribers()
 
         self.__root.mainloop()
 
+        self.__controller.stopWorker()
+        self.__controller.stopStreamingExport()
+        if self.__storage is not None:
+            # flushes the trajectory file and trims it to the years actually run
+            self.__storage.close()
+
+        if PHASE_TIMING_DUMP_PATH is not None:
+            self.__controller.dumpPhaseTimings(PHASE_TIMING_DUMP_PATH)
+
     def setupModel(self):
-        self.__model = TimeSeriesModel()
+        if TRAJECTORY_FILE_PATH is not None:
+            self.__storage = MemmapTimeSeriesStorage(TRAJECTORY_FILE_PATH)
+        self.__model = TimeSeriesModel(self.__storage)
         # allow controller to do model setup
 
     def setupController(self):
-        self.__controller = PopSimController(self.__root, self.__model)
+        foodWeb = None
+        if self.__foodWebFilePath is not None:
+            foodWeb = loadFoodWeb(self.__foodWebFilePath)
+        self.__controller = PopSimController(self.__root, self.__model, USE_WORKER_THREAD, foodWeb)
 
     def setupViews(self):
-        speciesListView = SpeciesListView(self.__root, self.__model, self.__controller)
-        speciesListView.getWidget().grid(row=0, column=4, rowspan=2, padx=PADDING, pady=PADDING, sticky=ALL_DIRS)
+        self.__renderScheduler = RenderScheduler(self.__root, MAX_GRAPH_FPS)
+
+        speciesFilter = SpeciesFilter(self.__model.getSeriesIDList(), self.__controller.getSpeciesTrophicLevels())
+
+        speciesListView = SpeciesListView(self.__root, self.__model, self.__controller, speciesFilter)
+        speciesListView.getWidget().grid(row=0, column=NUM_COLUMNS_OF_GRAPHS, rowspan=2,
+                                         padx=PADDING, pady=PADDING, sticky=ALL_DIRS)
         self.__views.append(speciesListView)
 
         simControlView = SimControlView(self.__root, self.__model, self.__controller)
-        simControlView.getWidget().grid(row=2, column=4, padx=PADDING, pady=PADDING, sticky=ALL_DIRS)
+        simControlView.getWidget().grid(row=2, column=NUM_COLUMNS_OF_GRAPHS, padx=PADDING, pady=PADDING,
+                                        sticky=ALL_DIRS)
         self.__views.append(simControlView)
 
-        seriesCounter = 0
-        for seriesID in self.__model.getSeriesIDList():
-            timeSeriesView = TimeSeriesGraphView(self.__root, self.__model, seriesID, self.__controller)
-            graphRow = int(seriesCounter / NUM_COLUMNS_OF_GRAPHS)
-            graphColumn = seriesCounter % NUM_COLUMNS_OF_GRAPHS
-            timeSeriesView.getWidget().grid(row=graphRow, column=graphColumn,
-                                            padx=PADDING, pady=PADDING,
-                                            sticky=ALL_DIRS)
-            self.__views.append(timeSeriesView)
-            seriesCounter += 1
-
-        maxRow = int(seriesCounter / NUM_COLUMNS_OF_GRAPHS)
-        for idx in range(maxRow+1):
+        graphGridView = SpeciesGraphGridView(self.__root, self.__model, self.__controller, speciesFilter,
+                                             self.__renderScheduler, NUM_ROWS_OF_GRAPHS, NUM_COLUMNS_OF_GRAPHS,
+                                             GRAPH_MODE)
+        graphGridView.getWidget().grid(row=0, column=0, rowspan=3, columnspan=NUM_COLUMNS_OF_GRAPHS,
+                                       padx=PADDING, pady=PADDING, sticky=ALL_DIRS)
+        self.__views.append(graphGridView)
+
+        for idx in range(3):
             self.__root.rowconfigure(idx, weight=1)
         for idx in range(NUM_COLUMNS_OF_GRAPHS+1):
             self.__root.columnconfigure(idx, weight=1)
 
 
 if __name__ == "__main__":
-    app = App()
+    app = App(sys.argv[1] if len(sys.argv) > 1 else FOOD_WEB_FILE_PATH)
     app.run()
\ No newline at end of file
@@ -19,3 +19,10 @@ class BaseView:
 
     def timeSeriesUpdated(self, seriesData):
         pass
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        pass
+
+    def timeSeriesBatchUpdated(self, batchData):
+        for deltaData in batchData["deltas"].values():
+            self.timeSeriesDeltaUpdated(deltaData)
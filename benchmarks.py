@@ -0,0 +1,241 @@
+#========================================================================
+#
+# benchmarks.py - script to time the calculator, model and graph hot
+#   paths and check them against a stored baseline
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from foodwebgenerator import makeRandomFoodWeb
+from popsimcalculator import PopSimCalculator
+from popsimkernel import JIT_AVAILABLE, PopSimKernel
+from timeseriesmodel import TimeSeriesModel
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+SPECIES_COUNTS = [10, 100, 1000, 10000]
+HISTORY_LENGTHS = [1000, 10000, 100000]
+NUM_MODEL_SERIES = 10
+GRAPH_DPI = 72
+
+# a result this much slower than its baseline counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def timeCall(function, minSeconds=0.2, repeats=5):
+    """Returns the best time, in seconds, for one call of function.
+    Calls are looped until each repeat takes at least minSeconds / repeats."""
+    # find how many calls make a measurable loop
+    numCalls = 1
+    while True:
+        startTime = time.perf_counter()
+        for callIdx in range(numCalls):
+            function()
+        loopTime = time.perf_counter() - startTime
+        if loopTime >= minSeconds / repeats:
+            break
+        numCalls *= 2
+
+    bestTime = loopTime / numCalls
+    for repeatIdx in range(repeats-1):
+        startTime = time.perf_counter()
+        for callIdx in range(numCalls):
+            function()
+        bestTime = min(bestTime, (time.perf_counter() - startTime) / numCalls)
+    return bestTime
+
+
+def benchmarkCalculators(speciesCounts, seed=1):
+    """Times one simulated year against the number of species"""
+    results = {}
+    for numSpecies in speciesCounts:
+        foodWebGraph = makeRandomFoodWeb(numSpecies, seed)
+        initialPopulations = {speciesID: 1000 for speciesID in foodWebGraph}
+
+        calculator = PopSimCalculator(foodWebGraph)
+        results[f"PopSimCalculator.doSimulation[species={numSpecies}]"] = timeCall(
+            lambda: calculator.doSimulation(initialPopulations))
+
+        vectorCalculator = VectorPopSimCalculator(calculator.getCompiledFoodWeb())
+        initialArray = vectorCalculator.populationsToArray(initialPopulations)
+        results[f"VectorPopSimCalculator.doSimulationArray[species={numSpecies}]"] = timeCall(
+            lambda: vectorCalculator.doSimulationArray(initialArray))
+
+        # time the kernel over a run of years, reported per year
+        kernel = PopSimKernel(calculator.getCompiledFoodWeb())
+        numYears = 100
+        out = np.empty((numYears+1, numSpecies))
+        with np.errstate(over="ignore", invalid="ignore"):
+            results[f"PopSimKernel.runYears[species={numSpecies}]"] = timeCall(
+                lambda: kernel.runYears(initialArray, numYears, out=out)) / numYears
+
+    return results
+
+
+class _CountingSubscriber:
+    """Subscriber that just counts the updates it is sent"""
+    def __init__(self):
+        self.numUpdates = 0
+
+    def timeSeriesUpdated(self, seriesData):
+        self.numUpdates += 1
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        self.numUpdates += 1
+
+
+class _PlotRenderer:
+    """Subscriber that renders a TimeSeriesPlot on every update, as an
+    unscheduled TimeSeriesGraphView does"""
+    def __init__(self, timeSeriesPlot):
+        self.__timeSeriesPlot = timeSeriesPlot
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        self.__timeSeriesPlot.mergeDelta(deltaData)
+        self.__timeSeriesPlot.render()
+
+
+def makeBenchmarkModel(historyLength, numSeries=NUM_MODEL_SERIES):
+    """Returns a model of numSeries series with historyLength years of values"""
+    model = TimeSeriesModel()
+    seriesIDList = [f"S{idx}" for idx in range(numSeries)]
+    for seriesID in seriesIDList:
+        model.addTimeSeries(seriesID)
+    rng = np.random.default_rng(1)
+    model.extendSeries({seriesID: rng.integers(0, 10**6, historyLength) for seriesID in seriesIDList})
+    return model
+
+
+def benchmarkModel(historyLengths):
+    """Times the model's per-year updates and notifications against history length"""
+    results = {}
+    for historyLength in historyLengths:
+        model = makeBenchmarkModel(historyLength)
+        newValues = model.getCurrentValues()
+
+        results[f"TimeSeriesModel.advanceYear[history={historyLength}]"] = timeCall(model.advanceYear)
+
+        # one delta subscriber (like each graph) and one full-history subscriber per series
+        model = makeBenchmarkModel(historyLength)
+        subscriber = _CountingSubscriber()
+        model.subscribeToAllSeriesDeltas(subscriber)
+        model.subscribeToAllSeries(subscriber)
+        model.informAllSubscribers()
+
+        results[f"TimeSeriesModel.setCurrentValues[history={historyLength}]"] = timeCall(
+            lambda: model.setCurrentValues(newValues))
+
+        def batchYear():
+            with model.batchUpdate():
+                model.advanceYear()
+                model.setCurrentValues(newValues)
+        results[f"TimeSeriesModel.batchYear[history={historyLength}]"] = timeCall(batchYear)
+
+        # changing the first year makes the delta subscribers take the whole history again
+        def informAll():
+            model.setSeriesValue("S0", 0, model.getStartYear())
+            model.informAllSubscribers()
+        results[f"TimeSeriesModel.informAllSubscribers[history={historyLength}]"] = timeCall(informAll)
+
+    return results
+
+
+def benchmarkGraph(historyLengths, widthPixels=400, heightPixels=300):
+    """Times a graph's full redraw and its incremental (one new year) render
+    on an Agg canvas, against history length"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from timeseriesplot import TimeSeriesPlot
+
+    results = {}
+    for historyLength in historyLengths:
+        model = makeBenchmarkModel(historyLength, numSeries=1)
+
+        figure = Figure(figsize=(widthPixels/GRAPH_DPI, heightPixels/GRAPH_DPI), dpi=GRAPH_DPI)
+        timeSeriesPlot = TimeSeriesPlot(figure, FigureCanvasAgg(figure), "S0")
+        model.subscribeToSeriesDeltas("S0", _PlotRenderer(timeSeriesPlot))
+        model.informAllSubscribers()
+
+        results[f"TimeSeriesPlot.redraw[history={historyLength}]"] = timeCall(timeSeriesPlot.redraw)
+
+        def renderNewYear():
+            model.advanceYear()
+            model.informAllSubscribers()
+        results[f"TimeSeriesPlot.render[history={historyLength}]"] = timeCall(renderNewYear)
+
+    return results
+
+
+def runBenchmarks(speciesCounts=SPECIES_COUNTS, historyLengths=HISTORY_LENGTHS, includeGraph=True):
+    """Runs every benchmark, returning a JSON-ready dict of the environment and
+    {benchmark name: seconds per call}"""
+    results = {}
+    results.update(benchmarkCalculators(speciesCounts))
+    results.update(benchmarkModel(historyLengths))
+    if includeGraph:
+        results.update(benchmarkGraph(historyLengths))
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "jit": JIT_AVAILABLE
+        },
+        "results": results
+    }
+
+
+def findRegressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns (name, baseline seconds, new seconds) for every result more than
+    tolerance slower than the baseline.  Results not in both are ignored."""
+    regressions = []
+    for name, seconds in report["results"].items():
+        baselineSeconds = baseline["results"].get(name)
+        if baselineSeconds is not None and seconds > baselineSeconds * (1 + tolerance):
+            regressions.append((name, baselineSeconds, seconds))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Time the simulation's hot paths")
+    parser.add_argument("--output", help="file to write the JSON report to (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="fraction slower than the baseline that counts as a regression")
+    parser.add_argument("--species", type=int, nargs="+", default=SPECIES_COUNTS,
+                        help="species counts for the calculator benchmarks")
+    parser.add_argument("--history", type=int, nargs="+", default=HISTORY_LENGTHS,
+                        help="history lengths for the model and graph benchmarks")
+    parser.add_argument("--no-graph", action="store_true", help="skip the graph benchmarks")
+    args = parser.parse_args(args)
+
+    report = runBenchmarks(args.species, args.history, not args.no_graph)
+    reportText = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(reportText + "\n")
+    else:
+        print(reportText)
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = findRegressions(report, baseline, args.tolerance)
+        for name, baselineSeconds, seconds in regressions:
+            print(f"REGRESSION {name}: {baselineSeconds*1e6:.1f}us -> {seconds*1e6:.1f}us", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#========================================================================
+#
+# checkpointlog.py - class to record population checkpoints and user
+#   overrides so that any year of a run can be replayed
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import bisect
+
+
+class CheckpointLog:
+    """Records enough of a run to replay it to any year.
+
+    A checkpoint holds every species' population, as calculated, every
+    checkpointInterval years (and for the start year).  Overrides are
+    logged, in the order they were made, with the year they were applied
+    to.  The populations for a year are rebuilt by taking the nearest
+    checkpoint at or before it, then alternately applying that year's
+    overrides and calculating the next year, so no more than
+    checkpointInterval years are ever recalculated.
+    """
+    def __init__(self, startYear, startPopulations, checkpointInterval=100):
+        self.__startYear = startYear
+        self.__checkpointInterval = max(1, checkpointInterval)
+        # checkpoint years (sorted) and their populations
+        self.__checkpointYears = [startYear]
+        self.__checkpoints = {startYear: dict(startPopulations)}
+        # (year, seriesID, value) in the order applied
+        self.__overrides = []
+
+    def getStartYear(self):
+        return self.__startYear
+
+    def getCheckpointInterval(self):
+        return self.__checkpointInterval
+
+    def getLastYear(self):
+        """Returns the latest year with a checkpoint or override"""
+        lastYear = self.__checkpointYears[-1]
+        if len(self.__overrides) > 0:
+            lastYear = max(lastYear, self.__overrides[-1][0])
+        return lastYear
+
+    def getCheckpointYears(self):
+        return list(self.__checkpointYears)
+
+    def getOverrides(self, firstYear=None, lastYear=None):
+        """Returns the (year, seriesID, value) overrides applied from firstYear
+        to lastYear inclusive, in the order they were applied"""
+        return [override for override in self.__overrides
+                if (firstYear is None or override[0] >= firstYear)
+                and (lastYear is None or override[0] <= lastYear)]
+
+    def isCheckpointYear(self, year):
+        return year > self.__startYear and (year - self.__startYear) % self.__checkpointInterval == 0
+
+    def recordYear(self, year, populations):
+        """Records a newly calculated year, keeping it if it is a checkpoint year"""
+        if self.isCheckpointYear(year) and year > self.__checkpointYears[-1]:
+            self.__checkpointYears.append(year)
+            self.__checkpoints[year] = dict(populations)
+
+    def recordOverride(self, year, seriesID, value):
+        self.__overrides.append((year, seriesID, value))
+
+    def getNearestCheckpoint(self, year):
+        """Returns (checkpointYear, populations) for the latest checkpoint at or before year"""
+        if year < self.__startYear:
+            raise ValueError(f"Year {year} is before the start of the run")
+        checkpointYear = self.__checkpointYears[bisect.bisect_right(self.__checkpointYears, year) - 1]
+        return checkpointYear, dict(self.__checkpoints[checkpointYear])
+
+    def replay(self, calculator, lastYear, firstYear=None):
+        """Rebuilds the populations of each year from firstYear (by default, the
+        nearest checkpoint year) to lastYear inclusive.
+        Returns (firstYear, list of populations dicts)."""
+        if firstYear is None:
+            firstYear = lastYear
+        checkpointYear, populations = self.getNearestCheckpoint(firstYear)
+
+        overridesByYear = {}
+        for year, seriesID, value in self.getOverrides(checkpointYear, lastYear):
+            overridesByYear.setdefault(year, []).append((seriesID, value))
+
+        yearPopulationsList = []
+        for year in range(checkpointYear, lastYear+1):
+            if year > checkpointYear:
+                populations = calculator.doSimulation(populations, year)
+            for seriesID, value in overridesByYear.get(year, []):
+                populations[seriesID] = value
+            if year >= firstYear:
+                yearPopulationsList.append(dict(populations))
+
+        return firstYear, yearPopulationsList
+
+    def replayTo(self, calculator, year):
+        """Returns the populations for year, rebuilt from the nearest checkpoint"""
+        return self.replay(calculator, year)[1][0]
+
+    def truncate(self, lastYear):
+        """Forgets every checkpoint and override after lastYear"""
+        del self.__checkpointYears[bisect.bisect_right(self.__checkpointYears, lastYear):]
+        self.__checkpoints = {year: self.__checkpoints[year] for year in self.__checkpointYears}
+        self.__overrides = [override for override in self.__overrides if override[0] <= lastYear]
+
+    def branchAt(self, lastYear):
+        """Returns a new log holding this one's record up to lastYear, from
+        which a different trajectory can be followed"""
+        branchLog = CheckpointLog(self.__startYear, self.__checkpoints[self.__startYear], self.__checkpointInterval)
+        for year in self.__checkpointYears[1:]:
+            branchLog.recordYear(year, self.__checkpoints[year])
+        for override in self.__overrides:
+            branchLog.recordOverride(*override)
+        branchLog.truncate(lastYear)
+        return branchLog
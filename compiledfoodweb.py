@@ -0,0 +1,188 @@
+#========================================================================
+#
+# compiledfoodweb.py - class to hold a validated, integer-indexed form of
+#   a food web graph
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import *
+
+SPECIES_VALUE_KEYS = [REQUIRED_BIOMASS_FACTOR, INDIVIDUAL_BIOMASS, GROWTH_RATE_FACTOR, DECLINE_RATE_FACTOR]
+
+# per-species values a graph may leave out, with the value used when it does
+OPTIONAL_SPECIES_VALUE_DEFAULTS = {IMMIGRATION_RATE: 0, EMIGRATION_RATE: 0, RECOLONISATION_RATE: 0,
+                                   DISPERSAL_RATE: 0}
+
+
+class CompiledFoodWeb:
+    """Food web graph compiled once into species-indexed tables.
+
+    Species are numbered in the graph's order.  Predator and prey lists are
+    held in CSR form (an indptr array of row starts into an indices array),
+    keeping the graph's list order, so sums over them can be done in exactly
+    the same order as the original graph walk.
+
+    "Prey edges" are the entries of the predator CSR (one per prey species
+    and predator in its PREDATORS list); "predator edges" are the entries of
+    the prey CSR (one per predator and prey in its PREY list).
+
+    The graph is validated when compiled, raising ValueError if it is
+    inconsistent.
+    """
+    def __init__(self, foodWebGraph):
+        self.__foodWebGraph = foodWebGraph
+        self.__speciesIDList = list(foodWebGraph.keys())
+        self.__speciesIndex = {speciesID: idx for idx, speciesID in enumerate(self.__speciesIDList)}
+
+        self.__validate(foodWebGraph)
+
+        # per-species tables, both as the graph's own numbers and as arrays
+        self.__speciesValues = {key: [foodWebGraph[speciesID][key] for speciesID in self.__speciesIDList]
+                                for key in SPECIES_VALUE_KEYS}
+        for key, defaultValue in OPTIONAL_SPECIES_VALUE_DEFAULTS.items():
+            self.__speciesValues[key] = [foodWebGraph[speciesID].get(key, defaultValue)
+                                         for speciesID in self.__speciesIDList]
+        self.__speciesArrays = {key: np.array(values, dtype=np.float64)
+                                for key, values in self.__speciesValues.items()}
+
+        # predator and prey lists as CSR
+        self.__predatorLists = [[self.__speciesIndex[predatorID] for predatorID in foodWebGraph[speciesID][PREDATORS]]
+                                for speciesID in self.__speciesIDList]
+        self.__preyLists = [[self.__speciesIndex[preyID] for preyID in foodWebGraph[speciesID][PREY]]
+                            for speciesID in self.__speciesIDList]
+        self.__predatorCSR = self.__makeCSR(self.__predatorLists)
+        self.__preyCSR = self.__makeCSR(self.__preyLists)
+
+        # link each predator edge to the matching prey edge
+        preyEdgeLookup = {}
+        for preyIdx, predatorList in enumerate(self.__predatorLists):
+            for predatorIdx in predatorList:
+                preyEdgeLookup.setdefault((preyIdx, predatorIdx), len(preyEdgeLookup))
+        self.__predatorEdgeToPreyEdge = [preyEdgeLookup[(preyIdx, predatorIdx)]
+                                         for predatorIdx, preyList in enumerate(self.__preyLists)
+                                         for preyIdx in preyList]
+
+        # a prey edge only carries predation pressure if the predator really eats the prey
+        predatorEdges = {(predatorIdx, preyIdx)
+                         for predatorIdx, preyList in enumerate(self.__preyLists)
+                         for preyIdx in preyList}
+        self.__preyEdgeHasPressure = [(predatorIdx, preyIdx) in predatorEdges
+                                      for preyIdx, predatorList in enumerate(self.__predatorLists)
+                                      for predatorIdx in predatorList]
+
+        self.__trophicLevels = self.__findTrophicLevels()
+
+    def getTrophicLevels(self):
+        """Returns each species' trophic level, by species index: 1 for species
+        that eat nothing, otherwise one more than their lowest level prey (the
+        length of the shortest food chain down from them).  Species with no
+        chain down to one that eats nothing get None."""
+        return self.__trophicLevels
+
+    def getFoodWebGraph(self):
+        """Returns the graph dict the food web was compiled from"""
+        return self.__foodWebGraph
+
+    def getSpeciesIDList(self):
+        return list(self.__speciesIDList)
+
+    def getNumSpecies(self):
+        return len(self.__speciesIDList)
+
+    def getSpeciesIndex(self, speciesID):
+        return self.__speciesIndex[speciesID]
+
+    def getSpeciesValues(self, key):
+        """Returns a list of the graph's values for key (e.g. INDIVIDUAL_BIOMASS), by species index"""
+        return self.__speciesValues[key]
+
+    def getSpeciesArray(self, key):
+        """Returns a float64 array of the graph's values for key, by species index"""
+        return self.__speciesArrays[key]
+
+    def getPredatorLists(self):
+        """Returns, for each species, the list of its predators' indices"""
+        return self.__predatorLists
+
+    def getPreyLists(self):
+        """Returns, for each species, the list of its prey's indices"""
+        return self.__preyLists
+
+    def getPredatorCSR(self):
+        """Returns (indptr, indices) of each species' predators"""
+        return self.__predatorCSR
+
+    def getPreyCSR(self):
+        """Returns (indptr, indices) of each species' prey"""
+        return self.__preyCSR
+
+    def getPredatorEdgeToPreyEdge(self):
+        """Returns, for each predator edge, the index of the matching prey edge"""
+        return self.__predatorEdgeToPreyEdge
+
+    def getPreyEdgeHasPressure(self):
+        """Returns, for each prey edge, whether the predator lists the prey as PREY"""
+        return self.__preyEdgeHasPressure
+
+    def __findTrophicLevels(self):
+        # breadth first, up from the species that eat nothing
+        eatenBy = [[] for speciesIdx in range(len(self.__speciesIDList))]
+        for predatorIdx, preyList in enumerate(self.__preyLists):
+            for preyIdx in preyList:
+                eatenBy[preyIdx].append(predatorIdx)
+
+        trophicLevels = [None] * len(self.__speciesIDList)
+        levelSpecies = [speciesIdx for speciesIdx, preyList in enumerate(self.__preyLists) if len(preyList) == 0]
+        level = 1
+        while len(levelSpecies) > 0:
+            for speciesIdx in levelSpecies:
+                trophicLevels[speciesIdx] = level
+            nextLevelSpecies = {predatorIdx for speciesIdx in levelSpecies for predatorIdx in eatenBy[speciesIdx]
+                                if trophicLevels[predatorIdx] is None}
+            levelSpecies = sorted(nextLevelSpecies)
+            level += 1
+        return trophicLevels
+
+    def __validate(self, foodWebGraph):
+        for speciesID, speciesData in foodWebGraph.items():
+            for key in SPECIES_VALUE_KEYS + [PREDATORS, PREY]:
+                if key not in speciesData:
+                    raise ValueError(f"{speciesID} has no value for '{key}'")
+
+            for otherSpeciesID in speciesData[PREDATORS] + speciesData[PREY]:
+                if otherSpeciesID not in self.__speciesIndex:
+                    raise ValueError(f"{speciesID} refers to unknown species {otherSpeciesID}")
+
+            for key in (PREDATORS, PREY):
+                if len(set(speciesData[key])) != len(speciesData[key]):
+                    raise ValueError(f"{speciesID} lists the same species more than once in '{key}'")
+
+            if speciesData[INDIVIDUAL_BIOMASS] <= 0:
+                raise ValueError(f"{speciesID} must have a positive individual biomass")
+
+            for preySpeciesID in speciesData[PREY]:
+                if speciesID not in foodWebGraph[preySpeciesID][PREDATORS]:
+                    raise ValueError(f"{speciesID} eats {preySpeciesID}"
+                                     f" but is not listed as one of its predators")
+
+            if len(speciesData[PREY]) > 0 and speciesData[REQUIRED_BIOMASS_FACTOR] <= 0:
+                raise ValueError(f"{speciesID} has prey but no required biomass")
+
+            if speciesData.get(IMMIGRATION_RATE, 0) < 0:
+                raise ValueError(f"{speciesID} must not have a negative immigration rate")
+
+            for key in (EMIGRATION_RATE, RECOLONISATION_RATE, DISPERSAL_RATE):
+                if not 0 <= speciesData.get(key, 0) <= 1:
+                    raise ValueError(f"{speciesID} must have a value for '{key}' between 0 and 1")
+
+    @staticmethod
+    def __makeCSR(indexLists):
+        indptr = np.zeros(len(indexLists)+1, dtype=np.intp)
+        indptr[1:] = np.cumsum([len(indexList) for indexList in indexLists])
+        indices = np.array([idx for indexList in indexLists for idx in indexList], dtype=np.intp)
+        return indptr, indices
@@ -0,0 +1,101 @@
+#========================================================================
+#
+# ensemblerunner.py - class to run many stochastic replicates of a
+#   simulation and gather their statistics
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import *
+from compiledfoodweb import CompiledFoodWeb
+from ensemblestatistics import EnsembleStatistics
+
+DEFAULT_BATCH_SIZE = 256
+
+
+class EnsembleRunner:
+    """Runs Monte Carlo replicates of the simulation from the same starting
+    populations, gathering them into an EnsembleStatistics as it goes.
+
+    Replicates are run batchSize at a time through PopSimCalculator's batch
+    simulation, a year at a time, and each year is added to the statistics
+    then dropped, so memory is O(batchSize x species) plus the statistics'
+    O(years x species), however many replicates are run.
+
+    Each batch draws its migration from its own seed, [migrationSeed,
+    batchIdx], so an ensemble is reproducible from migrationSeed (with the
+    same batchSize).  Without any migration rates in the food web every
+    replicate is the same.
+    """
+    def __init__(self, foodWebGraph=None,
+                 minPredationFactor=MIN_PREDATION_FACTOR, maxPredationFactor=MAX_PREDATION_FACTOR,
+                 migrationSeed=None, batchSize=DEFAULT_BATCH_SIZE):
+        if foodWebGraph is None:
+            foodWebGraph = FOOD_WEB_GRAPH
+        if not isinstance(foodWebGraph, CompiledFoodWeb):
+            foodWebGraph = CompiledFoodWeb(foodWebGraph)
+        if migrationSeed is None:
+            migrationSeed = np.random.SeedSequence().entropy
+
+        self.__foodWeb = foodWebGraph
+        self.__minPredationFactor = minPredationFactor
+        self.__maxPredationFactor = maxPredationFactor
+        self.__migrationSeed = migrationSeed
+        self.__batchSize = max(1, batchSize)
+        self.__progressSubscribers = []
+
+    def getSpeciesIDList(self):
+        return self.__foodWeb.getSpeciesIDList()
+
+    def getMigrationSeed(self):
+        return self.__migrationSeed
+
+    def subscribeToProgress(self, subscriber):
+        """registers the subscriber to get ensembleRunProgressed(...) calls after each batch"""
+        self.__progressSubscribers.append(subscriber)
+
+    def run(self, initialPopulations, numYears, numReplicates, startYear=0, statistics=None):
+        """Runs numReplicates replicates of numYears years from the
+        initialPopulations dict (of startYear), returning their
+        EnsembleStatistics.  Pass statistics to add to an existing ensemble."""
+        speciesIDList = self.getSpeciesIDList()
+        if statistics is None:
+            statistics = EnsembleStatistics(speciesIDList, startYear, numYears)
+
+        initialArray = np.array([initialPopulations[speciesID] for speciesID in speciesIDList], dtype=np.float64)
+        firstBatchIdx = -(-statistics.getNumReplicates() // self.__batchSize)
+
+        replicatesRun = 0
+        batchIdx = firstBatchIdx
+        while replicatesRun < numReplicates:
+            numBatchReplicates = min(self.__batchSize, numReplicates - replicatesRun)
+            self.__runBatch(batchIdx, initialArray, numBatchReplicates, numYears, startYear, statistics)
+            replicatesRun += numBatchReplicates
+            batchIdx += 1
+            self.__informProgress(replicatesRun, numReplicates, statistics)
+
+        return statistics
+
+    def __runBatch(self, batchIdx, initialArray, numBatchReplicates, numYears, startYear, statistics):
+        calculator = PopSimCalculator(self.__foodWeb, self.__minPredationFactor, self.__maxPredationFactor,
+                                      migrationSeed=[self.__migrationSeed, batchIdx])
+
+        populations = np.tile(initialArray, (numBatchReplicates, 1))
+        statistics.addYear(0, populations)
+        with np.errstate(over='ignore', invalid='ignore'):
+            for yearIdx in range(numYears):
+                populations = calculator.doBatchSimulation(populations, 1, startYear + yearIdx)[:, 1, :]
+                statistics.addYear(yearIdx+1, populations)
+
+    def __informProgress(self, replicatesRun, numReplicates, statistics):
+        progressData = {
+            "replicatesRun": replicatesRun,
+            "numReplicates": numReplicates,
+            "statistics": statistics
+        }
+        for subscriber in self.__progressSubscribers:
+            subscriber.ensembleRunProgressed(progressData)
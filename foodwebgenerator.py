@@ -0,0 +1,70 @@
+#========================================================================
+#
+# foodwebgenerator.py - function to make random (but consistent) food
+#   web graphs of any size
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import random
+
+from popsimcalculator import *
+
+# values picked from for each species, in the same range as FOOD_WEB_GRAPH's
+REQUIRED_BIOMASS_FACTOR_CHOICES = [1.5, 2.5, 4]
+INDIVIDUAL_BIOMASS_CHOICES = [1e-3, 15e-3, 0.05, 1, 3, 7]
+GROWTH_RATE_FACTOR_CHOICES = [1.01, 1.075, 1.1, 1.115, 1.15]
+DECLINE_RATE_FACTOR_CHOICES = [0.75, 0.8, 0.85, 0.9, 0.95]
+IMMIGRATION_RATE_CHOICES = [0, 0, 0.5, 5]
+EMIGRATION_RATE_CHOICES = [0, 0, 0.01, 0.05]
+RECOLONISATION_RATE_CHOICES = [0, 0.05, 0.2]
+
+# share of species at the bottom of the web, which eat nothing
+BASAL_SPECIES_FRACTION = 0.25
+
+
+def makeRandomFoodWeb(numSpecies, rng=None, maxPreyPerSpecies=4, withMigration=False):
+    """Returns a food web graph of numSpecies species "S0", "S1", ...
+
+    Species only eat species earlier in the list, so the web has no cycles,
+    and every prey lists its predators (in a shuffled order), so the graph
+    passes CompiledFoodWeb's validation.  rng is a random.Random (or a seed).
+    withMigration gives the species random migration rates too.
+    """
+    if not isinstance(rng, random.Random):
+        rng = random.Random(rng)
+
+    speciesIDList = [f"S{idx}" for idx in range(numSpecies)]
+    numBasalSpecies = max(1, int(numSpecies * BASAL_SPECIES_FRACTION))
+
+    foodWebGraph = {}
+    for speciesIdx, speciesID in enumerate(speciesIDList):
+        foodWebGraph[speciesID] = {
+            REQUIRED_BIOMASS_FACTOR: rng.choice(REQUIRED_BIOMASS_FACTOR_CHOICES),
+            INDIVIDUAL_BIOMASS: rng.choice(INDIVIDUAL_BIOMASS_CHOICES),
+            GROWTH_RATE_FACTOR: rng.choice(GROWTH_RATE_FACTOR_CHOICES),
+            DECLINE_RATE_FACTOR: rng.choice(DECLINE_RATE_FACTOR_CHOICES),
+            PREDATORS: [],
+            PREY: []
+        }
+
+        if speciesIdx < numBasalSpecies:
+            foodWebGraph[speciesID][REQUIRED_BIOMASS_FACTOR] = 0
+        else:
+            numPrey = rng.randint(1, min(speciesIdx, maxPreyPerSpecies))
+            for preyIdx in rng.sample(range(speciesIdx), numPrey):
+                foodWebGraph[speciesID][PREY].append(speciesIDList[preyIdx])
+                foodWebGraph[speciesIDList[preyIdx]][PREDATORS].append(speciesID)
+
+    for speciesData in foodWebGraph.values():
+        rng.shuffle(speciesData[PREDATORS])
+
+    if withMigration:
+        for speciesData in foodWebGraph.values():
+            speciesData[IMMIGRATION_RATE] = rng.choice(IMMIGRATION_RATE_CHOICES)
+            speciesData[EMIGRATION_RATE] = rng.choice(EMIGRATION_RATE_CHOICES)
+            speciesData[RECOLONISATION_RATE] = rng.choice(RECOLONISATION_RATE_CHOICES)
+
+    return foodWebGraph
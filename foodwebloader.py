@@ -0,0 +1,292 @@
+#========================================================================
+#
+# foodwebloader.py - functions to read food webs from JSON, TOML and CSV
+#   files, caching their compiled form on disk
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import csv
+import hashlib
+import json
+import math
+import os
+import pickle
+import tempfile
+from os import path
+
+from popsimcalculator import *
+from compiledfoodweb import CompiledFoodWeb, SPECIES_VALUE_KEYS, OPTIONAL_SPECIES_VALUE_DEFAULTS
+
+try:
+    import tomllib
+    TOML_AVAILABLE = True
+except ImportError:
+    try:
+        import tomli as tomllib
+        TOML_AVAILABLE = True
+    except ImportError:
+        TOML_AVAILABLE = False
+
+FOOD_WEB_FORMAT_VERSION = 1
+# bump whenever CompiledFoodWeb's contents change, so old cached forms aren't used
+COMPILED_CACHE_VERSION = 3
+DEFAULT_CACHE_DIR = path.join(path.expanduser("~"), ".cache", "biodivpopsim")
+
+JSON_EXTENSION = ".json"
+TOML_EXTENSION = ".toml"
+CSV_EXTENSION = ".csv"
+# a CSV edge list's species values are read from the file beside it, e.g. river.csv -> river.species.csv
+CSV_SPECIES_SUFFIX = ".species.csv"
+
+# names used in files for each species value
+FILE_VALUE_KEYS = {
+    "requiredBiomassFactor": REQUIRED_BIOMASS_FACTOR,
+    "individualBiomass": INDIVIDUAL_BIOMASS,
+    "growthRateFactor": GROWTH_RATE_FACTOR,
+    "declineRateFactor": DECLINE_RATE_FACTOR,
+    "immigrationRate": IMMIGRATION_RATE,
+    "emigrationRate": EMIGRATION_RATE,
+    "recolonisationRate": RECOLONISATION_RATE,
+    "dispersalRate": DISPERSAL_RATE
+}
+FILE_PREY_KEY = "prey"
+FILE_PREDATORS_KEY = "predators"
+FILE_SPECIES_KEY = "species"
+FILE_EDGES_KEY = "edges"
+FILE_VERSION_KEY = "formatVersion"
+CSV_SPECIES_COLUMN = "species"
+CSV_PREDATOR_COLUMN = "predator"
+CSV_PREY_COLUMN = "prey"
+
+
+def loadFoodWeb(filePath, cacheDir=DEFAULT_CACHE_DIR):
+    """Returns the CompiledFoodWeb of the food web file at filePath.
+
+    The compiled form is cached in cacheDir (None for no cache), keyed by a
+    hash of the file contents, so a web only has to be parsed, validated and
+    compiled the first time it is loaded (or after it is changed).
+    """
+    contents = _readContents(filePath)
+    if cacheDir is None:
+        return _compileFoodWeb(filePath, contents)
+
+    contentHash = hashlib.sha256(f"{COMPILED_CACHE_VERSION}:{_getFormat(filePath)}".encode("utf-8"))
+    for fileContents in contents:
+        contentHash.update(len(fileContents).to_bytes(8, "little"))
+        contentHash.update(fileContents)
+    cachePath = path.join(cacheDir, contentHash.hexdigest() + ".pickle")
+
+    if path.exists(cachePath):
+        try:
+            with open(cachePath, "rb") as cacheFile:
+                compiledFoodWeb = pickle.load(cacheFile)
+            if isinstance(compiledFoodWeb, CompiledFoodWeb):
+                return compiledFoodWeb
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+            # a damaged or out of date cache entry is just compiled again
+            pass
+
+    compiledFoodWeb = _compileFoodWeb(filePath, contents)
+
+    # write to a temporary file first, so another process never reads a partly written entry
+    os.makedirs(cacheDir, exist_ok=True)
+    cacheFileDescriptor, tempPath = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+    try:
+        with os.fdopen(cacheFileDescriptor, "wb") as cacheFile:
+            pickle.dump(compiledFoodWeb, cacheFile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        if path.exists(tempPath):
+            os.remove(tempPath)
+
+    return compiledFoodWeb
+
+
+def readFoodWebGraph(filePath):
+    """Returns the food web graph dict in the file at filePath, read as JSON,
+    TOML or (with its species file) a CSV edge list by its extension.
+    Raises ValueError if the file doesn't match the food web schema."""
+    return _parseFoodWeb(filePath, _readContents(filePath))
+
+
+def writeFoodWebGraph(foodWebGraph, filePath):
+    """Writes the food web graph to filePath, as JSON or (with its species
+    file) a CSV edge list by its extension"""
+    fileFormat = _getFormat(filePath)
+    if fileFormat == JSON_EXTENSION:
+        species = {}
+        for speciesID, speciesData in foodWebGraph.items():
+            species[speciesID] = {fileKey: speciesData[key] for fileKey, key in FILE_VALUE_KEYS.items()
+                                  if key in speciesData}
+            species[speciesID][FILE_PREDATORS_KEY] = list(speciesData[PREDATORS])
+            species[speciesID][FILE_PREY_KEY] = list(speciesData[PREY])
+        with open(filePath, "w") as foodWebFile:
+            json.dump({FILE_VERSION_KEY: FOOD_WEB_FORMAT_VERSION, FILE_SPECIES_KEY: species}, foodWebFile, indent=2)
+    elif fileFormat == CSV_EXTENSION:
+        fileKeys = [fileKey for fileKey, key in FILE_VALUE_KEYS.items()
+                    if any(key in speciesData for speciesData in foodWebGraph.values())]
+        with open(_getSpeciesFilePath(filePath), "w", newline="") as speciesFile:
+            writer = csv.writer(speciesFile)
+            writer.writerow([CSV_SPECIES_COLUMN] + fileKeys)
+            for speciesID, speciesData in foodWebGraph.items():
+                writer.writerow([speciesID] + [speciesData.get(FILE_VALUE_KEYS[fileKey],
+                                                               OPTIONAL_SPECIES_VALUE_DEFAULTS.get(FILE_VALUE_KEYS[fileKey]))
+                                               for fileKey in fileKeys])
+        with open(filePath, "w", newline="") as edgeFile:
+            writer = csv.writer(edgeFile)
+            writer.writerow([CSV_PREDATOR_COLUMN, CSV_PREY_COLUMN])
+            for speciesID, speciesData in foodWebGraph.items():
+                for preyID in speciesData[PREY]:
+                    writer.writerow([speciesID, preyID])
+    else:
+        raise ValueError(f"Can only write food webs as {JSON_EXTENSION} or {CSV_EXTENSION}, not {filePath}")
+
+
+def _compileFoodWeb(filePath, contents):
+    foodWebGraph = _parseFoodWeb(filePath, contents)
+    try:
+        return CompiledFoodWeb(foodWebGraph)
+    except ValueError as error:
+        raise ValueError(f"{filePath}: {error}") from error
+
+
+def _getFormat(filePath):
+    fileFormat = path.splitext(str(filePath))[1].lower()
+    if fileFormat not in (JSON_EXTENSION, TOML_EXTENSION, CSV_EXTENSION):
+        raise ValueError(f"Unknown food web file type: {filePath}")
+    return fileFormat
+
+
+def _getSpeciesFilePath(filePath):
+    return path.splitext(str(filePath))[0] + CSV_SPECIES_SUFFIX
+
+
+def _readContents(filePath):
+    """Returns a list of the bytes of each file making up the food web"""
+    filePaths = [filePath]
+    if _getFormat(filePath) == CSV_EXTENSION:
+        filePaths.append(_getSpeciesFilePath(filePath))
+
+    contents = []
+    for eachFilePath in filePaths:
+        with open(eachFilePath, "rb") as foodWebFile:
+            contents.append(foodWebFile.read())
+    return contents
+
+
+def _parseFoodWeb(filePath, contents):
+    fileFormat = _getFormat(filePath)
+    try:
+        if fileFormat == JSON_EXTENSION:
+            document = json.loads(contents[0].decode("utf-8"))
+        elif fileFormat == TOML_EXTENSION:
+            if not TOML_AVAILABLE:
+                raise ValueError("Reading TOML food webs needs Python 3.11 or the tomli package")
+            document = tomllib.loads(contents[0].decode("utf-8"))
+        else:
+            document = _csvToDocument(contents[0].decode("utf-8"), contents[1].decode("utf-8"))
+        return _documentToGraph(document)
+    except (ValueError, UnicodeDecodeError) as error:
+        raise ValueError(f"{filePath}: {error}") from error
+
+
+def _csvToDocument(edgeText, speciesText):
+    """Returns the document (as read from JSON or TOML) of a CSV edge list and species table"""
+    speciesRows = list(csv.DictReader(speciesText.splitlines()))
+    if len(speciesRows) == 0 or CSV_SPECIES_COLUMN not in speciesRows[0]:
+        raise ValueError(f"The species file needs a '{CSV_SPECIES_COLUMN}' column and a row per species")
+
+    species = {}
+    for rowIdx, row in enumerate(speciesRows):
+        speciesID = row.pop(CSV_SPECIES_COLUMN)
+        species[speciesID] = {}
+        for fileKey, value in row.items():
+            if value is None or value == "":
+                continue
+            species[speciesID][fileKey] = _parseNumber(value, rowIdx, fileKey)
+
+    edgeRows = list(csv.DictReader(edgeText.splitlines()))
+    if len(edgeRows) > 0 and not {CSV_PREDATOR_COLUMN, CSV_PREY_COLUMN} <= set(edgeRows[0]):
+        raise ValueError(f"The edge list needs '{CSV_PREDATOR_COLUMN}' and '{CSV_PREY_COLUMN}' columns")
+    edges = [[row[CSV_PREDATOR_COLUMN], row[CSV_PREY_COLUMN]] for row in edgeRows]
+
+    return {FILE_SPECIES_KEY: species, FILE_EDGES_KEY: edges}
+
+
+def _parseNumber(value, rowIdx, fileKey):
+    # keep whole numbers as ints, as a JSON or TOML file would
+    for numberType in (int, float):
+        try:
+            return numberType(value)
+        except ValueError:
+            pass
+    raise ValueError(f"species file row {rowIdx+2}: '{fileKey}' value '{value}' is not a number")
+
+
+def _documentToGraph(document):
+    """Checks the document against the food web schema, returning it as a
+    graph dict.  Each species' prey and predators come from its own "prey" and
+    "predators" lists (in their order), then from the "edges" list of
+    [predator, prey] pairs.  CompiledFoodWeb checks the graph is consistent."""
+    if not isinstance(document, dict):
+        raise ValueError("A food web must be a table of 'species' (and optionally 'edges')")
+    for key in document:
+        if key not in (FILE_VERSION_KEY, FILE_SPECIES_KEY, FILE_EDGES_KEY):
+            raise ValueError(f"Unknown food web entry '{key}'")
+    if document.get(FILE_VERSION_KEY, FOOD_WEB_FORMAT_VERSION) != FOOD_WEB_FORMAT_VERSION:
+        raise ValueError(f"Unsupported food web format version {document[FILE_VERSION_KEY]}")
+
+    species = document.get(FILE_SPECIES_KEY)
+    if not isinstance(species, dict) or len(species) == 0:
+        raise ValueError("A food web needs a table of one or more 'species'")
+
+    requiredFileKeys = [fileKey for fileKey, key in FILE_VALUE_KEYS.items() if key in SPECIES_VALUE_KEYS]
+    foodWebGraph = {}
+    for speciesID, speciesEntry in species.items():
+        if not isinstance(speciesEntry, dict):
+            raise ValueError(f"Species {speciesID} must be a table of values")
+        speciesData = {}
+        for fileKey, value in speciesEntry.items():
+            if fileKey in FILE_VALUE_KEYS:
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                    raise ValueError(f"Species {speciesID}'s '{fileKey}' must be a number")
+                speciesData[FILE_VALUE_KEYS[fileKey]] = value
+            elif fileKey not in (FILE_PREY_KEY, FILE_PREDATORS_KEY):
+                raise ValueError(f"Species {speciesID} has unknown value '{fileKey}'")
+        for fileKey in requiredFileKeys:
+            if FILE_VALUE_KEYS[fileKey] not in speciesData:
+                raise ValueError(f"Species {speciesID} has no '{fileKey}'")
+
+        speciesData[PREDATORS] = _getSpeciesList(speciesID, speciesEntry, FILE_PREDATORS_KEY)
+        speciesData[PREY] = _getSpeciesList(speciesID, speciesEntry, FILE_PREY_KEY)
+        foodWebGraph[str(speciesID)] = speciesData
+
+    edges = document.get(FILE_EDGES_KEY, [])
+    if not isinstance(edges, list):
+        raise ValueError(f"'{FILE_EDGES_KEY}' must be a list of [predator, prey] pairs")
+    for edgeIdx, edge in enumerate(edges):
+        if (not isinstance(edge, (list, tuple)) or len(edge) != 2
+                or not all(isinstance(speciesID, str) for speciesID in edge)):
+            raise ValueError(f"Edge {edgeIdx} must be a [predator, prey] pair of species names")
+        predatorID, preyID = edge
+        for speciesID in edge:
+            if speciesID not in foodWebGraph:
+                raise ValueError(f"Edge {edgeIdx} refers to unknown species {speciesID}")
+        if preyID in foodWebGraph[predatorID][PREY]:
+            raise ValueError(f"Edge {edgeIdx} repeats {predatorID} eating {preyID}")
+        foodWebGraph[predatorID][PREY].append(preyID)
+        foodWebGraph[preyID][PREDATORS].append(predatorID)
+
+    return foodWebGraph
+
+
+def _getSpeciesList(speciesID, speciesEntry, fileKey):
+    speciesList = speciesEntry.get(fileKey, [])
+    if not isinstance(speciesList, list) or not all(isinstance(otherID, str) for otherID in speciesList):
+        raise ValueError(f"Species {speciesID}'s '{fileKey}' must be a list of species names")
+    if len(set(speciesList)) != len(speciesList):
+        raise ValueError(f"Species {speciesID}'s '{fileKey}' lists the same species more than once")
+    return list(speciesList)
@@ -0,0 +1,222 @@
+#========================================================================
+#
+# headlesssimrunner.py - class to run a population simulation for many
+#   years without a Tk event loop
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import PopSimCalculator
+
+
+# what run() does once the populations repeat
+CYCLE_STOP = "Stop"
+CYCLE_EXTRAPOLATE = "Extrapolate"
+
+# most years run in one kernel call between checks for a cycle
+CYCLE_CHECK_YEARS = 256
+
+
+class HeadlessSimRunner:
+    """Runs a calculator for many years straight into a preallocated buffer.
+
+    Needs neither tkinter nor matplotlib.  If a TimeSeriesModel is given, the
+    results are appended to it in bulk, either once at the end of the run or
+    every notifyEvery years, so its subscribers are not informed every year.
+
+    Populations are whole numbers, so a run without migration must end up at
+    a fixed point or in a cycle.  With cycleHandling set, each year's
+    populations are hashed, and once a year exactly repeats an earlier one
+    the run either stops there (CYCLE_STOP) or fills in the remaining years
+    by repeating the cycle (CYCLE_EXTRAPOLATE), which gives the same result
+    as running them.
+    """
+    def __init__(self, calculator=None, model=None):
+        if calculator is None:
+            calculator = PopSimCalculator()
+
+        self.__calculator = calculator
+        self.__model = model
+        self.__speciesIDList = calculator.getSpeciesIDList()
+        self.__progressSubscribers = []
+        self.__startYear = None
+        self.__lastNotifiedIdx = 0
+        self.__yearIdxByState = None
+        self.__lastCycle = None
+
+    def getSpeciesIDList(self):
+        return list(self.__speciesIDList)
+
+    def getLastCycle(self):
+        """Returns the cycle found by the last run, as a dict of its
+        "cycleStartIdx" (the first year index in the cycle), "period" (1 for a
+        fixed point) and "detectedIdx" (the year index that repeated the
+        cycle's start), or None if none was found"""
+        return self.__lastCycle
+
+    def subscribeToProgress(self, subscriber):
+        """registers the subscriber to get simRunProgressed(...) calls during a run"""
+        self.__progressSubscribers.append(subscriber)
+
+    def run(self, numYears, initialPopulations=None, notifyEvery=None, startYear=None, cycleHandling=None):
+        """Runs numYears years, returning an array of shape (numYears+1, species)
+        whose first row holds the initial populations (or fewer rows, if the
+        run stopped at a cycle).
+        initialPopulations defaults to the model's current values, and
+        startYear (the year of the initial populations, which picks the
+        calculator's migration draws) to the model's current year.
+        cycleHandling (CYCLE_STOP or CYCLE_EXTRAPOLATE) is ignored if the
+        calculator has migration, as its years never exactly repeat.
+        """
+        if initialPopulations is None:
+            if self.__model is None:
+                raise ValueError("Initial populations are needed when running without a model")
+            initialPopulations = self.__model.getCurrentValues()
+        if startYear is None and self.__model is not None:
+            startYear = self.__model.getCurrentYear()
+        if cycleHandling not in (None, CYCLE_STOP, CYCLE_EXTRAPOLATE):
+            raise ValueError(f"Unknown cycle handling '{cycleHandling}'")
+        self.__startYear = startYear
+        self.__lastNotifiedIdx = 0
+        self.__lastCycle = None
+
+        populations = np.empty((numYears+1, len(self.__speciesIDList)))
+        populations[0] = [initialPopulations[speciesID] for speciesID in self.__speciesIDList]
+
+        self.__yearIdxByState = None
+        if cycleHandling is not None and self.__getMigrationSeed() is None:
+            self.__yearIdxByState = {}
+
+        if hasattr(self.__calculator, "runYears"):
+            lastYearIdx = self.__runKernelYears(populations, notifyEvery)
+        elif hasattr(self.__calculator, "doSimulationArray"):
+            lastYearIdx = self.__runArrayYears(populations, notifyEvery)
+        else:
+            lastYearIdx = self.__runDictYears(populations, initialPopulations, notifyEvery)
+        self.__yearIdxByState = None
+
+        if lastYearIdx < numYears:
+            if cycleHandling == CYCLE_STOP:
+                populations = populations[:lastYearIdx+1]
+            else:
+                self.__extrapolateCycle(populations)
+                lastYearIdx = numYears
+
+        if self.__lastNotifiedIdx < lastYearIdx:
+            self.__informProgress(populations, lastYearIdx)
+
+        return populations
+
+    def __runKernelYears(self, populations, notifyEvery):
+        # run straight through in one kernel call between each notification (or check for a cycle)
+        numYears = len(populations) - 1
+        chunkYears = notifyEvery or numYears
+        if self.__yearIdxByState is not None:
+            chunkYears = min(chunkYears, CYCLE_CHECK_YEARS)
+
+        self.__checkForCycle(populations, 0, populations[0].tobytes())
+        yearIdx = 0
+        while yearIdx < numYears:
+            firstYearIdx = yearIdx
+            yearIdx = min(numYears, firstYearIdx + chunkYears)
+            self.__calculator.runYears(populations[firstYearIdx], yearIdx - firstYearIdx,
+                                       out=populations[firstYearIdx:yearIdx+1],
+                                       startYear=self.__getYear(firstYearIdx))
+
+            for checkedIdx in range(firstYearIdx+1, yearIdx+1):
+                if self.__checkForCycle(populations, checkedIdx, populations[checkedIdx].tobytes()):
+                    return checkedIdx
+
+            if notifyEvery and yearIdx - self.__lastNotifiedIdx >= notifyEvery:
+                self.__informProgress(populations, yearIdx)
+
+        return numYears
+
+    def __runArrayYears(self, populations, notifyEvery):
+        numYears = len(populations) - 1
+        self.__checkForCycle(populations, 0, populations[0].tobytes())
+        for yearIdx in range(1, numYears+1):
+            populations[yearIdx] = self.__calculator.doSimulationArray(populations[yearIdx-1],
+                                                                       self.__getYear(yearIdx))
+            if self.__checkForCycle(populations, yearIdx, populations[yearIdx].tobytes()):
+                return yearIdx
+
+            if notifyEvery and yearIdx % notifyEvery == 0:
+                self.__informProgress(populations, yearIdx)
+
+        return numYears
+
+    def __runDictYears(self, populations, initialPopulations, notifyEvery):
+        # keep the calculator's own (exact) ints between years, rather than reading back the buffer
+        numYears = len(populations) - 1
+        yearPopulations = dict(initialPopulations)
+        self.__checkForCycle(populations, 0, tuple(yearPopulations[speciesID] for speciesID in self.__speciesIDList))
+        for yearIdx in range(1, numYears+1):
+            yearPopulations = self.__calculator.doSimulation(yearPopulations, self.__getYear(yearIdx))
+            populationList = [yearPopulations[speciesID] for speciesID in self.__speciesIDList]
+            populations[yearIdx] = populationList
+            # the ints, as above 2**53 different ones can round to the same float
+            if self.__checkForCycle(populations, yearIdx, tuple(populationList)):
+                return yearIdx
+
+            if notifyEvery and yearIdx % notifyEvery == 0:
+                self.__informProgress(populations, yearIdx)
+
+        return numYears
+
+    def __checkForCycle(self, populations, yearIdx, state):
+        """Records the year's state (its populations as bytes or a tuple),
+        returning True if it repeats an earlier year's"""
+        if self.__yearIdxByState is None:
+            return False
+
+        # only the hash is kept, so check a match really is the same populations
+        stateHash = hash(state)
+        earlierYearIdx = self.__yearIdxByState.get(stateHash)
+        if earlierYearIdx is None or not np.array_equal(populations[earlierYearIdx], populations[yearIdx]):
+            self.__yearIdxByState[stateHash] = yearIdx
+            return False
+
+        self.__lastCycle = {
+            "cycleStartIdx": earlierYearIdx,
+            "period": yearIdx - earlierYearIdx,
+            "detectedIdx": yearIdx
+        }
+        return True
+
+    def __extrapolateCycle(self, populations):
+        """Fills in the years after the cycle was found by repeating it"""
+        cycleStartIdx = self.__lastCycle["cycleStartIdx"]
+        remainingYearIdx = np.arange(self.__lastCycle["detectedIdx"]+1, len(populations))
+        populations[remainingYearIdx] = populations[cycleStartIdx + (remainingYearIdx - cycleStartIdx)
+                                                    % self.__lastCycle["period"]]
+
+    def __getMigrationSeed(self):
+        if hasattr(self.__calculator, "getMigrationSeed"):
+            return self.__calculator.getMigrationSeed()
+        return None
+
+    def __getYear(self, yearIdx):
+        if self.__startYear is None:
+            return None
+        return self.__startYear + yearIdx
+
+    def __informProgress(self, populations, yearIdx):
+        newPopulations = populations[self.__lastNotifiedIdx+1:yearIdx+1]
+        self.__lastNotifiedIdx = yearIdx
+
+        if self.__model is not None:
+            self.__model.extendSeries({speciesID: newPopulations[:, idx]
+                                       for idx, speciesID in enumerate(self.__speciesIDList)})
+
+        progressData = {
+            "yearsRun": yearIdx,
+            "speciesIDList": self.getSpeciesIDList(),
+            "populations": populations[:yearIdx+1]
+        }
+        for subscriber in self.__progressSubscribers:
+            subscriber.simRunProgressed(progressData)
@@ -0,0 +1,273 @@
+#========================================================================
+#
+# memmaptimeseriesstorage.py - class to hold the values of a collection of
+#   time series in a memory-mapped file
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import json
+import os
+import struct
+
+import numpy as np
+
+FILE_MAGIC = b"POPSIMTS"
+FILE_FORMAT_VERSION = 1
+
+# magic, format version, header size (the offset of the first row) and number of rows
+HEADER_PREFIX_FORMAT = "<8sIIQ"
+HEADER_PREFIX_SIZE = struct.calcsize(HEADER_PREFIX_FORMAT)
+NUM_ROWS_OFFSET = HEADER_PREFIX_SIZE - 8
+
+# headers are padded to a multiple of this, leaving room for them to change in place
+HEADER_ALIGNMENT = 4096
+
+
+class MemmapTimeSeriesStorage:
+    """Holds all time series as the columns of fixed-width rows (one per year)
+    in a binary file, accessed through numpy.memmap.
+
+    A drop-in replacement for ArrayTimeSeriesStorage (without the ring buffer
+    option), for runs too long to keep in memory or that must outlive the
+    process.  Rows are only paged in as they are read, so any range of years
+    can be read without loading the whole file.
+
+    The file starts with a header: a fixed prefix (magic, format version,
+    header size, number of rows) then JSON holding the start year, column
+    (species) IDs and value dtype, padded to HEADER_ALIGNMENT bytes.  The rows
+    follow it.  The file grows in chunks of rows, and is trimmed to the rows
+    used when closed.
+
+    mode "w+" creates (or overwrites) the file, "r+" reopens an existing file
+    to carry on appending to it and "r" opens one read-only.
+    """
+    def __init__(self, filePath, mode="w+", growRows=4096, dtype=np.float64):
+        if mode not in ("w+", "r+", "r"):
+            raise ValueError(f"Unknown storage file mode '{mode}'")
+
+        self.__filePath = filePath
+        self.__mode = mode
+        self.__growRows = max(1, growRows)
+        self.__data = None
+        self.__numRowsField = None
+
+        if mode == "w+":
+            self.__dtype = np.dtype(dtype)
+            self.__startYear = 0
+            self.__columnIDs = []
+            self.__writeFile(np.zeros((1, 0), dtype=self.__dtype))
+        else:
+            self.__readHeader()
+            self.__mapFile()
+
+    def clear(self, numColumns=0):
+        """Removes all rows, leaving a single row of zeros in numColumns columns"""
+        self.__columnIDs = (self.__columnIDs + [None]*numColumns)[:numColumns]
+        self.__writeFile(np.zeros((1, numColumns), dtype=self.__dtype))
+
+    def isRingBuffer(self):
+        return False
+
+    def getFilePath(self):
+        return self.__filePath
+
+    def getNumColumns(self):
+        return len(self.__columnIDs)
+
+    def getNumRows(self):
+        return self.__numRows
+
+    def getFirstRow(self):
+        return 0
+
+    def getStartYear(self):
+        """Returns the year of row 0, as recorded in the file's header"""
+        return self.__startYear
+
+    def setStartYear(self, startYear):
+        self.__startYear = startYear
+        self.__updateHeader()
+
+    def getColumnIDs(self):
+        return list(self.__columnIDs)
+
+    def addColumn(self, columnID=None):
+        """Adds a column of zeros, returning its index.
+        As rows are fixed-width, this rewrites the whole file."""
+        rows = np.zeros((self.__numRows, self.getNumColumns()+1), dtype=self.__dtype)
+        rows[:, :-1] = self.__data[:self.__numRows]
+        self.__columnIDs.append(columnID)
+        self.__writeFile(rows)
+        return self.getNumColumns() - 1
+
+    def appendRows(self, numRows, values=None):
+        """Appends numRows rows.  values is an array of shape (numRows, columns);
+        if it is None, the new rows repeat the most recent row.
+        """
+        if numRows <= 0:
+            return
+
+        if values is None:
+            values = np.broadcast_to(np.array(self.getLastRow()), (numRows, self.getNumColumns()))
+        else:
+            values = np.asarray(values, dtype=self.__dtype).reshape(numRows, self.getNumColumns())
+
+        self.__ensureCapacity(self.__numRows + numRows)
+        self.__data[self.__numRows:self.__numRows+numRows] = values
+        self.__setNumRows(self.__numRows + numRows)
+
+    def truncateRows(self, numRows):
+        """Drops all rows from row numRows onwards (always keeping row 0)"""
+        self.__setNumRows(max(1, min(numRows, self.__numRows)))
+
+    def getValue(self, row, column):
+        """Returns the value at the row, or None if there is no such row"""
+        if 0 <= row < self.__numRows:
+            return self.__data[row, column]
+        return None
+
+    def setValue(self, row, column, value):
+        if 0 <= row < self.__numRows:
+            self.__data[row, column] = value
+
+    def getColumn(self, column):
+        """Returns a read-only view of all the rows of a column"""
+        return self.__readOnly(self.__data[:self.__numRows, column])
+
+    def getRows(self, firstRow=None, endRow=None):
+        """Returns a read-only view of the rows from firstRow up to (not
+        including) endRow.  By default all rows are returned."""
+        if firstRow is None:
+            firstRow = 0
+        if endRow is None:
+            endRow = self.__numRows
+        firstRow = max(firstRow, 0)
+        endRow = max(firstRow, min(endRow, self.__numRows))
+        return self.__readOnly(self.__data[firstRow:endRow])
+
+    def getLastRow(self):
+        return self.__readOnly(self.__data[self.__numRows-1])
+
+    def setLastRow(self, values):
+        self.__data[self.__numRows-1] = values
+
+    def flush(self):
+        """Writes any changes still only held in memory out to the file"""
+        if isinstance(self.__data, np.memmap):
+            self.__data.flush()
+        if self.__numRowsField is not None:
+            self.__numRowsField.flush()
+
+    def close(self):
+        """Flushes the file and trims it to the rows actually used"""
+        self.flush()
+        self.__data = None
+        self.__numRowsField = None
+        if self.__mode != "r":
+            with open(self.__filePath, "r+b") as storageFile:
+                storageFile.truncate(self.__headerSize + self.__numRows * self.__getRowBytes())
+
+    def __getRowBytes(self):
+        return self.getNumColumns() * self.__dtype.itemsize
+
+    def __makeHeader(self):
+        """Returns the header bytes for the current metadata (with numRows as 0)"""
+        metadata = json.dumps({"startYear": self.__startYear,
+                               "columnIDs": self.__columnIDs,
+                               "dtype": self.__dtype.str}).encode("utf-8")
+        headerSize = -(-(HEADER_PREFIX_SIZE + len(metadata)) // HEADER_ALIGNMENT) * HEADER_ALIGNMENT
+        prefix = struct.pack(HEADER_PREFIX_FORMAT, FILE_MAGIC, FILE_FORMAT_VERSION, headerSize, 0)
+        # pad with spaces, which the JSON reader ignores
+        return (prefix + metadata).ljust(headerSize, b" ")
+
+    def __updateHeader(self):
+        """Rewrites the header in place if it still fits, otherwise the whole file"""
+        header = self.__makeHeader()
+        if len(header) != self.__headerSize:
+            self.__writeFile(np.array(self.__data[:self.__numRows]))
+            return
+
+        self.flush()
+        with open(self.__filePath, "r+b") as storageFile:
+            # leave the number of rows as it is
+            storageFile.write(header[:NUM_ROWS_OFFSET])
+            storageFile.seek(HEADER_PREFIX_SIZE)
+            storageFile.write(header[HEADER_PREFIX_SIZE:])
+
+    def __readHeader(self):
+        with open(self.__filePath, "rb") as storageFile:
+            prefix = storageFile.read(HEADER_PREFIX_SIZE)
+            if len(prefix) < HEADER_PREFIX_SIZE:
+                raise ValueError(f"{self.__filePath} is not a time series storage file")
+            magic, formatVersion, headerSize, numRows = struct.unpack(HEADER_PREFIX_FORMAT, prefix)
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{self.__filePath} is not a time series storage file")
+            if formatVersion != FILE_FORMAT_VERSION:
+                raise ValueError(f"{self.__filePath} has unsupported format version {formatVersion}")
+            metadata = json.loads(storageFile.read(headerSize - HEADER_PREFIX_SIZE).decode("utf-8"))
+
+        self.__headerSize = headerSize
+        self.__numRows = numRows
+        self.__startYear = metadata["startYear"]
+        self.__columnIDs = metadata["columnIDs"]
+        self.__dtype = np.dtype(metadata["dtype"])
+
+    def __writeFile(self, rows):
+        """Writes a new header followed by rows, replacing the whole file"""
+        self.__data = None
+        self.__numRowsField = None
+
+        header = self.__makeHeader()
+        self.__headerSize = len(header)
+        self.__numRows = len(rows)
+        with open(self.__filePath, "wb") as storageFile:
+            storageFile.write(header)
+            storageFile.write(np.ascontiguousarray(rows, dtype=self.__dtype).tobytes())
+
+        self.__mapFile()
+        self.__setNumRows(len(rows))
+
+    def __mapFile(self, capacity=None):
+        """Maps the rows (and the number of rows in the header), extending the
+        file to hold capacity rows"""
+        if capacity is None:
+            capacity = max(self.__numRows, 1)
+        rowBytes = self.__getRowBytes()
+        if self.__mode != "r":
+            fileSize = self.__headerSize + capacity * rowBytes
+            if os.path.getsize(self.__filePath) < fileSize:
+                with open(self.__filePath, "r+b") as storageFile:
+                    storageFile.truncate(fileSize)
+        else:
+            capacity = self.__numRows
+
+        mapMode = "r" if self.__mode == "r" else "r+"
+        if rowBytes == 0:
+            # nothing to map when there are no columns
+            self.__data = np.zeros((capacity, 0), dtype=self.__dtype)
+        else:
+            self.__data = np.memmap(self.__filePath, dtype=self.__dtype, mode=mapMode,
+                                    offset=self.__headerSize, shape=(capacity, self.getNumColumns()))
+        self.__numRowsField = np.memmap(self.__filePath, dtype="<u8", mode=mapMode,
+                                        offset=NUM_ROWS_OFFSET, shape=(1,))
+
+    def __setNumRows(self, numRows):
+        self.__numRows = numRows
+        self.__numRowsField[0] = numRows
+
+    def __ensureCapacity(self, numRowsNeeded):
+        capacity = len(self.__data)
+        if numRowsNeeded > capacity:
+            capacity = max(numRowsNeeded, 2*capacity, capacity + self.__growRows)
+            self.flush()
+            # views handed out earlier keep the old mapping alive until they are dropped
+            self.__mapFile(capacity)
+
+    @staticmethod
+    def __readOnly(array):
+        view = array.view(np.ndarray)
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,110 @@
+#========================================================================
+#
+# migrationmodel.py - class to add seeded, random migration to each
+#   year's populations
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import *
+
+# biomass (kg) of the group of individuals that recolonises an extinct species
+MIN_FOUNDER_BIOMASS = 1
+MAX_FOUNDER_BIOMASS = 5
+
+# numpy's binomial needs an int64 count; bigger populations lose their expected share
+MAX_BINOMIAL_POPULATION = 2**62
+
+
+class MigrationModel:
+    """Draws the random immigration, emigration and recolonisation of every
+    species, from the food web's per-species IMMIGRATION_RATE, EMIGRATION_RATE
+    and RECOLONISATION_RATE.
+
+    Each year's draws come from a Philox generator keyed by the seed and
+    counting from the year, so they depend only on (seed, year) and the shape
+    of the populations: any year can be recalculated (e.g. when replaying
+    from a checkpoint) and get exactly the same migration.  Only species with
+    a non-zero rate get draws for it.
+
+    Populations may be a single (species,) array or a (members, species)
+    array of ensemble members, each of which gets its own draws.  A fixed
+    number of values is drawn per species per year, whatever the
+    populations, so the draws for a year never depend on the state.
+    """
+    def __init__(self, foodWebGraph, seed=None):
+        """foodWebGraph is a CompiledFoodWeb.  seed defaults to a fresh random one."""
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+
+        self.__seed = seed
+        self.__key = np.random.SeedSequence(seed).generate_state(2, np.uint64)
+        self.__lastYear = 0
+
+        # only species with a rate get draws for it
+        individualBiomass = foodWebGraph.getSpeciesArray(INDIVIDUAL_BIOMASS)
+        immigrationRate = foodWebGraph.getSpeciesArray(IMMIGRATION_RATE)
+        emigrationRate = foodWebGraph.getSpeciesArray(EMIGRATION_RATE)
+        recolonisationRate = foodWebGraph.getSpeciesArray(RECOLONISATION_RATE)
+        self.__immigrantSpecies = np.flatnonzero(immigrationRate)
+        self.__immigrationRate = immigrationRate[self.__immigrantSpecies]
+        self.__emigrantSpecies = np.flatnonzero(emigrationRate)
+        self.__emigrationRate = emigrationRate[self.__emigrantSpecies]
+        self.__recolonisedSpecies = np.flatnonzero(recolonisationRate)
+        self.__recolonisationRate = recolonisationRate[self.__recolonisedSpecies]
+        self.__founderIndividualBiomass = individualBiomass[self.__recolonisedSpecies]
+
+    @staticmethod
+    def hasMigration(foodWebGraph):
+        """Returns whether any species in the CompiledFoodWeb has a migration rate"""
+        return any(foodWebGraph.getSpeciesArray(key).any()
+                   for key in (IMMIGRATION_RATE, EMIGRATION_RATE, RECOLONISATION_RATE))
+
+    def getSeed(self):
+        return self.__seed
+
+    def getGenerator(self, year):
+        """Returns the generator for year's draws, always starting from the same point"""
+        return np.random.Generator(np.random.Philox(key=self.__key, counter=[0, 0, 0, year % 2**64]))
+
+    def drawMigration(self, populations, year=None):
+        """Returns the net change to populations (whole numbers, as float64)
+        from year's migration.  year defaults to the year after the last one
+        drawn for."""
+        if year is None:
+            year = self.__lastYear + 1
+        self.__lastYear = year
+
+        populations = np.asarray(populations, dtype=np.float64)
+        rng = self.getGenerator(year)
+        migration = np.zeros(populations.shape)
+
+        immigrantShape = populations.shape[:-1] + self.__immigrationRate.shape
+        migration[..., self.__immigrantSpecies] += rng.poisson(self.__immigrationRate, immigrantShape)
+
+        # each individual leaves with the emigration rate's chance
+        emigrantPopulations = populations[..., self.__emigrantSpecies]
+        binomialPopulations = np.minimum(np.nan_to_num(emigrantPopulations, posinf=0.0), MAX_BINOMIAL_POPULATION)
+        emigrants = rng.binomial(binomialPopulations.astype(np.int64), self.__emigrationRate)
+        emigrants = np.where(emigrantPopulations > MAX_BINOMIAL_POPULATION,
+                             np.nan_to_num(np.trunc(emigrantPopulations * self.__emigrationRate), posinf=0.0),
+                             emigrants)
+        migration[..., self.__emigrantSpecies] -= emigrants
+
+        # an extinct species may be recolonised by a small founding group
+        recolonisedShape = populations.shape[:-1] + self.__recolonisationRate.shape
+        recolonised = ((populations[..., self.__recolonisedSpecies] == 0)
+                       & (rng.random(recolonisedShape) < self.__recolonisationRate))
+        founderBiomass = rng.uniform(MIN_FOUNDER_BIOMASS, MAX_FOUNDER_BIOMASS, recolonisedShape)
+        founders = np.maximum(1.0, np.trunc(founderBiomass / self.__founderIndividualBiomass))
+        migration[..., self.__recolonisedSpecies] += np.where(recolonised, founders, 0.0)
+
+        return migration
+
+    def applyMigration(self, populations, year=None):
+        """Returns populations with year's migration added"""
+        return np.asarray(populations, dtype=np.float64) + self.drawMigration(populations, year)
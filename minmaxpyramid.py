@@ -0,0 +1,141 @@
+#========================================================================
+#
+# minmaxpyramid.py - class to hold a series with min/max summaries for
+#   fast level-of-detail plotting
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+
+class MinMaxPyramid:
+    """Holds a growing series of values along with the min and max of each
+    block of 2, 4, 8, ... values.
+
+    The summaries are kept up to date incrementally as values are appended
+    (or the most recent values replaced), so a decimated copy of any length
+    can be produced without rescanning the whole history.  Decimating by
+    min/max keeps extinctions and population spikes visible.
+    """
+    def __init__(self, initialCapacity=64):
+        self.__numValues = 0
+        self.__capacity = 0
+        # level 0 is the values themselves, level k summarises blocks of 2**k values
+        self.__mins = []
+        self.__maxs = []
+        self.__resize(max(2, initialCapacity))
+
+    def __len__(self):
+        return self.__numValues
+
+    def clear(self):
+        self.__numValues = 0
+
+    def getValues(self):
+        return self.__mins[0][:self.__numValues]
+
+    def getMax(self):
+        if self.__numValues == 0:
+            return 0
+        topLevel = len(self.__maxs) - 1
+        return self.__maxs[topLevel][:self.__getLevelLength(topLevel)].max()
+
+    def getMin(self):
+        if self.__numValues == 0:
+            return 0
+        topLevel = len(self.__mins) - 1
+        return self.__mins[topLevel][:self.__getLevelLength(topLevel)].min()
+
+    def append(self, newValues):
+        newValues = np.asarray(newValues, dtype=np.float64).ravel()
+        numValuesNeeded = self.__numValues + len(newValues)
+        if numValuesNeeded > self.__capacity:
+            self.__resize(max(numValuesNeeded, 2*self.__capacity))
+
+        firstNewIdx = self.__numValues
+        self.__mins[0][firstNewIdx:numValuesNeeded] = newValues
+        self.__numValues = numValuesNeeded
+        self.__updateSummaries(firstNewIdx)
+
+    def truncate(self, numValues):
+        """Drops all values from index numValues onwards"""
+        if numValues < self.__numValues:
+            self.__numValues = max(0, numValues)
+            self.__updateSummaries(self.__numValues)
+
+    def dropFirst(self, numValues):
+        """Drops the values before index numValues (rebuilding the summaries
+        of those left, so this is best done in large batches)"""
+        if numValues <= 0:
+            return
+        remainingValues = self.getValues()[numValues:].copy()
+        self.__numValues = 0
+        self.append(remainingValues)
+
+    def setValues(self, fromIdx, newValues):
+        """Replaces everything from fromIdx onwards with newValues"""
+        self.truncate(fromIdx)
+        self.append(newValues)
+
+    def getDecimated(self, maxPoints):
+        """Returns (indices, values) with at most maxPoints points (but never
+        fewer than two), alternating each block's min and max"""
+        if self.__numValues <= maxPoints:
+            return np.arange(self.__numValues), self.getValues()
+
+        # find the finest level that fits, at two points (min and max) per block
+        level = 1
+        while level < len(self.__mins)-1 and 2*self.__getLevelLength(level) > maxPoints:
+            level += 1
+
+        numBlocks = self.__getLevelLength(level)
+        blockSize = 1 << level
+        blockStarts = np.arange(numBlocks) * blockSize
+
+        indices = np.empty(2*numBlocks)
+        indices[0::2] = blockStarts
+        indices[1::2] = blockStarts + blockSize/2
+        values = np.empty(2*numBlocks)
+        values[0::2] = self.__mins[level][:numBlocks]
+        values[1::2] = self.__maxs[level][:numBlocks]
+        return indices, values
+
+    def __getLevelLength(self, level):
+        return -(-self.__numValues >> level)
+
+    def __updateSummaries(self, firstChangedIdx):
+        """Recomputes the summary blocks covering values from firstChangedIdx onwards"""
+        for level in range(1, len(self.__mins)):
+            firstChangedIdx //= 2
+            levelLength = self.__getLevelLength(level)
+            if firstChangedIdx >= levelLength:
+                continue
+
+            # combine pairs of blocks from the level below (an odd last block pairs with itself)
+            belowLength = self.__getLevelLength(level-1)
+            for summaries, combine in ((self.__mins, np.minimum), (self.__maxs, np.maximum)):
+                below = summaries[level-1]
+                evenBlocks = below[2*firstChangedIdx:belowLength:2]
+                oddBlocks = below[2*firstChangedIdx+1:belowLength:2]
+                if len(oddBlocks) < len(evenBlocks):
+                    oddBlocks = np.append(oddBlocks, evenBlocks[-1])
+                summaries[level][firstChangedIdx:levelLength] = combine(evenBlocks, oddBlocks)
+
+    def __resize(self, capacity):
+        values = np.zeros(capacity)
+        if self.__numValues > 0:
+            values[:self.__numValues] = self.getValues()
+
+        self.__capacity = capacity
+        self.__mins = [values]
+        self.__maxs = [values]
+        levelCapacity = capacity
+        while levelCapacity > 1:
+            levelCapacity = -(-levelCapacity // 2)
+            self.__mins.append(np.zeros(levelCapacity))
+            self.__maxs.append(np.zeros(levelCapacity))
+
+        self.__updateSummaries(0)
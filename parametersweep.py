@@ -0,0 +1,202 @@
+#========================================================================
+#
+# parametersweep.py - class to run a grid of food web parameter variants
+#   across all CPU cores
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import copy
+import hashlib
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import path
+
+import numpy as np
+
+from popsimcalculator import *
+from headlesssimrunner import CYCLE_EXTRAPOLATE, HeadlessSimRunner
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+# parameters applied to the calculator rather than to each species in the food web
+CALCULATOR_PARAMETERS = {"MIN_PREDATION_FACTOR": "minPredationFactor",
+                         "MAX_PREDATION_FACTOR": "maxPredationFactor",
+                         "MIGRATION_SEED": "migrationSeed"}
+
+# every point draws the same migration unless the grid varies MIGRATION_SEED
+DEFAULT_MIGRATION_SEED = 0
+
+# key of the line at the start of a results file identifying the sweep
+SWEEP_HEADER_KEY = "sweep"
+
+# share of the run (at the end) over which oscillation amplitude is measured
+OSCILLATION_WINDOW_FRACTION = 0.5
+
+
+class ParameterSweep:
+    """Runs every point of a parameter grid as an isolated simulation on a
+    ProcessPoolExecutor.
+
+    parameterGrid maps a food web key (e.g. GROWTH_RATE_FACTOR) or one of the
+    CALCULATOR_PARAMETERS names to a list of values.  A food web value is
+    either a number, applied to every species, or a {speciesID: value} dict.
+    Each point gets its own copy of the food web, so runs never touch the
+    module's globals.
+
+    Results are appended to a JSON-lines file as each point completes, and a
+    sweep restarted on the same file skips the points already there.  The
+    file starts with a header identifying the sweep (food web, number of
+    years and initial populations), and a sweep will not resume from a file
+    written by a different one.
+    """
+    def __init__(self, parameterGrid, initialPopulations, numYears, foodWebGraph=None):
+        if foodWebGraph is None:
+            foodWebGraph = FOOD_WEB_GRAPH
+
+        self.__parameterGrid = parameterGrid
+        self.__initialPopulations = dict(initialPopulations)
+        self.__numYears = numYears
+        self.__foodWebGraph = foodWebGraph
+
+    def getPoints(self):
+        """Returns every combination of the grid's parameter values"""
+        keys = list(self.__parameterGrid.keys())
+        return [dict(zip(keys, values))
+                for values in itertools.product(*[self.__parameterGrid[key] for key in keys])]
+
+    def getHeader(self):
+        """Returns what a results file must have been written for to be resumed"""
+        foodWebJSON = json.dumps(self.__foodWebGraph, sort_keys=True)
+        return {"foodWebHash": hashlib.sha256(foodWebJSON.encode("utf-8")).hexdigest(),
+                "numYears": self.__numYears,
+                "initialPopulations": self.__initialPopulations}
+
+    def run(self, resultsPath, maxWorkers=None, pointsPerTask=1):
+        """Runs all points not already in resultsPath, returning all the results.
+        pointsPerTask groups several points into each task to cut down on
+        inter-process overhead when individual runs are short.
+        """
+        header = self.getHeader()
+        fileHeader, results, completeLength = _readResultsFile(resultsPath)
+        if completeLength > 0 and getPointKey(fileHeader) != getPointKey(header):
+            raise ValueError(f"{resultsPath}: holds the results of a different sweep "
+                             f"(food web, number of years or initial populations)")
+
+        # cut off any partly-written last line, so that new results start on a line of their own
+        if path.exists(resultsPath):
+            with open(resultsPath, "r+b") as resultsFile:
+                resultsFile.truncate(completeLength)
+        if completeLength == 0:
+            with open(resultsPath, "w") as resultsFile:
+                resultsFile.write(json.dumps({SWEEP_HEADER_KEY: header}) + "\n")
+
+        completedKeys = {getPointKey(result["point"]) for result in results}
+        pendingPoints = [point for point in self.getPoints() if getPointKey(point) not in completedKeys]
+        tasks = [pendingPoints[idx:idx+pointsPerTask] for idx in range(0, len(pendingPoints), pointsPerTask)]
+
+        with open(resultsPath, "a") as resultsFile:
+            with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+                futures = [executor.submit(runSweepPoints, self.__foodWebGraph, points,
+                                           self.__initialPopulations, self.__numYears)
+                           for points in tasks]
+                for future in as_completed(futures):
+                    for result in future.result():
+                        resultsFile.write(json.dumps(result) + "\n")
+                        results.append(result)
+                    # flush each batch so an interrupted sweep can be resumed
+                    resultsFile.flush()
+
+        return results
+
+
+def getPointKey(point):
+    return json.dumps(point, sort_keys=True)
+
+
+def loadSweepResults(resultsPath):
+    """Reads the results written so far, ignoring any partly-written last line"""
+    return _readResultsFile(resultsPath)[1]
+
+
+def _readResultsFile(resultsPath):
+    """Returns the file's sweep header (None if it has none), its results and
+    the length in bytes of its complete lines"""
+    header = None
+    results = []
+    completeLength = 0
+    if path.exists(resultsPath):
+        with open(resultsPath, "rb") as resultsFile:
+            for line in resultsFile:
+                if not line.endswith(b"\n"):
+                    # a partly-written last line
+                    break
+                completeLength += len(line)
+                try:
+                    lineData = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if SWEEP_HEADER_KEY in lineData:
+                    header = lineData[SWEEP_HEADER_KEY]
+                else:
+                    results.append(lineData)
+    return header, results, completeLength
+
+
+def makeFoodWebVariant(foodWebGraph, point):
+    """Returns a copy of the food web with the point's parameters applied, plus
+    the keyword arguments for the calculator"""
+    foodWebVariant = copy.deepcopy(foodWebGraph)
+    calculatorArgs = {"migrationSeed": DEFAULT_MIGRATION_SEED}
+    for key, value in point.items():
+        if key in CALCULATOR_PARAMETERS:
+            calculatorArgs[CALCULATOR_PARAMETERS[key]] = value
+        elif isinstance(value, dict):
+            for speciesID, speciesValue in value.items():
+                foodWebVariant[speciesID][key] = speciesValue
+        else:
+            for speciesData in foodWebVariant.values():
+                speciesData[key] = value
+    return foodWebVariant, calculatorArgs
+
+
+def runSweepPoints(foodWebGraph, points, initialPopulations, numYears):
+    """Runs each point in turn (in a worker process), returning their summaries.
+    A run that settles into a fixed point or cycle is extrapolated from there
+    rather than run to the end."""
+    results = []
+    for point in points:
+        foodWebVariant, calculatorArgs = makeFoodWebVariant(foodWebGraph, point)
+        calculator = VectorPopSimCalculator(foodWebVariant, **calculatorArgs)
+        runner = HeadlessSimRunner(calculator)
+        populations = runner.run(numYears, initialPopulations, cycleHandling=CYCLE_EXTRAPOLATE)
+        results.append({"point": point,
+                        "summary": summarisePopulations(calculator.getSpeciesIDList(), populations),
+                        "cycle": runner.getLastCycle()})
+    return results
+
+
+def summarisePopulations(speciesIDList, populations):
+    """Summarises an array of shape (years, species) as final populations,
+    the year index each species died out for good (None if it survived) and
+    the oscillation amplitude over the end of the run"""
+    numYears = len(populations)
+    windowStart = int(numYears * (1 - OSCILLATION_WINDOW_FRACTION))
+    window = populations[windowStart:]
+    amplitudes = (window.max(axis=0) - window.min(axis=0)) / 2
+
+    # last year each species was alive
+    alive = populations > 0
+    lastAliveIdx = numYears - 1 - np.argmax(alive[::-1], axis=0)
+
+    summary = {"finalPopulations": {}, "extinctionYear": {}, "oscillationAmplitude": {}}
+    for idx, speciesID in enumerate(speciesIDList):
+        summary["finalPopulations"][speciesID] = float(populations[-1, idx])
+        extinctionYear = None
+        if not alive[-1, idx]:
+            extinctionYear = int(lastAliveIdx[idx]) + 1 if alive[:, idx].any() else 0
+        summary["extinctionYear"][speciesID] = extinctionYear
+        summary["oscillationAmplitude"][speciesID] = float(amplitudes[idx])
+    return summary
@@ -0,0 +1,317 @@
+#========================================================================
+#
+# patchgridsimulator.py - class to simulate many habitat patches, linked
+#   by dispersal, optionally split across worker processes
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import multiprocessing
+import os
+import random
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from popsimcalculator import *
+from compiledfoodweb import CompiledFoodWeb
+from migrationmodel import MigrationModel
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+# commands to the worker processes, in the shared control array with the year
+STEP_COMMAND = 0
+STOP_COMMAND = 1
+
+# seconds to wait at each step for the other processes before giving up on a run
+WORKER_TIMEOUT = 60
+
+# shares of a patch's dispersers that go down and up river in makeRiverNetwork
+DOWNSTREAM_SHARE = 0.6
+UPSTREAM_SHARE = 0.3
+
+
+def makeRiverNetwork(numPatches, rng=None, downstreamShare=DOWNSTREAM_SHARE, upstreamShare=UPSTREAM_SHARE):
+    """Returns the connectivity (sources, destinations, weights) of a random
+    river network of numPatches patches, patch 0 being the river mouth.
+
+    Each patch flows into one earlier patch, so the network is a tree.  Of
+    a patch's dispersers, downstreamShare go down river and upstreamShare
+    are split between the patches flowing into it; the rest are lost (e.g.
+    out to sea from the mouth).  rng is a random.Random (or a seed).
+    """
+    if not isinstance(rng, random.Random):
+        rng = random.Random(rng)
+
+    downstreamPatches = [None] + [rng.randrange(patchIdx) for patchIdx in range(1, numPatches)]
+    upstreamPatchLists = [[] for patchIdx in range(numPatches)]
+    for patchIdx, downstreamPatchIdx in enumerate(downstreamPatches):
+        if downstreamPatchIdx is not None:
+            upstreamPatchLists[downstreamPatchIdx].append(patchIdx)
+
+    sources, destinations, weights = [], [], []
+    for patchIdx in range(numPatches):
+        if downstreamPatches[patchIdx] is not None:
+            sources.append(patchIdx)
+            destinations.append(downstreamPatches[patchIdx])
+            weights.append(downstreamShare)
+        for upstreamPatchIdx in upstreamPatchLists[patchIdx]:
+            sources.append(patchIdx)
+            destinations.append(upstreamPatchIdx)
+            weights.append(upstreamShare / len(upstreamPatchLists[patchIdx]))
+
+    return np.array(sources, dtype=np.intp), np.array(destinations, dtype=np.intp), np.array(weights)
+
+
+class PatchGridSimulator:
+    """Simulates the food web in many habitat patches at once.
+
+    Populations are held as a (patches, species) array.  Each year, the
+    food web step (VectorPopSimCalculator) is applied to every patch at once
+    and any migration is drawn (as if each patch were a scenario).  Then each
+    species' DISPERSAL_RATE share of each patch's population leaves, and
+    arrives in other patches as a sparse matrix product with the
+    connectivity.  connectivity[i, j] is the share of patch i's dispersers
+    that reach patch j.  Rows may sum to less than 1, the rest being lost,
+    and arrivals are truncated to whole individuals.
+
+    connectivity may be a (sources, destinations, weights) tuple (as from
+    makeRiverNetwork), a dense (patches, patches) array or a scipy.sparse
+    matrix.  It is held in CSR form, by destination patch.
+
+    With numWorkers > 1, run() splits the patches into blocks across worker
+    processes.  The populations live in shared memory, and the workers step
+    in lock-step with the main process through a barrier.  Migration is
+    always drawn in the main process, over every patch at once, so results
+    are the same for any number of workers.
+    """
+    def __init__(self, connectivity, numPatches=None, foodWebGraph=None,
+                 minPredationFactor=MIN_PREDATION_FACTOR, maxPredationFactor=MAX_PREDATION_FACTOR,
+                 migrationSeed=None):
+        if foodWebGraph is None:
+            foodWebGraph = FOOD_WEB_GRAPH
+        if not isinstance(foodWebGraph, CompiledFoodWeb):
+            foodWebGraph = CompiledFoodWeb(foodWebGraph)
+
+        self.__foodWeb = foodWebGraph
+        self.__calculatorArgs = {"minPredationFactor": minPredationFactor,
+                                 "maxPredationFactor": maxPredationFactor,
+                                 "includeMigration": False}
+        self.__calculator = VectorPopSimCalculator(foodWebGraph, **self.__calculatorArgs)
+        self.__dispersalRate = foodWebGraph.getSpeciesArray(DISPERSAL_RATE)
+
+        self.__migrationModel = None
+        if MigrationModel.hasMigration(foodWebGraph):
+            self.__migrationModel = MigrationModel(foodWebGraph, migrationSeed)
+
+        self.__numPatches, self.__incomingCSR = self.__makeIncomingCSR(connectivity, numPatches)
+        self.__populations = np.zeros((self.__numPatches, foodWebGraph.getNumSpecies()))
+        self.__year = 0
+
+    def getSpeciesIDList(self):
+        return self.__foodWeb.getSpeciesIDList()
+
+    def getNumPatches(self):
+        return self.__numPatches
+
+    def getYear(self):
+        return self.__year
+
+    def getPopulations(self):
+        """Returns a copy of the (patches, species) populations"""
+        return self.__populations.copy()
+
+    def setPopulations(self, populations, year=None):
+        """Sets every patch's populations, from a (patches, species) array, or
+        a {speciesID: population} dict applied to every patch"""
+        if isinstance(populations, dict):
+            populations = self.__calculator.populationsToArray(populations)
+        self.__populations[:] = populations
+        if year is not None:
+            self.__year = year
+
+    def getTotalPopulations(self):
+        """Returns the {speciesID: population} totals across all patches"""
+        return self.__calculator.arrayToPopulations(self.__populations.sum(axis=0))
+
+    def step(self):
+        """Advances every patch by one year (in this process)"""
+        self.__year += 1
+        localPopulations = self.__calculator.doSimulationArray(self.__populations, self.__year)
+        dispersers = self.__drawMigrationAndDispersers(localPopulations)
+        self.__populations[:] = _disperse(localPopulations, dispersers, 0, self.__numPatches, *self.__incomingCSR)
+
+    def run(self, numYears, numWorkers=1, keepHistory=True, workerTimeout=WORKER_TIMEOUT):
+        """Runs numYears years.  Returns a (numYears+1, patches, species) array
+        of every year, starting with the current one, or (if keepHistory is
+        False) just the final (patches, species) populations.
+        numWorkers None uses every CPU.  If a worker fails, or any process
+        waits more than workerTimeout seconds for the others, the workers are
+        stopped and RuntimeError is raised, leaving the populations as they
+        were before the run."""
+        if numWorkers is None:
+            numWorkers = os.cpu_count()
+        numWorkers = max(1, min(numWorkers, self.__numPatches))
+
+        history = None
+        if keepHistory:
+            history = np.empty((numYears+1,) + self.__populations.shape)
+            history[0] = self.__populations
+
+        if numWorkers == 1:
+            for yearIdx in range(numYears):
+                self.step()
+                if keepHistory:
+                    history[yearIdx+1] = self.__populations
+        else:
+            self.__runWorkers(numYears, numWorkers, history, workerTimeout)
+
+        return history if keepHistory else self.getPopulations()
+
+    def __runWorkers(self, numYears, numWorkers, history, workerTimeout):
+        shape = self.__populations.shape
+        sharedBlocks = [shared_memory.SharedMemory(create=True, size=max(1, self.__populations.nbytes))
+                        for arrayIdx in range(3)]
+        controlBlock = shared_memory.SharedMemory(create=True, size=2*np.dtype(np.int64).itemsize)
+        workers = []
+        try:
+            populations, localPopulations, dispersers = [np.ndarray(shape, buffer=sharedBlock.buf)
+                                                         for sharedBlock in sharedBlocks]
+            control = np.ndarray(2, dtype=np.int64, buffer=controlBlock.buf)
+            populations[:] = self.__populations
+
+            # contiguous blocks of patches, one per worker
+            blockEdges = np.linspace(0, self.__numPatches, numWorkers+1).astype(int)
+            barrier = multiprocessing.Barrier(numWorkers+1)
+            for workerIdx in range(numWorkers):
+                worker = multiprocessing.Process(
+                    target=_runPatchWorker, daemon=True,
+                    args=(self.__foodWeb, self.__calculatorArgs,
+                          [sharedBlock.name for sharedBlock in sharedBlocks], controlBlock.name, shape,
+                          blockEdges[workerIdx], blockEdges[workerIdx+1], self.__incomingCSR,
+                          barrier, workerTimeout))
+                worker.start()
+                workers.append(worker)
+
+            startYear = self.__year
+            try:
+                for yearIdx in range(numYears):
+                    self.__year += 1
+                    control[:] = (STEP_COMMAND, self.__year)
+                    barrier.wait(workerTimeout)
+                    # the workers calculate their patches' local populations
+                    barrier.wait(workerTimeout)
+                    dispersers[:] = self.__drawMigrationAndDispersers(localPopulations)
+                    barrier.wait(workerTimeout)
+                    # the workers disperse into their patches
+                    barrier.wait(workerTimeout)
+                    if history is not None:
+                        history[yearIdx+1] = populations
+
+                control[0] = STOP_COMMAND
+                barrier.wait(workerTimeout)
+            except threading.BrokenBarrierError:
+                self.__year = startYear
+                raise RuntimeError("A patch worker process failed or timed out")
+            for worker in workers:
+                worker.join()
+
+            self.__populations[:] = populations
+            del populations, localPopulations, dispersers, control
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for sharedBlock in sharedBlocks + [controlBlock]:
+                sharedBlock.close()
+                sharedBlock.unlink()
+
+    def __drawMigrationAndDispersers(self, localPopulations):
+        """Adds migration to the local populations (in place), returning the
+        dispersers from each patch"""
+        if self.__migrationModel is not None:
+            localPopulations += self.__migrationModel.drawMigration(localPopulations, self.__year)
+        return np.trunc(localPopulations * self.__dispersalRate)
+
+    @staticmethod
+    def __makeIncomingCSR(connectivity, numPatches):
+        """Returns (numPatches, (indptr, sources, weights)) of the edges into each patch"""
+        if hasattr(connectivity, "tocoo"):
+            # a scipy.sparse matrix
+            connectivity = connectivity.tocoo()
+            numPatches = connectivity.shape[0]
+            sources, destinations, weights = connectivity.row, connectivity.col, connectivity.data
+        elif isinstance(connectivity, tuple):
+            sources, destinations, weights = [np.asarray(values) for values in connectivity]
+            if numPatches is None:
+                numPatches = int(max(sources.max(initial=-1), destinations.max(initial=-1))) + 1
+        else:
+            connectivity = np.asarray(connectivity, dtype=np.float64)
+            numPatches = len(connectivity)
+            sources, destinations = np.nonzero(connectivity)
+            weights = connectivity[sources, destinations]
+
+        if len(weights) > 0 and (np.min(weights) < 0 or np.max(np.bincount(sources, weights=weights)) > 1 + 1e-9):
+            raise ValueError("Connectivity weights must be positive, and sum to at most 1 from each patch")
+
+        order = np.argsort(destinations, kind="stable")
+        indptr = np.zeros(numPatches+1, dtype=np.intp)
+        indptr[1:] = np.cumsum(np.bincount(destinations, minlength=numPatches))
+        return numPatches, (indptr, np.asarray(sources, dtype=np.intp)[order], np.asarray(weights, dtype=np.float64)[order])
+
+
+def _disperse(localPopulations, dispersers, firstPatch, endPatch, indptr, sources, weights):
+    """Returns the populations of patches firstPatch to endPatch after
+    dispersal: their local populations, less their dispersers, plus the
+    (whole) arrivals from the patches linked to them"""
+    edgeStart, edgeEnd = indptr[firstPatch], indptr[endPatch]
+    arrivals = np.zeros((endPatch - firstPatch, localPopulations.shape[1]))
+    if edgeEnd > edgeStart:
+        # sum each patch's incoming edges (skipping patches without any, which reduceat can't)
+        edgeArrivals = weights[edgeStart:edgeEnd, np.newaxis] * dispersers[sources[edgeStart:edgeEnd]]
+        rowStarts = indptr[firstPatch:endPatch] - edgeStart
+        hasIncoming = np.diff(indptr[firstPatch:endPatch+1]) > 0
+        arrivals[hasIncoming] = np.add.reduceat(edgeArrivals, rowStarts[hasIncoming], axis=0)
+
+    return (localPopulations[firstPatch:endPatch] - dispersers[firstPatch:endPatch]) + np.trunc(arrivals)
+
+
+def _runPatchWorker(foodWebGraph, calculatorArgs, sharedBlockNames, controlBlockName, shape,
+                    firstPatch, endPatch, incomingCSR, barrier, timeout):
+    """Steps the patches from firstPatch to endPatch (in a worker process) in
+    lock-step with PatchGridSimulator.__runWorkers, breaking the barrier if it
+    fails so that the other processes don't wait for it"""
+    sharedBlocks = [shared_memory.SharedMemory(name=name) for name in sharedBlockNames]
+    controlBlock = shared_memory.SharedMemory(name=controlBlockName)
+    try:
+        populations, localPopulations, dispersers = [np.ndarray(shape, buffer=sharedBlock.buf)
+                                                     for sharedBlock in sharedBlocks]
+        control = np.ndarray(2, dtype=np.int64, buffer=controlBlock.buf)
+        calculator = VectorPopSimCalculator(foodWebGraph, **calculatorArgs)
+
+        while True:
+            barrier.wait(timeout)
+            if control[0] == STOP_COMMAND:
+                break
+
+            localPopulations[firstPatch:endPatch] = calculator.doSimulationArray(
+                populations[firstPatch:endPatch], int(control[1]))
+            barrier.wait(timeout)
+            # the main process draws migration and the dispersers
+            barrier.wait(timeout)
+            populations[firstPatch:endPatch] = _disperse(localPopulations, dispersers,
+                                                         firstPatch, endPatch, *incomingCSR)
+            barrier.wait(timeout)
+
+        del populations, localPopulations, dispersers, control
+    except threading.BrokenBarrierError:
+        # another process failed (and will report it)
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        for sharedBlock in sharedBlocks + [controlBlock]:
+            sharedBlock.close()
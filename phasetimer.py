@@ -0,0 +1,84 @@
+#========================================================================
+#
+# phasetimer.py - class to record wall time and call counts for each
+#   phase of the simulation pipeline
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import json
+import threading
+from time import perf_counter
+
+
+class PhaseTimer:
+    """Accumulates wall time and call counts by phase name.
+
+    Timing is off by default.  Instrumented code checks the enabled flag
+    before reading the clock, so when disabled each phase costs one
+    attribute lookup:
+
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+        ...
+        if timing:
+            startTime = PHASE_TIMER.record("phase name", startTime)
+
+    Phases can be recorded from any thread (e.g. the simulation worker's)
+    while the stats are read from another.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.__phases = {}
+        self.__lock = threading.Lock()
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.__lock:
+            self.__phases = {}
+
+    def record(self, phaseName, startTime):
+        """Adds the time since startTime to the phase, returning the current
+        time so that the next phase can start from it"""
+        endTime = perf_counter()
+        elapsed = endTime - startTime
+        with self.__lock:
+            phase = self.__phases.get(phaseName)
+            if phase is None:
+                phase = self.__phases[phaseName] = [0, 0.0, 0.0]
+            phase[0] += 1
+            phase[1] += elapsed
+            if elapsed > phase[2]:
+                phase[2] = elapsed
+        return endTime
+
+    def getStats(self):
+        """Returns {phaseName: {"calls", "totalSeconds", "meanSeconds", "maxSeconds"}}"""
+        with self.__lock:
+            phases = [(phaseName, tuple(phase)) for phaseName, phase in self.__phases.items()]
+        return {phaseName: {"calls": calls,
+                            "totalSeconds": totalSeconds,
+                            "meanSeconds": totalSeconds / calls,
+                            "maxSeconds": maxSeconds}
+                for phaseName, (calls, totalSeconds, maxSeconds) in phases}
+
+    def formatStats(self):
+        """Returns the stats as lines of text, slowest phase (by total time) first"""
+        stats = sorted(self.getStats().items(), key=lambda item: -item[1]["totalSeconds"])
+        return "\n".join(f"{phaseName}: {phase['calls']} x {phase['meanSeconds']*1000:.3f}ms"
+                         f" = {phase['totalSeconds']:.3f}s"
+                         for phaseName, phase in stats)
+
+    def dumpToFile(self, filePath):
+        """Writes the stats to filePath as JSON"""
+        with open(filePath, "w") as statsFile:
+            json.dump(self.getStats(), statsFile, indent=2)
+
+
+# the timer shared by all the instrumented code
+PHASE_TIMER = PhaseTimer()
@@ -7,7 +7,9 @@
 #
 #========================================================================
 
-from random import uniform
+from time import perf_counter
+
+from phasetimer import PHASE_TIMER
 
 OSPREY = "Osprey"
 HERON = "Heron"
@@ -27,6 +29,10 @@ REQUIRED_BIOMASS_FACTOR = "Required Biomass for healthy consumption (as proporti
 INDIVIDUAL_BIOMASS = "Individual animal Biomass (kg)"
 GROWTH_RATE_FACTOR = "Rate factor to grow towards limit by"
 DECLINE_RATE_FACTOR = "Rate factor to decline towards limit by"
+IMMIGRATION_RATE = "Expected number of individuals arriving each year"
+EMIGRATION_RATE = "Chance each year of each individual leaving"
+RECOLONISATION_RATE = "Chance each year of an extinct species being recolonised"
+DISPERSAL_RATE = "Proportion of each habitat patch's population dispersing to other patches each year"
 
 FOOD_WEB_GRAPH = {
     OSPREY: {
@@ -34,6 +40,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 1,
         GROWTH_RATE_FACTOR: 1.115,
         DECLINE_RATE_FACTOR: 0.75,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.1,
         PREDATORS: [],
         PREY: [TROUT]
     },
@@ -42,6 +52,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 1.5,
         GROWTH_RATE_FACTOR: 1.115,
         DECLINE_RATE_FACTOR: 0.75,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.1,
         PREDATORS: [],
         PREY: [TROUT, FROG]
     },
@@ -50,6 +64,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 1e-3,
         GROWTH_RATE_FACTOR: 1.075,
         DECLINE_RATE_FACTOR: 0.9,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.05,
         PREDATORS: [FROG, TROUT],
         PREY: []
     },
@@ -58,6 +76,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 1e-3,
         GROWTH_RATE_FACTOR: 1.075,
         DECLINE_RATE_FACTOR: 0.85,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.05,
         PREDATORS: [FROG, TROUT],
         PREY: [ALGAE]
     },
@@ -66,6 +88,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 15e-3,
         GROWTH_RATE_FACTOR: 1.1,
         DECLINE_RATE_FACTOR: 0.8,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.02,
         PREDATORS: [HERON, OTTER],
         PREY: [MOSQUITO, MAYFLY]
     },
@@ -74,6 +100,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 3,
         GROWTH_RATE_FACTOR: 1.1,
         DECLINE_RATE_FACTOR: 0.8,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.05,
         PREDATORS: [HERON, OTTER, OSPREY],
         PREY: [MAYFLY, MOSQUITO]
     },
@@ -82,6 +112,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 7,
         GROWTH_RATE_FACTOR: 1.115,
         DECLINE_RATE_FACTOR: 0.75,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.1,
         PREDATORS: [],
         PREY: [FROG, TROUT, MUSSELS]
     },
@@ -90,6 +124,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 1e-3,
         GROWTH_RATE_FACTOR: 1.01,
         DECLINE_RATE_FACTOR: 0.95,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.01,
         PREDATORS: [CATFISH, MAYFLY, MUSSELS],
         PREY: []
     },
@@ -98,6 +136,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 0.05,
         GROWTH_RATE_FACTOR: 1.15,
         DECLINE_RATE_FACTOR: 0.85,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.01,
         PREDATORS: [OTTER],
         PREY: [ALGAE]
     },
@@ -106,6 +148,10 @@ FOOD_WEB_GRAPH = {
         INDIVIDUAL_BIOMASS: 4,
         GROWTH_RATE_FACTOR: 1.1,
         DECLINE_RATE_FACTOR: 0.9,
+        IMMIGRATION_RATE: 0,
+        EMIGRATION_RATE: 0,
+        RECOLONISATION_RATE: 0,
+        DISPERSAL_RATE: 0.05,
         PREDATORS: [],
         PREY: [ALGAE]
     }
@@ -124,166 +170,245 @@ MAX_PREDATION_FACTOR = 1.5
 
 
 class PopSimCalculator:
-    def __init__(self):
-        self.__currentData = None
+    """Calculates each year's populations from the previous year's.
+
+    The food web is compiled once (see CompiledFoodWeb) into species-indexed
+    tables, so each year works through plain lists by species index, reused
+    from year to year, rather than looking up and hashing graph entries.
+
+    If any species has a migration rate, each year ends with random
+    migration drawn by a MigrationModel seeded with migrationSeed, so a run
+    with the same seed (and years) is always the same.
+    """
+    def __init__(self, foodWebGraph=None,
+                 minPredationFactor=MIN_PREDATION_FACTOR, maxPredationFactor=MAX_PREDATION_FACTOR,
+                 migrationSeed=None):
+        """foodWebGraph (a graph dict or a CompiledFoodWeb) and the predation
+        factor limits default to the module's globals; pass them in to run an
+        isolated variant of the food web"""
+        from compiledfoodweb import CompiledFoodWeb
+        from migrationmodel import MigrationModel
+
+        if foodWebGraph is None:
+            foodWebGraph = FOOD_WEB_GRAPH
+        if not isinstance(foodWebGraph, CompiledFoodWeb):
+            foodWebGraph = CompiledFoodWeb(foodWebGraph)
+
+        self.__foodWeb = foodWebGraph
+        self.__minPredationFactor = minPredationFactor
+        self.__maxPredationFactor = maxPredationFactor
+        self.__vectorCalculator = None
+
+        self.__migrationModel = None
+        if MigrationModel.hasMigration(self.__foodWeb):
+            self.__migrationModel = MigrationModel(self.__foodWeb, migrationSeed)
+
+        # per-species constants
+        self.__speciesIDList = self.__foodWeb.getSpeciesIDList()
+        self.__individualBiomass = self.__foodWeb.getSpeciesValues(INDIVIDUAL_BIOMASS)
+        self.__requiredBiomassFactor = self.__foodWeb.getSpeciesValues(REQUIRED_BIOMASS_FACTOR)
+        self.__growthRateFactor = self.__foodWeb.getSpeciesValues(GROWTH_RATE_FACTOR)
+        self.__declineRateFactor = self.__foodWeb.getSpeciesValues(DECLINE_RATE_FACTOR)
+        self.__requiredBiomassForIndividual = [individualBiomass * requiredBiomassFactor
+                                               for individualBiomass, requiredBiomassFactor
+                                               in zip(self.__individualBiomass, self.__requiredBiomassFactor)]
+
+        # predators of each species, along with the index of each prey edge
+        self.__predatorEdges = []
+        predatorEdgeHasPressure = self.__foodWeb.getPreyEdgeHasPressure()
+        edgeIdx = 0
+        for predatorList in self.__foodWeb.getPredatorLists():
+            self.__predatorEdges.append([(predatorIdx, edgeIdx + offset, predatorEdgeHasPressure[edgeIdx + offset])
+                                         for offset, predatorIdx in enumerate(predatorList)])
+            edgeIdx += len(predatorList)
+
+        # prey of each species, as the indices of the prey edges that feed it
+        predatorEdgeToPreyEdge = self.__foodWeb.getPredatorEdgeToPreyEdge()
+        self.__preyEdges = []
+        edgeIdx = 0
+        for preyList in self.__foodWeb.getPreyLists():
+            self.__preyEdges.append(predatorEdgeToPreyEdge[edgeIdx:edgeIdx + len(preyList)])
+            edgeIdx += len(preyList)
+
+        # working lists, reused every year
+        numSpecies = len(self.__speciesIDList)
+        self.__population = [0] * numSpecies
+        self.__popChangeFactor = [1] * numSpecies
+        self.__populationBiomass = [0] * numSpecies
+        self.__totalPredatorBiomass = [0.0] * numSpecies
+        self.__biomassPerPredator = [0.0] * edgeIdx
+        self.__predationPressure = [None] * numSpecies
+        self.__newPopulation = [0] * numSpecies
 
     def getSpeciesIDList(self):
-        return list(FOOD_WEB_GRAPH.keys())
-
-    def doSimulation(self, prevYearPopulations):
-        self.__currentData = {}
-        self.__populateCurrentData(prevYearPopulations)
+        return list(self.__speciesIDList)
+
+    def getCompiledFoodWeb(self):
+        return self.__foodWeb
+
+    def getMigrationSeed(self):
+        """Returns the seed of the migration draws, or None if there is no migration"""
+        if self.__migrationModel is None:
+            return None
+        return self.__migrationModel.getSeed()
+
+    def doBatchSimulation(self, initialPopulations, numYears, startYear=None):
+        """Runs many independent scenarios together.
+        initialPopulations is a 2-D array of shape (scenarios, species), with
+        species ordered as getSpeciesIDList().  Returns an array of shape
+        (scenarios, numYears+1, species) whose first year is the initial populations.
+        """
+        if self.__vectorCalculator is None:
+            from vectorpopsimcalculator import VectorPopSimCalculator
+            self.__vectorCalculator = VectorPopSimCalculator(self.__foodWeb,
+                                                             self.__minPredationFactor, self.__maxPredationFactor,
+                                                             self.getMigrationSeed())
+
+        return self.__vectorCalculator.runSimulationArray(initialPopulations, numYears, startYear)
+
+    def doSimulation(self, prevYearPopulations, year=None):
+        for speciesIdx, speciesID in enumerate(self.__speciesIDList):
+            self.__population[speciesIdx] = prevYearPopulations[speciesID]
+
+        return dict(zip(self.__speciesIDList, self.doSimulationList(self.__population, year)))
+
+    def doSimulationList(self, prevYearPopulations, year=None):
+        """Advances a list of populations (ordered as getSpeciesIDList()) by one
+        year.  year is the year being calculated, which picks its migration
+        draws; by default it follows on from the previous call.
+        The returned list is reused by the next call."""
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        self.__population[:] = prevYearPopulations
 
         self.__calculatePopulationBiomassBySpecies()
+        if timing:
+            startTime = PHASE_TIMER.record("PopSimCalculator.populationBiomass", startTime)
 
         self.__calculateBiomassAvailableToPredators()
+        if timing:
+            startTime = PHASE_TIMER.record("PopSimCalculator.biomassAvailableToPredators", startTime)
 
         self.__adjustGrowthForFoodAvailability()
+        if timing:
+            startTime = PHASE_TIMER.record("PopSimCalculator.growthForFoodAvailability", startTime)
 
         self.__adjustGrowthForPredatorPressure()
+        if timing:
+            startTime = PHASE_TIMER.record("PopSimCalculator.growthForPredatorPressure", startTime)
 
-        newYearPopulations = self.__produceNewPopulationDict()
+        newYearPopulations = self.__produceNewPopulationList()
+        if timing:
+            startTime = PHASE_TIMER.record("PopSimCalculator.newPopulations", startTime)
 
-        self.__addMigratoryPressures(newYearPopulations)
-
-        self.__currentData = None
+        self.__addMigratoryPressures(newYearPopulations, year)
+        if timing:
+            PHASE_TIMER.record("PopSimCalculator.migratoryPressures", startTime)
 
         return newYearPopulations
 
-    def __populateCurrentData(self, populations):
-        for speciesID, population in populations.items():
-            self.__currentData[speciesID] = {POPULATION: population,
-                                             POP_CHANGE_FACTOR: 1,
-                                             PREDATION_PRESSURE: {}}
-
     def __calculatePopulationBiomassBySpecies(self):
-        for speciesID, data in self.__currentData.items():
-            population = self.__currentData[speciesID][POPULATION]
-            individualBiomass = FOOD_WEB_GRAPH[speciesID][INDIVIDUAL_BIOMASS]
-
-            self.__currentData[speciesID][POPULATION_BIOMASS] = population*individualBiomass
+        for speciesIdx, population in enumerate(self.__population):
+            self.__populationBiomass[speciesIdx] = population*self.__individualBiomass[speciesIdx]
+            self.__popChangeFactor[speciesIdx] = 1
+            self.__predationPressure[speciesIdx] = None
 
     def __calculateBiomassAvailableToPredators(self):
-        results = {}
-        for speciesID, speciesData in self.__currentData.items():
+        populationBiomass = self.__populationBiomass
+        for speciesIdx, predatorEdges in enumerate(self.__predatorEdges):
             # calculate total biomass of predators
             grandTotalPredatorBiomass = 0.0
-            for predatorSpeciesID in FOOD_WEB_GRAPH[speciesID][PREDATORS]:
-                predatorSpeciesBiomass = self.__currentData[predatorSpeciesID][POPULATION_BIOMASS]
-                grandTotalPredatorBiomass += predatorSpeciesBiomass
-            speciesData[TOTAL_PREDATOR_BIOMASS] = grandTotalPredatorBiomass
+            for predatorIdx, edgeIdx, hasPressure in predatorEdges:
+                grandTotalPredatorBiomass += populationBiomass[predatorIdx]
+            self.__totalPredatorBiomass[speciesIdx] = grandTotalPredatorBiomass
 
             # divide this species' biomass between the predators, weighted by predator biomass
-            biomassByPredator = {}
             if grandTotalPredatorBiomass > 0:
-                thisSpeciesBiomass = self.__currentData[speciesID][POPULATION_BIOMASS]
-                for predatorSpeciesID in FOOD_WEB_GRAPH[speciesID][PREDATORS]:
-                    predatorSpeciesBiomass = self.__currentData[predatorSpeciesID][POPULATION_BIOMASS]
-
-                    biomassByPredator[predatorSpeciesID] = (thisSpeciesBiomass * predatorSpeciesBiomass
-                                                            / grandTotalPredatorBiomass)
-
-            self.__currentData[speciesID][BIOMASS_PER_PREDATOR] = biomassByPredator
+                thisSpeciesBiomass = populationBiomass[speciesIdx]
+                for predatorIdx, edgeIdx, hasPressure in predatorEdges:
+                    self.__biomassPerPredator[edgeIdx] = (thisSpeciesBiomass * populationBiomass[predatorIdx]
+                                                          / grandTotalPredatorBiomass)
 
     def __adjustGrowthForFoodAvailability(self):
-        for speciesID, speciesData in self.__currentData.items():
-            if speciesData[POPULATION] > 0:
+        for speciesIdx, preyEdges in enumerate(self.__preyEdges):
+            population = self.__population[speciesIdx]
+            if population > 0:
                 # only apply food adjustment if species is actually a predator
-                if len(FOOD_WEB_GRAPH[speciesID][PREY]) > 0:
+                if len(preyEdges) > 0:
                     totalAvailableBiomass = 0
-                    for preySpeciesID in FOOD_WEB_GRAPH[speciesID][PREY]:
-                        preyData = self.__currentData[preySpeciesID]
-                        availablePreyBiomass = preyData[BIOMASS_PER_PREDATOR][speciesID]
-                        totalAvailableBiomass += availablePreyBiomass
+                    for edgeIdx in preyEdges:
+                        totalAvailableBiomass += self.__biomassPerPredator[edgeIdx]
 
-                    totalRequiredFoodBiomass = (speciesData[POPULATION_BIOMASS]
-                                                * FOOD_WEB_GRAPH[speciesID][REQUIRED_BIOMASS_FACTOR])
+                    totalRequiredFoodBiomass = (self.__populationBiomass[speciesIdx]
+                                                * self.__requiredBiomassFactor[speciesIdx])
 
-                    # calculate and store pressure from this predator for each prey species
+                    # calculate and store pressure from this predator on its prey species
                     if totalAvailableBiomass > 0:
-                        preyPredationPressure = totalRequiredFoodBiomass / totalAvailableBiomass
-                        for preySpeciesID in FOOD_WEB_GRAPH[speciesID][PREY]:
-                            preyData = self.__currentData[preySpeciesID]
-                            preyData[PREDATION_PRESSURE][speciesID] = preyPredationPressure
+                        self.__predationPressure[speciesIdx] = totalRequiredFoodBiomass / totalAvailableBiomass
 
                     # adjust the population growth rate for the predator
-                    requiredBiomassForIndividual = (FOOD_WEB_GRAPH[speciesID][INDIVIDUAL_BIOMASS]
-                                                    * FOOD_WEB_GRAPH[speciesID][REQUIRED_BIOMASS_FACTOR])
-                    newPopulationLimit = int(totalAvailableBiomass / requiredBiomassForIndividual)
-                    currentPopulation = speciesData[POPULATION]
-                    if newPopulationLimit < currentPopulation:
-                        speciesData[POP_CHANGE_FACTOR] *= FOOD_WEB_GRAPH[speciesID][DECLINE_RATE_FACTOR]
-                    elif newPopulationLimit > currentPopulation:
-                        speciesData[POP_CHANGE_FACTOR] *= FOOD_WEB_GRAPH[speciesID][GROWTH_RATE_FACTOR]
+                    newPopulationLimit = int(totalAvailableBiomass / self.__requiredBiomassForIndividual[speciesIdx])
+                    if newPopulationLimit < population:
+                        self.__popChangeFactor[speciesIdx] *= self.__declineRateFactor[speciesIdx]
+                    elif newPopulationLimit > population:
+                        self.__popChangeFactor[speciesIdx] *= self.__growthRateFactor[speciesIdx]
                 else:
                     # allow normal growth rate if it does not require food
-                    speciesData[POP_CHANGE_FACTOR] *= FOOD_WEB_GRAPH[speciesID][GROWTH_RATE_FACTOR]
+                    self.__popChangeFactor[speciesIdx] *= self.__growthRateFactor[speciesIdx]
+
     def __adjustGrowthForPredatorPressure(self):
-        for speciesID, speciesData in self.__currentData.items():
+        for speciesIdx, predatorEdges in enumerate(self.__predatorEdges):
             # only apply predator adjustment if species is actually prey
-            if len(FOOD_WEB_GRAPH[speciesID][PREDATORS]) > 0:
+            if len(predatorEdges) > 0:
                 # if we sum all the predation factors weighted by the proportion of
                 # predator biomass this should work out as a weighted average across
                 # all predators
-                totalPredatorBiomass = speciesData[TOTAL_PREDATOR_BIOMASS]
+                totalPredatorBiomass = self.__totalPredatorBiomass[speciesIdx]
                 totalPredationFactor = 0
                 if totalPredatorBiomass > 0:
-                    totalPredationFactor = 0
-                    for predatorSpeciesID in FOOD_WEB_GRAPH[speciesID][PREDATORS]:
-                        predatorData = self.__currentData[predatorSpeciesID]
+                    for predatorIdx, edgeIdx, hasPressure in predatorEdges:
+                        predationPressure = self.__predationPressure[predatorIdx]
                         # check there are any predators actually left to apply the pressure
-                        if predatorSpeciesID in speciesData[PREDATION_PRESSURE]:
-                            predationContribution = (speciesData[PREDATION_PRESSURE][predatorSpeciesID]
-                                                     * predatorData[POPULATION_BIOMASS]
+                        if hasPressure and predationPressure is not None:
+                            predationContribution = (predationPressure
+                                                     * self.__populationBiomass[predatorIdx]
                                                      / totalPredatorBiomass)
                             totalPredationFactor += predationContribution
 
-                if totalPredationFactor < MIN_PREDATION_FACTOR:
-                    totalPredationFactor = MIN_PREDATION_FACTOR
+                if totalPredationFactor < self.__minPredationFactor:
+                    totalPredationFactor = self.__minPredationFactor
 
                 # stability fudge
-                if totalPredationFactor > MAX_PREDATION_FACTOR:
-                    totalPredationFactor = MAX_PREDATION_FACTOR
+                if totalPredationFactor > self.__maxPredationFactor:
+                    totalPredationFactor = self.__maxPredationFactor
 
-                speciesData[POP_CHANGE_FACTOR] /= totalPredationFactor
+                self.__popChangeFactor[speciesIdx] /= totalPredationFactor
 
-    def __produceNewPopulationDict(self):
-        newPopulations = {}
+    def __produceNewPopulationList(self):
+        newPopulations = self.__newPopulation
 
-        for speciesID, speciesData in self.__currentData.items():
-            newPop = int(speciesData[POPULATION] * speciesData[POP_CHANGE_FACTOR])
+        for speciesIdx, population in enumerate(self.__population):
+            popChangeFactor = self.__popChangeFactor[speciesIdx]
+            newPop = int(population * popChangeFactor)
 
-            if newPop == speciesData[POPULATION]:
-                if speciesData[POP_CHANGE_FACTOR] > 1:
+            if newPop == population:
+                if popChangeFactor > 1:
                     newPop += 1
-                elif speciesData[POP_CHANGE_FACTOR] < 1 and newPop > 0:
+                elif popChangeFactor < 1 and newPop > 0:
                     newPop -= 1
 
-            newPopulations[speciesID] = newPop
+            newPopulations[speciesIdx] = newPop
 
         return newPopulations
 
-    def __addMigratoryPressures(self, newPopulations):
-        for speciesID in newPopulations.keys():
-            popBiomass = self.__currentData[speciesID][POPULATION_BIOMASS]
-            individualBiomass = FOOD_WEB_GRAPH[speciesID][INDIVIDUAL_BIOMASS]
-            # if popBiomass < 5:
-            #     newBiomass = uniform(1, 5)
-            #     numNewIndividuals = int(newBiomass / individualBiomass)
-            #     newPopulations[speciesID] += numNewIndividuals
-            # elif individualBiomass > 0.1 and popBiomass > 1000:
-            #     newBiomass = popBiomass * uniform(0.9, 0.95)
-            #     numNewIndividuals = int(newBiomass / individualBiomass)
-            #     newPopulations[speciesID] = numNewIndividuals
-            # elif newPopulations[speciesID] > 2e6:
-            #     newPopulations[speciesID] = int(newPopulations[speciesID] * uniform(0.85, 0.95))
-
-            # if newPopulations[speciesID] == 0:
-            #     newPopulations[speciesID] += int(uniform(0.5, 1.75))
-
-
-
-
-
-
+    def __addMigratoryPressures(self, newPopulations, year):
+        if self.__migrationModel is None:
+            return
 
+        # add the (whole number) changes to the exact ints
+        migration = self.__migrationModel.drawMigration(newPopulations, year)
+        for speciesIdx, change in enumerate(migration.tolist()):
+            if change != 0:
+                newPopulations[speciesIdx] += int(change)
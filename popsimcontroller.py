@@ -7,15 +7,63 @@
 #
 #========================================================================
 
+import queue
+import threading
 from math import pi, cos
 from popsimcalculator import *
+from checkpointlog import CheckpointLog
+from compiledfoodweb import CompiledFoodWeb
+from ensemblerunner import EnsembleRunner
+from phasetimer import PHASE_TIMER
+from runexport import RunExportStream, exportRun, importRun, loadRunInfo
+from simworker import SimWorker
+
+# ms delay between each check for results from the worker thread
+WORKER_DRAIN_DELAY = 40
+MAX_YEARS_PER_DRAIN = 256
+# years between the population checkpoints used to replay the run
+CHECKPOINT_INTERVAL = 100
+# ms delay between each check on the progress of an ensemble run
+ENSEMBLE_POLL_DELAY = 100
 
 
 class PopSimController:
-    def __init__(self, tkRoot, timeSeriesModel):
+    """Advances the simulation, either one year per Tk tick, or (with
+    useWorkerThread) by draining years calculated in a background SimWorker
+    in batches.  In worker mode every pause, reset or override starts a new
+    epoch, and queued results from earlier epochs are discarded.
+
+    Every run is recorded in a CheckpointLog (periodic checkpoints plus each
+    override made), so it can be rewound to an earlier year and a new
+    trajectory branched from there.  The trajectories left behind are kept as
+    branches that can be switched back to by replaying them.
+
+    Ensembles run in a background thread, so the window stays responsive,
+    with their progress polled from the Tk loop.  One started before a reset
+    or import is still run, but its statistics are discarded.
+
+    The model gets a series for each species of the food web simulated,
+    FOOD_WEB_GRAPH unless another (e.g. from foodwebloader.loadFoodWeb) is given.
+    """
+    def __init__(self, tkRoot, timeSeriesModel, useWorkerThread=False, foodWeb=None):
+        """foodWeb is a food web graph dict or a CompiledFoodWeb"""
+        if foodWeb is None:
+            foodWeb = FOOD_WEB_GRAPH
+        if not isinstance(foodWeb, CompiledFoodWeb):
+            foodWeb = CompiledFoodWeb(foodWeb)
+
         self.__tkRoot = tkRoot
         self.__model = timeSeriesModel
-        self.__calculator = PopSimCalculator()
+        self.__foodWeb = foodWeb
+        self.__foodWebGraph = foodWeb.getFoodWebGraph()
+        self.__calculatorArgs = {"minPredationFactor": MIN_PREDATION_FACTOR,
+                                 "maxPredationFactor": MAX_PREDATION_FACTOR}
+        self.__calculator = PopSimCalculator(self.__foodWeb, **self.__calculatorArgs)
+        # keep the seed picked, so exported runs replay with the same migration
+        self.__calculatorArgs["migrationSeed"] = self.__calculator.getMigrationSeed()
+        # replays get a calculator of their own, as the worker thread may still be using the other
+        self.__replayCalculator = PopSimCalculator(self.__foodWeb, **self.__calculatorArgs)
+        self.__exportStream = None
 
         # just dummy model for now
         self.__dummyPhase = 0
@@ -33,13 +81,37 @@ class PopSimController:
             self.__model.addTimeSeries(speciesID)
             self.__model.setSeriesValue(speciesID, 0)
 
+        # record of the run, and of the trajectories branched away from, as (endYear, log)
+        self.__checkpointLog = CheckpointLog(self.__model.getStartYear(), self.__model.getCurrentValues(),
+                                             CHECKPOINT_INTERVAL)
+        self.__branches = []
+
         # set up state variables
         self.__stateSubscribers = []
+        self.__ensembleSubscribers = []
         self.__playing = False
         self.__resetOnTick = False
 
+        # set up the background worker
+        self.__worker = None
+        self.__workerEpoch = 0
+        self.__drainAfterID = None
+        if useWorkerThread:
+            self.__startWorker()
+
+        # the ensemble being run in the background, if any
+        self.__ensembleProgressSubscribers = []
+        self.__ensembleThread = None
+        self.__ensembleProgress = queue.Queue()
+        self.__ensembleStatistics = None
+        self.__ensembleReplicatesRun = (0, 0)
+        self.__ensembleEpoch = 0
+        self.__runningEnsembleEpoch = None
+
     def tick(self):
-        if self.__resetOnTick:
+        if self.__worker is not None:
+            self.__drainWorker()
+        elif self.__resetOnTick:
             self.resetSim()
             self.__resetOnTick = False
         elif self.__playing:
@@ -47,10 +119,13 @@ class PopSimController:
             prevYear = self.__model.getCurrentYear()
             prevYearPopulations = self.__model.getCurrentValues()
 
-            newYearPopulations = self.__calculator.doSimulation(prevYearPopulations)
+            newYearPopulations = self.__calculator.doSimulation(prevYearPopulations, prevYear+1)
 
-            self.__model.advanceYear()
-            self.__model.setCurrentValues(newYearPopulations)
+            # one consolidated update for the whole year
+            with self.__model.batchUpdate():
+                self.__model.advanceYear()
+                self.__model.setCurrentValues(newYearPopulations)
+            self.__checkpointLog.recordYear(self.__model.getCurrentYear(), newYearPopulations)
 
             # for seriesID in self.__model.getSeriesIDList():
             #     prevPop = self.__model.getSeriesValue(seriesID, prevYear)
@@ -63,29 +138,98 @@ class PopSimController:
 
     def setSimRate(self, rate):
         self.__tickDelay = int(1000 / pow((rate+1), 2))
+        if self.__worker is not None:
+            self.__worker.setYearDelay(self.__tickDelay / 1000)
 
     def startSim(self):
         if not self.__playing:
             self.__tkRoot.focus()
             self.__playing = True
             self.__informStateSubscribers()
-            self.__tkRoot.after(10, lambda: self.tick())
+            if self.__worker is not None:
+                self.__restartWorker()
+            else:
+                self.__tkRoot.after(10, lambda: self.tick())
+
+    def stopWorker(self):
+        if self.__worker is not None:
+            self.__worker.stop()
+
+    def exportRun(self, filePath):
+        """Writes the whole run so far, with the food web used, to filePath"""
+        exportRun(self.__model, filePath, self.__foodWebGraph, self.__calculatorArgs)
+
+    def startStreamingExport(self, filePath, chunkYears=1024):
+        """Starts writing the run to filePath in chunks as it goes"""
+        self.stopStreamingExport()
+        self.__exportStream = RunExportStream(self.__model, filePath, self.__foodWebGraph,
+                                              self.__calculatorArgs, chunkYears)
+
+    def stopStreamingExport(self):
+        if self.__exportStream is not None:
+            self.__exportStream.close()
+            self.__exportStream = None
+
+    def importRun(self, filePath):
+        """Pauses the simulation and loads a previously exported run, ready to
+        carry on from its last year with the food web it was run with.
+        The views are built for the species of the loaded food web, so the
+        run must be of the same species (though their parameters may differ);
+        otherwise ValueError is raised and nothing is changed."""
+        seriesIDList, metadata = loadRunInfo(filePath)
+        foodWebSpecies = seriesIDList if metadata["foodWebGraph"] is None else list(metadata["foodWebGraph"])
+        for speciesIDList in (seriesIDList, foodWebSpecies):
+            if sorted(speciesIDList) != sorted(self.__model.getSeriesIDList()):
+                raise ValueError(f"{filePath} is a run of different species to the loaded food web")
+
+        if self.__playing:
+            self.pauseUnpauseSim()
+
+        model, metadata = importRun(filePath, self.__model)
+
+        # the imported years become the checkpoints of a fresh record
+        firstYear = self.__model.getFirstStoredYear()
+        self.__checkpointLog = CheckpointLog(firstYear, self.__getStoredPopulations(firstYear), CHECKPOINT_INTERVAL)
+        for year in range(firstYear + CHECKPOINT_INTERVAL, self.__model.getCurrentYear()+1, CHECKPOINT_INTERVAL):
+            self.__checkpointLog.recordYear(year, self.__getStoredPopulations(year))
+        self.__branches = []
+
+        if metadata["foodWebGraph"] is not None:
+            self.__foodWebGraph = metadata["foodWebGraph"]
+            self.__foodWeb = CompiledFoodWeb(self.__foodWebGraph)
+            self.__calculatorArgs = metadata["calculatorArgs"]
+            self.__calculator = PopSimCalculator(self.__foodWeb, **self.__calculatorArgs)
+            self.__replayCalculator = PopSimCalculator(self.__foodWeb, **self.__calculatorArgs)
+            if self.__worker is not None:
+                self.__worker.stop()
+                self.__startWorker()
+
+        # any ensemble band was of the run before the import
+        self.__clearEnsemble()
 
     def resetSim(self):
+        if self.__worker is not None:
+            # results still queued from the old epoch will be discarded
+            self.__workerEpoch += 1
+            self.__worker.pause()
+            self.__playing = False
+
         if self.__playing:
             self.__resetOnTick = True
         else:
-            # stash initial values
-            startYear = self.__model.getStartYear()
-            initialValues = {}
-            for seriesID in self.__model.getSeriesIDList():
-                initialValues[seriesID] = self.__model.getSeriesValue(seriesID, startYear)
+            # stash initial values (the start checkpoint plus any overrides made in the start year)
+            startYear = self.__checkpointLog.getStartYear()
+            self.__checkpointLog.truncate(startYear)
+            initialValues = self.__checkpointLog.replayTo(self.__replayCalculator, startYear)
 
-            self.__model.erase(startYear=2024)
+            with self.__model.batchUpdate():
+                self.__model.erase(startYear=startYear)
 
-            # restore initial values
-            for seriesID, value in initialValues.items():
-                self.__model.setSeriesValue(seriesID, value)
+                # restore initial values
+                self.__model.setCurrentValues(initialValues)
+
+            # any ensemble forecast no longer applies
+            self.__clearEnsemble()
 
         self.__playing = False
         self.__informStateSubscribers()
@@ -93,15 +237,224 @@ class PopSimController:
     def pauseUnpauseSim(self):
         self.__playing = not self.__playing
         self.__informStateSubscribers()
-        if self.__playing:
+        if self.__worker is not None:
+            if self.__playing:
+                self.__restartWorker()
+            else:
+                self.__workerEpoch += 1
+                self.__worker.pause()
+        elif self.__playing:
             self.tick()
 
     def overrideSeriesValue(self, seriesID, newValue):
         self.__model.setSeriesValue(seriesID, newValue)
+        self.__checkpointLog.recordOverride(self.__model.getCurrentYear(), seriesID, newValue)
+        if self.__worker is not None and self.__playing:
+            # carry on from the overridden values rather than the worker's own
+            self.__restartWorker()
+
+    def setPhaseTimingEnabled(self, enabled):
+        """Turns per-phase timing of the calculator, model and views on or off"""
+        PHASE_TIMER.setEnabled(enabled)
+
+    def getPhaseTimingText(self):
+        return PHASE_TIMER.formatStats()
+
+    def resetPhaseTimings(self):
+        PHASE_TIMER.reset()
+
+    def dumpPhaseTimings(self, filePath):
+        """Writes the per-phase timings gathered so far to filePath as JSON"""
+        PHASE_TIMER.dumpToFile(filePath)
+
+    def getSpeciesTrophicLevels(self):
+        """Returns {speciesID: trophic level} of the food web being simulated (see CompiledFoodWeb)"""
+        return dict(zip(self.__foodWeb.getSpeciesIDList(), self.__foodWeb.getTrophicLevels()))
+
+    def getCheckpointLog(self):
+        return self.__checkpointLog
+
+    def getBranchEndYears(self):
+        """Returns the end year of each trajectory branched away from, oldest first"""
+        return [endYear for endYear, checkpointLog in self.__branches]
+
+    def rewindToYear(self, year):
+        """Pauses the simulation and winds the run back to year, from where a
+        new trajectory can be followed.  The trajectory being left is kept as
+        a branch."""
+        if self.__playing:
+            self.pauseUnpauseSim()
+
+        endYear = self.__model.getCurrentYear()
+        year = max(year, self.__checkpointLog.getStartYear())
+        if year >= endYear:
+            return
+
+        self.__branches.append((endYear, self.__checkpointLog))
+        self.__checkpointLog = self.__checkpointLog.branchAt(year)
+        self.__windBackTo(year)
+
+    def restoreBranch(self, branchIdx=-1):
+        """Pauses the simulation and switches back to a branch, replaying it
+        only from the last year it has in common with the current trajectory.
+        The current trajectory is kept as a branch in its place."""
+        if self.__playing:
+            self.pauseUnpauseSim()
+
+        branchEndYear, branchLog = self.__branches.pop(branchIdx)
+        self.__branches.append((self.__model.getCurrentYear(), self.__checkpointLog))
+
+        # both trajectories are the same up to the first override that differs
+        overrides = self.__checkpointLog.getOverrides()
+        branchOverrides = branchLog.getOverrides()
+        numCommonOverrides = 0
+        while (numCommonOverrides < min(len(overrides), len(branchOverrides))
+               and overrides[numCommonOverrides] == branchOverrides[numCommonOverrides]):
+            numCommonOverrides += 1
+        commonYear = min(branchEndYear, self.__model.getCurrentYear())
+        for override in overrides[numCommonOverrides:] + branchOverrides[numCommonOverrides:]:
+            commonYear = min(commonYear, override[0] - 1)
+
+        self.__checkpointLog = branchLog
+        self.__windBackTo(max(commonYear, branchLog.getStartYear()))
+
+        # replay the rest of the branch and add it in one go
+        if branchEndYear > self.__model.getCurrentYear():
+            firstYear, yearPopulationsList = branchLog.replay(self.__replayCalculator, branchEndYear,
+                                                                    self.__model.getCurrentYear() + 1)
+            self.__model.extendSeries({seriesID: [populations[seriesID] for populations in yearPopulationsList]
+                                       for seriesID in self.__model.getSeriesIDList()})
+
+    def runEnsemble(self, numReplicates, numYears):
+        """Pauses the simulation and starts running numReplicates stochastic
+        replicates of the next numYears years from the current year in the
+        background.  Progress goes to the ensemble progress subscribers, then
+        the EnsembleStatistics to the ensemble subscribers.  Returns False
+        (and does nothing) if an ensemble is already running."""
+        if self.__ensembleThread is not None:
+            return False
+        if self.__playing:
+            self.pauseUnpauseSim()
+
+        calculatorArgs = {key: value for key, value in self.__calculatorArgs.items() if key != "migrationSeed"}
+        ensembleRunner = EnsembleRunner(self.__foodWeb, **calculatorArgs)
+        ensembleRunner.subscribeToProgress(self)
+        self.__ensembleStatistics = None
+        self.__runningEnsembleEpoch = self.__ensembleEpoch
+        self.__ensembleThread = threading.Thread(target=self.__runEnsembleThread, daemon=True,
+                                                 args=(ensembleRunner, self.__model.getCurrentValues(),
+                                                       numYears, numReplicates, self.__model.getCurrentYear()))
+        self.__ensembleThread.start()
+
+        self.__ensembleReplicatesRun = (0, numReplicates)
+        self.__informEnsembleProgressSubscribers(True)
+        self.__tkRoot.after(ENSEMBLE_POLL_DELAY, lambda: self.__pollEnsemble())
+        return True
+
+    def isEnsembleRunning(self):
+        return self.__ensembleThread is not None
+
+    def ensembleRunProgressed(self, progressData):
+        """Called on the ensemble thread after each batch of replicates"""
+        self.__ensembleProgress.put((progressData["replicatesRun"], progressData["numReplicates"]))
 
     def subscribeToStateChanges(self, subscriber):
         self.__stateSubscribers.append(subscriber)
 
+    def subscribeToEnsembleStatistics(self, subscriber):
+        """registers the subscriber to get ensembleStatisticsUpdated(...) calls with
+        each ensemble's statistics (or None when they are cleared)"""
+        self.__ensembleSubscribers.append(subscriber)
+
+    def subscribeToEnsembleProgress(self, subscriber):
+        """registers the subscriber to get ensembleProgressUpdated(...) calls while
+        an ensemble runs, and once more when it has finished"""
+        self.__ensembleProgressSubscribers.append(subscriber)
+
+    def __windBackTo(self, year):
+        """Cuts the model back to year, rebuilding that year from the nearest
+        checkpoint if the model no longer holds it"""
+        if year >= self.__model.getFirstStoredYear():
+            self.__model.truncate(year)
+        else:
+            populations = self.__checkpointLog.replayTo(self.__replayCalculator, year)
+            with self.__model.batchUpdate():
+                self.__model.erase(startYear=year)
+                self.__model.setCurrentValues(populations)
+
+    def __getStoredPopulations(self, year):
+        return {seriesID: self.__model.getSeriesValue(seriesID, year) for seriesID in self.__model.getSeriesIDList()}
+
+    def __startWorker(self):
+        self.__worker = SimWorker(self.__calculator)
+        self.__worker.setYearDelay(self.__tickDelay / 1000)
+        self.__worker.start()
+
+    def __restartWorker(self):
+        self.__workerEpoch += 1
+        self.__worker.runFrom(self.__workerEpoch, self.__model.getCurrentValues(), self.__model.getCurrentYear())
+        if self.__drainAfterID is None:
+            self.__drainAfterID = self.__tkRoot.after(WORKER_DRAIN_DELAY, lambda: self.tick())
+
+    def __drainWorker(self):
+        self.__drainAfterID = None
+        if not self.__playing:
+            return
+
+        # add all the years calculated since the last drain in one go
+        newYearPopulationsList = [populations for epoch, populations in self.__worker.getResults(MAX_YEARS_PER_DRAIN)
+                                  if epoch == self.__workerEpoch]
+        if len(newYearPopulationsList) > 0:
+            firstNewYear = self.__model.getCurrentYear() + 1
+            self.__model.extendSeries({seriesID: [populations[seriesID] for populations in newYearPopulationsList]
+                                       for seriesID in self.__model.getSeriesIDList()})
+            for yearOffset, populations in enumerate(newYearPopulationsList):
+                self.__checkpointLog.recordYear(firstNewYear + yearOffset, populations)
+
+        self.__drainAfterID = self.__tkRoot.after(WORKER_DRAIN_DELAY, lambda: self.tick())
+
+    def __runEnsembleThread(self, ensembleRunner, initialPopulations, numYears, numReplicates, startYear):
+        self.__ensembleStatistics = ensembleRunner.run(initialPopulations, numYears, numReplicates,
+                                                       startYear=startYear)
+
+    def __pollEnsemble(self):
+        """Passes on the ensemble's progress, and its statistics once it has finished"""
+        # if the thread had already finished, all its progress is queued
+        finished = not self.__ensembleThread.is_alive()
+        try:
+            while True:
+                self.__ensembleReplicatesRun = self.__ensembleProgress.get_nowait()
+        except queue.Empty:
+            pass
+
+        if not finished:
+            self.__informEnsembleProgressSubscribers(True)
+            self.__tkRoot.after(ENSEMBLE_POLL_DELAY, lambda: self.__pollEnsemble())
+            return
+
+        self.__ensembleThread = None
+        statistics = self.__ensembleStatistics
+        self.__ensembleStatistics = None
+        self.__informEnsembleProgressSubscribers(False)
+        # (statistics is None if the run failed)
+        if statistics is not None and self.__runningEnsembleEpoch == self.__ensembleEpoch:
+            self.__informEnsembleSubscribers(statistics)
+
+    def __clearEnsemble(self):
+        """Clears any ensemble statistics shown, and discards those of any ensemble still running"""
+        self.__ensembleEpoch += 1
+        self.__informEnsembleSubscribers(None)
+
+    def __informEnsembleProgressSubscribers(self, running):
+        replicatesRun, numReplicates = self.__ensembleReplicatesRun
+        progressData = {"replicatesRun": replicatesRun, "numReplicates": numReplicates, "running": running}
+        for subscriber in self.__ensembleProgressSubscribers:
+            subscriber.ensembleProgressUpdated(progressData)
+
+    def __informEnsembleSubscribers(self, statistics):
+        for subscriber in self.__ensembleSubscribers:
+            subscriber.ensembleStatisticsUpdated(statistics)
+
     def __informStateSubscribers(self):
         for subscriber in self.__stateSubscribers:
             subscriber.simStateChanged({"Playing": self.__playing})
\ No newline at end of file
@@ -0,0 +1,236 @@
+#========================================================================
+#
+# popsimkernel.py - class to run many years of the population simulation
+#   in a single (optionally JIT-compiled) kernel call
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from time import perf_counter
+
+import numpy as np
+
+from popsimcalculator import *
+from compiledfoodweb import CompiledFoodWeb
+from migrationmodel import MigrationModel
+from phasetimer import PHASE_TIMER
+
+try:
+    from numba import njit
+    JIT_AVAILABLE = True
+except ImportError:
+    JIT_AVAILABLE = False
+
+
+def _runYearsKernel(populations, numYears,
+                    individualBiomass, requiredBiomassFactor, growthRateFactor, declineRateFactor,
+                    requiredBiomassForIndividual,
+                    predatorIndptr, predatorIndices, preyEdgeHasPressure,
+                    preyIndptr, predatorEdgeToPreyEdge,
+                    minPredationFactor, maxPredationFactor,
+                    biomass, totalPredatorBiomass, biomassPerPredator,
+                    predationPressure, hasPressure, popChangeFactor):
+    """Fills populations[1:numYears+1] on from populations[0].
+
+    Uses nothing but indexing and scalar arithmetic, so the same code runs
+    JIT-compiled over arrays or as plain Python over lists.  It follows
+    PopSimCalculator step by step, in the same order, so results match it.
+    The trailing arguments are per-species/per-edge work space.
+    """
+    numSpecies = len(individualBiomass)
+    for yearIdx in range(numYears):
+        population = populations[yearIdx]
+        newPopulation = populations[yearIdx+1]
+
+        # population biomass by species
+        for speciesIdx in range(numSpecies):
+            biomass[speciesIdx] = population[speciesIdx] * individualBiomass[speciesIdx]
+            popChangeFactor[speciesIdx] = 1.0
+            hasPressure[speciesIdx] = False
+
+        # biomass available to predators
+        for speciesIdx in range(numSpecies):
+            grandTotalPredatorBiomass = 0.0
+            for edgeIdx in range(predatorIndptr[speciesIdx], predatorIndptr[speciesIdx+1]):
+                grandTotalPredatorBiomass += biomass[predatorIndices[edgeIdx]]
+            totalPredatorBiomass[speciesIdx] = grandTotalPredatorBiomass
+
+            if grandTotalPredatorBiomass > 0:
+                for edgeIdx in range(predatorIndptr[speciesIdx], predatorIndptr[speciesIdx+1]):
+                    biomassPerPredator[edgeIdx] = (biomass[speciesIdx] * biomass[predatorIndices[edgeIdx]]
+                                                   / grandTotalPredatorBiomass)
+
+        # adjust growth for food availability
+        for speciesIdx in range(numSpecies):
+            currentPopulation = population[speciesIdx]
+            if currentPopulation > 0:
+                if preyIndptr[speciesIdx+1] > preyIndptr[speciesIdx]:
+                    totalAvailableBiomass = 0.0
+                    for edgeIdx in range(preyIndptr[speciesIdx], preyIndptr[speciesIdx+1]):
+                        totalAvailableBiomass += biomassPerPredator[predatorEdgeToPreyEdge[edgeIdx]]
+
+                    if totalAvailableBiomass > 0:
+                        predationPressure[speciesIdx] = (biomass[speciesIdx] * requiredBiomassFactor[speciesIdx]
+                                                         / totalAvailableBiomass)
+                        hasPressure[speciesIdx] = True
+
+                    # truncate without converting to a (possibly overflowing) integer
+                    populationLimit = totalAvailableBiomass / requiredBiomassForIndividual[speciesIdx]
+                    newPopulationLimit = populationLimit - (populationLimit % 1.0)
+                    if newPopulationLimit < currentPopulation:
+                        popChangeFactor[speciesIdx] *= declineRateFactor[speciesIdx]
+                    elif newPopulationLimit > currentPopulation:
+                        popChangeFactor[speciesIdx] *= growthRateFactor[speciesIdx]
+                else:
+                    popChangeFactor[speciesIdx] *= growthRateFactor[speciesIdx]
+
+        # adjust growth for predator pressure
+        for speciesIdx in range(numSpecies):
+            if predatorIndptr[speciesIdx+1] > predatorIndptr[speciesIdx]:
+                totalPredationFactor = 0.0
+                grandTotalPredatorBiomass = totalPredatorBiomass[speciesIdx]
+                if grandTotalPredatorBiomass > 0:
+                    for edgeIdx in range(predatorIndptr[speciesIdx], predatorIndptr[speciesIdx+1]):
+                        predatorIdx = predatorIndices[edgeIdx]
+                        if preyEdgeHasPressure[edgeIdx] and hasPressure[predatorIdx]:
+                            totalPredationFactor += (predationPressure[predatorIdx] * biomass[predatorIdx]
+                                                     / grandTotalPredatorBiomass)
+
+                if totalPredationFactor < minPredationFactor:
+                    totalPredationFactor = minPredationFactor
+                if totalPredationFactor > maxPredationFactor:
+                    totalPredationFactor = maxPredationFactor
+
+                popChangeFactor[speciesIdx] /= totalPredationFactor
+
+        # produce new populations
+        for speciesIdx in range(numSpecies):
+            currentPopulation = population[speciesIdx]
+            unroundedPop = currentPopulation * popChangeFactor[speciesIdx]
+            newPop = unroundedPop - (unroundedPop % 1.0)
+
+            if newPop == currentPopulation:
+                if popChangeFactor[speciesIdx] > 1:
+                    newPop += 1
+                elif popChangeFactor[speciesIdx] < 1 and newPop > 0:
+                    newPop -= 1
+
+            newPopulation[speciesIdx] = newPop
+
+
+if JIT_AVAILABLE:
+    _compiledRunYearsKernel = njit(cache=True)(_runYearsKernel)
+else:
+    _compiledRunYearsKernel = None
+
+
+class PopSimKernel:
+    """Runs many years of the simulation in a single kernel call.
+
+    The kernel is JIT-compiled with numba when it is installed (and useJIT is
+    not False); otherwise the same kernel runs as plain Python over lists.
+    Populations are float64 whole numbers, as in VectorPopSimCalculator.
+
+    Migration (see MigrationModel) is drawn outside the kernel, so with
+    migration the kernel is called once per year rather than once per run.
+    """
+    def __init__(self, foodWebGraph=None,
+                 minPredationFactor=MIN_PREDATION_FACTOR, maxPredationFactor=MAX_PREDATION_FACTOR,
+                 useJIT=None, migrationSeed=None):
+        if foodWebGraph is None:
+            foodWebGraph = FOOD_WEB_GRAPH
+        if not isinstance(foodWebGraph, CompiledFoodWeb):
+            foodWebGraph = CompiledFoodWeb(foodWebGraph)
+
+        self.__foodWeb = foodWebGraph
+        self.__useJIT = JIT_AVAILABLE and useJIT is not False
+        self.__speciesIDList = foodWebGraph.getSpeciesIDList()
+
+        self.__migrationModel = None
+        if MigrationModel.hasMigration(foodWebGraph):
+            self.__migrationModel = MigrationModel(foodWebGraph, migrationSeed)
+
+        numSpecies = foodWebGraph.getNumSpecies()
+        predatorIndptr, predatorIndices = foodWebGraph.getPredatorCSR()
+        preyIndptr = foodWebGraph.getPreyCSR()[0]
+        numEdges = len(predatorIndices)
+        tables = [foodWebGraph.getSpeciesArray(INDIVIDUAL_BIOMASS),
+                  foodWebGraph.getSpeciesArray(REQUIRED_BIOMASS_FACTOR),
+                  foodWebGraph.getSpeciesArray(GROWTH_RATE_FACTOR),
+                  foodWebGraph.getSpeciesArray(DECLINE_RATE_FACTOR),
+                  foodWebGraph.getSpeciesArray(INDIVIDUAL_BIOMASS)
+                  * foodWebGraph.getSpeciesArray(REQUIRED_BIOMASS_FACTOR),
+                  predatorIndptr, predatorIndices,
+                  np.array(foodWebGraph.getPreyEdgeHasPressure(), dtype=np.bool_),
+                  preyIndptr,
+                  np.array(foodWebGraph.getPredatorEdgeToPreyEdge(), dtype=np.intp),
+                  float(minPredationFactor), float(maxPredationFactor),
+                  np.zeros(numSpecies), np.zeros(numSpecies), np.zeros(numEdges),
+                  np.zeros(numSpecies), np.zeros(numSpecies, dtype=np.bool_), np.zeros(numSpecies)]
+
+        if not self.__useJIT:
+            # plain Python is much quicker indexing lists than arrays
+            tables = [table.tolist() if isinstance(table, np.ndarray) else table for table in tables]
+        self.__kernelArgs = tables
+
+    def isCompiled(self):
+        return self.__useJIT
+
+    def getSpeciesIDList(self):
+        return list(self.__speciesIDList)
+
+    def getCompiledFoodWeb(self):
+        return self.__foodWeb
+
+    def getMigrationSeed(self):
+        """Returns the seed of the migration draws, or None if there is no migration"""
+        if self.__migrationModel is None:
+            return None
+        return self.__migrationModel.getSeed()
+
+    def doSimulation(self, prevYearPopulations, year=None):
+        prevYearArray = [prevYearPopulations[speciesID] for speciesID in self.__speciesIDList]
+        newYearArray = self.runYears(prevYearArray, 1, startYear=None if year is None else year-1)[1]
+        return {speciesID: int(population) for speciesID, population in zip(self.__speciesIDList, newYearArray)}
+
+    def doSimulationArray(self, prevYearPopulations, year=None):
+        return self.runYears(prevYearPopulations, 1, startYear=None if year is None else year-1)[1]
+
+    def runYears(self, initialPopulations, numYears, out=None, startYear=None):
+        """Runs numYears years from initialPopulations (ordered as getSpeciesIDList()).
+        Returns an array of shape (numYears+1, species), whose first row is the
+        initial populations; out may be given as a preallocated array for it.
+        startYear is the year of the initial populations, which picks the
+        migration draws; by default it follows on from the previous run.
+        """
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        if out is None:
+            out = np.empty((numYears+1, len(self.__speciesIDList)))
+        out[0] = initialPopulations
+
+        if self.__migrationModel is None:
+            self.__runKernel(out, numYears)
+        else:
+            for yearIdx in range(numYears):
+                self.__runKernel(out[yearIdx:yearIdx+2], 1)
+                year = None if startYear is None else startYear + yearIdx + 1
+                out[yearIdx+1] += self.__migrationModel.drawMigration(out[yearIdx+1], year)
+
+        if timing:
+            PHASE_TIMER.record("PopSimKernel.runYears", startTime)
+        return out
+
+    def __runKernel(self, populations, numYears):
+        """Fills populations[1:numYears+1] on from populations[0]"""
+        if self.__useJIT:
+            _compiledRunYearsKernel(populations, numYears, *self.__kernelArgs)
+        else:
+            populationLists = ([populations[0].tolist()]
+                               + [[0.0]*len(self.__speciesIDList) for yearIdx in range(numYears)])
+            _runYearsKernel(populationLists, numYears, *self.__kernelArgs)
+            populations[1:numYears+1] = populationLists[1:]
@@ -0,0 +1,49 @@
+#========================================================================
+#
+# renderscheduler.py - class to throttle view redraws to a maximum
+#   frame rate
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from time import perf_counter
+
+
+class RenderScheduler:
+    """Redraws views that have been marked dirty on the Tk idle loop, at most
+    maxFPS times a second, so that model updates never wait on rendering.
+    Views must provide a render() method.
+    """
+    def __init__(self, tkRoot, maxFPS=20):
+        self.__tkRoot = tkRoot
+        self.__minFrameInterval = 1.0 / maxFPS
+        self.__dirtyViews = {}
+        self.__renderPending = False
+        self.__lastRenderTime = None
+
+    def setMaxFPS(self, maxFPS):
+        self.__minFrameInterval = 1.0 / maxFPS
+
+    def markDirty(self, view):
+        """Requests a redraw of the view in the next frame"""
+        self.__dirtyViews[id(view)] = view
+        if not self.__renderPending:
+            self.__renderPending = True
+            self.__tkRoot.after(self.__getDelayToNextFrame(), lambda: self.__tkRoot.after_idle(self.__render))
+
+    def __getDelayToNextFrame(self):
+        if self.__lastRenderTime is None:
+            return 0
+        timeToNextFrame = self.__lastRenderTime + self.__minFrameInterval - perf_counter()
+        return max(0, int(timeToNextFrame * 1000))
+
+    def __render(self):
+        self.__lastRenderTime = perf_counter()
+        dirtyViews = list(self.__dirtyViews.values())
+        self.__dirtyViews = {}
+        self.__renderPending = False
+
+        for view in dirtyViews:
+            view.render()
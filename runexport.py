@@ -0,0 +1,243 @@
+#========================================================================
+#
+# runexport.py - functions and class to export simulation runs to (and
+#   import them from) compressed columnar files
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import json
+import zipfile
+
+import numpy as np
+
+from timeseriesmodel import TimeSeriesModel
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+RUN_FORMAT_VERSION = 1
+PARQUET_EXTENSION = ".parquet"
+PARQUET_METADATA_KEY = b"popsim"
+PARQUET_YEAR_COLUMN = "year"
+
+# members of an NPZ run archive
+NPZ_SERIES_IDS = "seriesIDs"
+NPZ_METADATA = "metadata"
+NPZ_CHUNK_PREFIX = "populations_"
+
+
+def isParquetPath(filePath):
+    return str(filePath).lower().endswith(PARQUET_EXTENSION)
+
+
+def makeRunMetadata(model, foodWebGraph=None, calculatorArgs=None):
+    """Returns the metadata stored with a run: its years, plus the food web and
+    calculator arguments used, so that the run can be resumed"""
+    return {
+        "formatVersion": RUN_FORMAT_VERSION,
+        "startYear": model.getFirstStoredYear(),
+        "endYear": model.getCurrentYear(),
+        "foodWebGraph": foodWebGraph,
+        "calculatorArgs": calculatorArgs or {}
+    }
+
+
+def exportRun(model, filePath, foodWebGraph=None, calculatorArgs=None):
+    """Writes every stored year of every series in the model to filePath, in
+    one go, as Parquet if the path ends in .parquet, otherwise as compressed NPZ"""
+    metadata = makeRunMetadata(model, foodWebGraph, calculatorArgs)
+    runWriter = _makeRunWriter(filePath, model.getSeriesIDList(), metadata)
+    runWriter.writeChunk(model.getValuesForYears(metadata["startYear"], metadata["endYear"]))
+    runWriter.close()
+
+
+def loadRun(filePath):
+    """Reads a run written by exportRun or RunExportStream.
+    Returns (seriesIDList, populations of shape (years, series), metadata)."""
+    if isParquetPath(filePath):
+        _checkParquetAvailable()
+        table = pyarrow.parquet.read_table(filePath)
+        metadata = json.loads(table.schema.metadata[PARQUET_METADATA_KEY].decode("utf-8"))
+        seriesIDList = [name for name in table.column_names if name != PARQUET_YEAR_COLUMN]
+        populations = np.column_stack([table.column(seriesID).to_numpy() for seriesID in seriesIDList])
+    else:
+        with np.load(filePath, allow_pickle=False) as runArchive:
+            metadata = json.loads(str(runArchive[NPZ_METADATA]))
+            seriesIDList = [str(seriesID) for seriesID in runArchive[NPZ_SERIES_IDS]]
+            chunkNames = sorted(name for name in runArchive.files if name.startswith(NPZ_CHUNK_PREFIX))
+            populations = np.concatenate([runArchive[name] for name in chunkNames])
+
+    if metadata.get("formatVersion") != RUN_FORMAT_VERSION:
+        raise ValueError(f"{filePath} has unsupported run format version {metadata.get('formatVersion')}")
+
+    # a streamed run may have been cut short, so go by the rows actually there
+    metadata["endYear"] = metadata["startYear"] + len(populations) - 1
+    return seriesIDList, populations, metadata
+
+
+def loadRunInfo(filePath):
+    """Reads just the series and metadata of a run (not its populations), e.g.
+    to check it can be imported.  Returns (seriesIDList, metadata); the
+    metadata's endYear may overstate a streamed run that was cut short."""
+    if isParquetPath(filePath):
+        _checkParquetAvailable()
+        schema = pyarrow.parquet.read_schema(filePath)
+        metadata = json.loads(schema.metadata[PARQUET_METADATA_KEY].decode("utf-8"))
+        seriesIDList = [name for name in schema.names if name != PARQUET_YEAR_COLUMN]
+    else:
+        with np.load(filePath, allow_pickle=False) as runArchive:
+            metadata = json.loads(str(runArchive[NPZ_METADATA]))
+            seriesIDList = [str(seriesID) for seriesID in runArchive[NPZ_SERIES_IDS]]
+
+    if metadata.get("formatVersion") != RUN_FORMAT_VERSION:
+        raise ValueError(f"{filePath} has unsupported run format version {metadata.get('formatVersion')}")
+    return seriesIDList, metadata
+
+
+def importRun(filePath, model=None, storage=None):
+    """Loads a run into a model, ready to carry on from its last year.
+    If model is given it must hold the same series as the run; its values are
+    replaced.  Otherwise a new model is made (on storage, if given).
+    Returns (model, metadata)."""
+    seriesIDList, populations, metadata = loadRun(filePath)
+
+    if model is None:
+        model = TimeSeriesModel(storage)
+        model.reset(startYear=metadata["startYear"])
+        for seriesID in seriesIDList:
+            model.addTimeSeries(seriesID)
+    elif sorted(model.getSeriesIDList()) != sorted(seriesIDList):
+        raise ValueError(f"{filePath} holds different series to the model")
+
+    # fill in all the years with a single bulk append
+    with model.batchUpdate():
+        model.erase(startYear=metadata["startYear"])
+        model.setCurrentValues({seriesID: populations[0, idx] for idx, seriesID in enumerate(seriesIDList)})
+        model.extendSeries({seriesID: populations[1:, idx] for idx, seriesID in enumerate(seriesIDList)})
+
+    return model, metadata
+
+
+class RunExportStream:
+    """Streams a model's years to a file in chunks while a run is going.
+
+    Years are written chunkYears at a time, each chunk in one bulk write (an
+    NPZ member or a Parquet row group).  The model's current year is held
+    back until close(), as it can still be overridden.  If years that have
+    already been written change (e.g. the model is erased or reset), the
+    file is started again from the model's stored history.
+
+    An NPZ file can be read back (up to the last chunk written) while the
+    stream is still open; a Parquet file only once it has been closed.
+    """
+    def __init__(self, model, filePath, foodWebGraph=None, calculatorArgs=None, chunkYears=1024):
+        self.__model = model
+        self.__filePath = filePath
+        self.__foodWebGraph = foodWebGraph
+        self.__calculatorArgs = calculatorArgs
+        self.__chunkYears = max(1, chunkYears)
+        self.__runWriter = None
+        self.__lastWrittenYear = None
+        self.__closed = False
+
+        self.__restart()
+        # only hear about years from the (not yet written) current year onwards
+        for seriesID in self.__model.getSeriesIDList():
+            self.__model.subscribeToSeriesDeltas(seriesID, self, sinceYear=self.__lastWrittenYear + 1)
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        if self.__closed:
+            return
+
+        if deltaData["reset"] or deltaData["fromYear"] <= self.__lastWrittenYear:
+            self.__restart()
+        elif self.__model.getCurrentYear() - 1 - self.__lastWrittenYear >= self.__chunkYears:
+            self.__writeYears(self.__model.getCurrentYear() - 1)
+
+    def timeSeriesBatchUpdated(self, batchData):
+        for deltaData in batchData["deltas"].values():
+            self.timeSeriesDeltaUpdated(deltaData)
+
+    def close(self):
+        """Writes the remaining years (including the current one) and closes the file"""
+        if not self.__closed:
+            self.__writeYears(self.__model.getCurrentYear())
+            self.__runWriter.close()
+            self.__closed = True
+
+    def __restart(self):
+        if self.__runWriter is not None:
+            self.__runWriter.close()
+
+        metadata = makeRunMetadata(self.__model, self.__foodWebGraph, self.__calculatorArgs)
+        self.__runWriter = _makeRunWriter(self.__filePath, self.__model.getSeriesIDList(), metadata)
+        self.__lastWrittenYear = metadata["startYear"] - 1
+        self.__writeYears(self.__model.getCurrentYear() - 1)
+
+    def __writeYears(self, lastYear):
+        if lastYear > self.__lastWrittenYear:
+            self.__runWriter.writeChunk(self.__model.getValuesForYears(self.__lastWrittenYear + 1, lastYear))
+            self.__lastWrittenYear = lastYear
+
+
+def _checkParquetAvailable():
+    if not PARQUET_AVAILABLE:
+        raise ValueError("Parquet files need pyarrow, which is not installed")
+
+
+def _makeRunWriter(filePath, seriesIDList, metadata):
+    if isParquetPath(filePath):
+        return _ParquetRunWriter(filePath, seriesIDList, metadata)
+    return _NPZRunWriter(filePath, seriesIDList, metadata)
+
+
+class _NPZRunWriter:
+    """Writes a run as a compressed NPZ archive, one member per chunk of years"""
+    def __init__(self, filePath, seriesIDList, metadata):
+        self.__filePath = filePath
+        self.__numChunks = 0
+        with zipfile.ZipFile(filePath, "w", compression=zipfile.ZIP_DEFLATED) as runArchive:
+            self.__writeArray(runArchive, NPZ_SERIES_IDS, np.array(seriesIDList, dtype=str))
+            self.__writeArray(runArchive, NPZ_METADATA, np.array(json.dumps(metadata)))
+
+    def writeChunk(self, populations):
+        with zipfile.ZipFile(self.__filePath, "a", compression=zipfile.ZIP_DEFLATED) as runArchive:
+            self.__writeArray(runArchive, f"{NPZ_CHUNK_PREFIX}{self.__numChunks:08d}",
+                              np.ascontiguousarray(populations))
+        self.__numChunks += 1
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def __writeArray(runArchive, name, array):
+        with runArchive.open(name + ".npy", "w", force_zip64=True) as memberFile:
+            np.lib.format.write_array(memberFile, array, allow_pickle=False)
+
+
+class _ParquetRunWriter:
+    """Writes a run as a Parquet file, one row group per chunk of years"""
+    def __init__(self, filePath, seriesIDList, metadata):
+        _checkParquetAvailable()
+        self.__seriesIDList = seriesIDList
+        self.__nextYear = metadata["startYear"]
+        fields = [pyarrow.field(PARQUET_YEAR_COLUMN, pyarrow.int64())]
+        fields += [pyarrow.field(seriesID, pyarrow.float64()) for seriesID in seriesIDList]
+        self.__schema = pyarrow.schema(fields, metadata={PARQUET_METADATA_KEY: json.dumps(metadata)})
+        self.__parquetWriter = pyarrow.parquet.ParquetWriter(filePath, self.__schema, compression="zstd")
+
+    def writeChunk(self, populations):
+        years = np.arange(self.__nextYear, self.__nextYear + len(populations), dtype=np.int64)
+        columns = [years] + [np.ascontiguousarray(populations[:, idx]) for idx in range(len(self.__seriesIDList))]
+        self.__parquetWriter.write_table(pyarrow.Table.from_arrays(columns, schema=self.__schema))
+        self.__nextYear += len(populations)
+
+    def close(self):
+        self.__parquetWriter.close()
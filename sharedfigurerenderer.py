@@ -0,0 +1,121 @@
+#========================================================================
+#
+# sharedfigurerenderer.py - class to draw many time series plots into a
+#   single matplotlib figure
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from time import perf_counter
+
+from phasetimer import PHASE_TIMER
+from timeseriesplot import TimeSeriesPlot
+
+# how the plots share the figure
+SUBPLOTS = "Subplots"
+OVERLAID = "Overlaid"
+
+
+class SharedFigureRenderer:
+    """Draws a fixed number of TimeSeriesPlot slots into one figure, either
+    as a grid of subplots (SUBPLOTS) or as normalised lines overlaid on one
+    axes (OVERLAID).  Overlaid lines are each scaled to fit (their peaks
+    landing between half and all of the axes' height), not to their exact
+    maximum, so that the scales change, and the figure is redrawn, rarely.
+
+    Each render updates every shown plot, then either restores the one
+    cached background and draws every line over it, or (if any plot's axis
+    limits changed) redraws the whole figure.  Either way the figure goes to
+    the canvas in a single blit, rather than one per plot.
+
+    Needs no Tk, so runs on any Agg-based canvas.
+    """
+    FONT_SIZE = 18
+
+    def __init__(self, figure, canvas, numSlots, numColumns, mode=SUBPLOTS):
+        if mode not in (SUBPLOTS, OVERLAID):
+            raise ValueError(f"Unknown shared figure mode '{mode}'")
+
+        self.__figure = figure
+        self.__canvas = canvas
+        self.__mode = mode
+        self.__background = None
+
+        self.__plots = []
+        self.__axesList = []
+        if mode == SUBPLOTS:
+            numRows = -(-numSlots // numColumns)
+            for slotIdx in range(numSlots):
+                axes = self.__figure.add_subplot(numRows, numColumns, slotIdx+1)
+                self.__axesList.append(axes)
+                self.__plots.append(TimeSeriesPlot(figure, canvas, None, axes))
+        else:
+            self.__axes = self.__figure.add_subplot(1, 1, 1)
+            self.__axes.set_title("Populations (each scaled to fit)", fontsize=SharedFigureRenderer.FONT_SIZE)
+            self.__axes.set_xlabel("Year", fontsize=SharedFigureRenderer.FONT_SIZE)
+            self.__axes.set_ylabel("Relative population", fontsize=SharedFigureRenderer.FONT_SIZE)
+            for slotIdx in range(numSlots):
+                self.__plots.append(TimeSeriesPlot(figure, canvas, None, self.__axes, normalise=True))
+
+        self.__slotsShown = [True] * numSlots
+        for slotIdx in range(numSlots):
+            self.setSlotShown(slotIdx, False)
+
+    def getMode(self):
+        return self.__mode
+
+    def getNumSlots(self):
+        return len(self.__plots)
+
+    def getPlot(self, slotIdx):
+        return self.__plots[slotIdx]
+
+    def setSlotShown(self, slotIdx, shown):
+        """Shows or hides a slot's plot (and, for subplots, its axes)"""
+        if shown == self.__slotsShown[slotIdx]:
+            return
+
+        self.__slotsShown[slotIdx] = shown
+        self.__plots[slotIdx].setVisible(shown)
+        if self.__mode == SUBPLOTS:
+            self.__axesList[slotIdx].set_visible(shown)
+        self.invalidateBackground()
+
+    def invalidateBackground(self):
+        """Makes the next render() redraw everything, e.g. after the figure is resized"""
+        self.__background = None
+
+    def render(self):
+        """Re-plots every shown slot, pushing the figure to the canvas once"""
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        shownPlots = [plot for plot, shown in zip(self.__plots, self.__slotsShown) if shown]
+        redrawNeeded = False
+        for plot in shownPlots:
+            redrawNeeded = plot.prepareRender() or redrawNeeded
+
+        if redrawNeeded or self.__background is None:
+            if self.__mode == OVERLAID:
+                self.__updateLegend(shownPlots)
+            self.__canvas.draw()
+            self.__background = self.__canvas.copy_from_bbox(self.__figure.bbox)
+        else:
+            self.__canvas.restore_region(self.__background)
+
+        for plot in shownPlots:
+            plot.drawLine()
+        self.__canvas.blit(self.__figure.bbox)
+
+        if timing:
+            PHASE_TIMER.record("SharedFigureRenderer.render", startTime)
+
+    def __updateLegend(self, shownPlots):
+        legend = self.__axes.get_legend()
+        if legend is not None:
+            legend.remove()
+        if len(shownPlots) > 0:
+            self.__axes.legend(handles=[plot.getLine() for plot in shownPlots], loc='upper left')
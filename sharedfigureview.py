@@ -0,0 +1,124 @@
+#========================================================================
+#
+# sharedfigureview.py - class to show many time series graphs in one
+#   shared figure
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import tkinter as tk
+
+from baseview import BaseView
+
+
+class SharedFigureView(BaseView):
+    """One Tk canvas showing a SharedFigureRenderer's figure, whose slots are
+    each driven by a TimeSeriesGraphView acting as a facade onto it (see
+    addSlotGraph).  However many slots are updated, each frame is one render
+    and one image pushed to Tk.
+
+    As with TimeSeriesGraphView, the figure is only created (and matplotlib
+    only imported) once the view is first shown, and resizes are debounced.
+    """
+    DPI = 72
+    RESIZE_DEBOUNCE_DELAY = 150
+
+    def __init__(self, tkRoot, numSlots, numColumns, mode, renderScheduler=None):
+        """mode is sharedfigurerenderer's SUBPLOTS or OVERLAID"""
+        super().__init__(tkRoot)
+        self.__tkRoot = tkRoot
+        self.__numSlots = numSlots
+        self.__numColumns = numColumns
+        self.__mode = mode
+        self.__renderScheduler = renderScheduler
+
+        # the graph views driving each slot
+        self.__slotGraphs = [None] * numSlots
+
+        # create the canvas on which to draw the figure
+        self.__graphCanvas = tk.Canvas(self.getWidget())
+        self.__graphCanvas.pack(fill=tk.BOTH)
+
+        self.getWidget().bind("<Configure>", lambda event: self.widgetResized(event))
+
+        # the matplotlib figure, canvas and renderer, created when first shown
+        self.__figure = None
+        self.__graph = None
+        self.__renderer = None
+        self.__creationPending = False
+
+        # the latest resize event, applied once resizing stops
+        self.__resizeEvent = None
+        self.__resizeAfterID = None
+
+    def getNumSlots(self):
+        return self.__numSlots
+
+    def addSlotGraph(self, slotIdx, graphView):
+        """Registers the graph view to get sharedFigureCreated(plot) when its slot's plot is made"""
+        self.__slotGraphs[slotIdx] = graphView
+        if self.__renderer is not None:
+            graphView.sharedFigureCreated(self.__renderer.getPlot(slotIdx))
+
+    def setSlotShown(self, slotIdx, shown):
+        if self.__renderer is not None:
+            self.__renderer.setSlotShown(slotIdx, shown)
+
+    def markDirty(self):
+        """Requests a render, at the scheduler's next frame if there is one"""
+        if self.__renderScheduler is None:
+            self.render()
+        else:
+            self.__renderScheduler.markDirty(self)
+
+    def render(self):
+        if self.__renderer is not None:
+            self.__renderer.render()
+
+    def widgetResized(self, event):
+        """Keeps the latest size, to apply once the resizing stops"""
+        if event.width <= 1 or event.height <= 1:
+            return
+
+        self.__resizeEvent = event
+        if self.__renderer is None:
+            if not self.__creationPending:
+                # let the window finish appearing (and any other events through) first
+                self.__creationPending = True
+                self.__tkRoot.after(0, lambda: self.__tkRoot.after_idle(self.__createFigure))
+            return
+
+        if self.__resizeAfterID is not None:
+            self.__tkRoot.after_cancel(self.__resizeAfterID)
+        self.__resizeAfterID = self.__tkRoot.after(SharedFigureView.RESIZE_DEBOUNCE_DELAY, self.__applyResize)
+
+    def __createFigure(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from sharedfigurerenderer import SharedFigureRenderer
+
+        self.__creationPending = False
+
+        # create the matplotlib link
+        self.__figure = Figure(dpi=SharedFigureView.DPI, layout='constrained')
+        self.__graph = FigureCanvasTkAgg(self.__figure, self.__graphCanvas)
+        self.__renderer = SharedFigureRenderer(self.__figure, self.__graph, self.__numSlots, self.__numColumns,
+                                               self.__mode)
+        self.__graph.get_tk_widget().pack()
+
+        for slotIdx, graphView in enumerate(self.__slotGraphs):
+            if graphView is not None:
+                graphView.sharedFigureCreated(self.__renderer.getPlot(slotIdx))
+
+        self.__applyResize()
+
+    def __applyResize(self):
+        self.__resizeAfterID = None
+        event = self.__resizeEvent
+        self.__figure.set_size_inches(event.width/SharedFigureView.DPI, event.height/SharedFigureView.DPI)
+        self.__graph.get_tk_widget().config(width=event.width, height=event.height)
+        self.__graph.resize(event)
+        self.__renderer.invalidateBackground()
+        self.render()
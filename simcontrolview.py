@@ -8,16 +8,25 @@
 # ========================================================================
 
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
 import webbrowser
 from os import path
 
 from baseview import BaseView
 
+RUN_FILE_TYPES = [("Compressed NumPy runs", "*.npz"), ("Parquet runs", "*.parquet")]
+
+DEFAULT_ENSEMBLE_REPLICATES = 200
+DEFAULT_ENSEMBLE_YEARS = 100
+
 
 class SimControlView(BaseView):
     PADDING = 2
     FONT = ('Arial', 14)
+    STATS_FONT = ('Courier', 10)
+    # ms delay between each refresh of the stats overlay
+    STATS_REFRESH_DELAY = 500
+    RUN_ENSEMBLE_TEXT = "Run ensemble"
 
     def __init__(self, tkRoot, model, controller):
         super().__init__(tkRoot)
@@ -97,8 +106,74 @@ class SimControlView(BaseView):
         licenceLabel.bind("<Button-1>", lambda e: webbrowser.open_new("https://icons8.com"))
         licenceLabel.grid(row=4, column=0, columnspan=6, stick='NEWS')
 
-        # subscribe to state changes
+        # add the per-phase timing stats widgets
+        self.__showStatsVar = tk.BooleanVar(value=False)
+        showStatsButton = tk.Checkbutton(self.getWidget(), text="Show stats",
+                                         variable=self.__showStatsVar,
+                                         command=lambda: self.showStatsChanged())
+        showStatsButton.grid(row=5, column=0, columnspan=2, stick='NEWS')
+
+        resetStatsButton = tk.Button(self.getWidget(), text="Reset stats",
+                                     command=lambda: self.resetStats())
+        resetStatsButton.grid(row=5, column=2, columnspan=2, stick='NEWS')
+
+        dumpStatsButton = tk.Button(self.getWidget(), text="Dump stats...",
+                                    command=lambda: self.dumpStats())
+        dumpStatsButton.grid(row=5, column=4, columnspan=2, stick='NEWS')
+
+        self.__statsVar = tk.StringVar()
+        self.__statsLabel = tk.Label(self.getWidget(), textvariable=self.__statsVar,
+                                     justify=tk.LEFT, anchor=tk.NW,
+                                     font=SimControlView.STATS_FONT)
+        self.__statsAfterID = None
+
+        # add the run export/import widgets
+        exportButton = tk.Button(self.getWidget(), text="Export run...",
+                                 command=lambda: self.exportRun())
+        exportButton.grid(row=7, column=0, columnspan=3, stick='NEWS')
+
+        importButton = tk.Button(self.getWidget(), text="Import run...",
+                                 command=lambda: self.importRun())
+        importButton.grid(row=7, column=3, columnspan=3, stick='NEWS')
+
+        # add the rewind/branch widgets
+        rewindLabel = tk.Label(self.getWidget(), text="Rewind to:", justify=tk.RIGHT,
+                               padx=SimControlView.PADDING, pady=SimControlView.PADDING)
+        rewindLabel.grid(row=8, column=0, columnspan=2, stick='NEWS')
+
+        self.__rewindYearEntry = tk.Entry(self.getWidget(), width=6, justify='center')
+        self.__rewindYearEntry.bind("<Return>", lambda e: self.rewindSim())
+        self.__rewindYearEntry.grid(row=8, column=2, columnspan=2, stick='EW')
+
+        rewindButton = tk.Button(self.getWidget(), text="Rewind",
+                                 command=lambda: self.rewindSim())
+        rewindButton.grid(row=8, column=4, stick='NEWS')
+
+        self.__branchButton = tk.Button(self.getWidget(), text="Last branch",
+                                        state='disabled',
+                                        command=lambda: self.restoreBranch())
+        self.__branchButton.grid(row=8, column=5, stick='NEWS')
+
+        # add the ensemble widgets
+        ensembleLabel = tk.Label(self.getWidget(), text="Replicates/years:", justify=tk.RIGHT,
+                                 padx=SimControlView.PADDING, pady=SimControlView.PADDING)
+        ensembleLabel.grid(row=9, column=0, columnspan=2, stick='NEWS')
+
+        self.__ensembleReplicatesEntry = tk.Entry(self.getWidget(), width=6, justify='center')
+        self.__ensembleReplicatesEntry.insert(0, str(DEFAULT_ENSEMBLE_REPLICATES))
+        self.__ensembleReplicatesEntry.grid(row=9, column=2, stick='EW')
+
+        self.__ensembleYearsEntry = tk.Entry(self.getWidget(), width=6, justify='center')
+        self.__ensembleYearsEntry.insert(0, str(DEFAULT_ENSEMBLE_YEARS))
+        self.__ensembleYearsEntry.grid(row=9, column=3, stick='EW')
+
+        self.__ensembleButton = tk.Button(self.getWidget(), text=SimControlView.RUN_ENSEMBLE_TEXT,
+                                          command=lambda: self.runEnsemble())
+        self.__ensembleButton.grid(row=9, column=4, columnspan=2, stick='NEWS')
+
+        # subscribe to state changes and ensemble progress
         self.__controller.subscribeToStateChanges(self)
+        self.__controller.subscribeToEnsembleProgress(self)
 
         # subscribe to year changes
         self.__model.subscribeToYearChange(self)
@@ -130,3 +205,81 @@ class SimControlView(BaseView):
 
     def pauseSim(self):
         self.__controller.pauseUnpauseSim()
+
+    def showStatsChanged(self):
+        showStats = self.__showStatsVar.get()
+        self.__controller.setPhaseTimingEnabled(showStats)
+        if showStats:
+            self.__statsLabel.grid(row=6, column=0, columnspan=6, stick='NEWS')
+            self.refreshStats()
+        else:
+            self.__statsLabel.grid_remove()
+            if self.__statsAfterID is not None:
+                self.getWidget().after_cancel(self.__statsAfterID)
+                self.__statsAfterID = None
+
+    def refreshStats(self):
+        self.__statsVar.set(self.__controller.getPhaseTimingText())
+        self.__statsAfterID = self.getWidget().after(SimControlView.STATS_REFRESH_DELAY,
+                                                     lambda: self.refreshStats())
+
+    def resetStats(self):
+        self.__controller.resetPhaseTimings()
+        self.__statsVar.set("")
+
+    def dumpStats(self):
+        filePath = filedialog.asksaveasfilename(defaultextension=".json",
+                                                filetypes=[("JSON files", "*.json")],
+                                                title="Save timing stats")
+        if filePath:
+            self.__controller.dumpPhaseTimings(filePath)
+
+    def exportRun(self):
+        filePath = filedialog.asksaveasfilename(defaultextension=".npz",
+                                                filetypes=RUN_FILE_TYPES,
+                                                title="Export run")
+        if filePath:
+            self.__controller.exportRun(filePath)
+
+    def importRun(self):
+        filePath = filedialog.askopenfilename(filetypes=RUN_FILE_TYPES,
+                                              title="Import run")
+        if filePath:
+            self.__controller.importRun(filePath)
+
+    def rewindSim(self):
+        try:
+            year = int(self.__rewindYearEntry.get())
+        except ValueError:
+            self.__rewindYearEntry.delete(0, tk.END)
+            return
+
+        self.__controller.rewindToYear(year)
+        self.__updateBranchButton()
+
+    def runEnsemble(self):
+        try:
+            numReplicates = int(self.__ensembleReplicatesEntry.get())
+            numYears = int(self.__ensembleYearsEntry.get())
+        except ValueError:
+            return
+
+        if numReplicates > 0 and numYears > 0:
+            self.__controller.runEnsemble(numReplicates, numYears)
+
+    def ensembleProgressUpdated(self, progressData):
+        if progressData["running"]:
+            self.__ensembleButton.config(text=f"{progressData['replicatesRun']}/{progressData['numReplicates']}",
+                                         state='disabled')
+        else:
+            self.__ensembleButton.config(text=SimControlView.RUN_ENSEMBLE_TEXT, state='normal')
+
+    def restoreBranch(self):
+        self.__controller.restoreBranch()
+        self.__updateBranchButton()
+
+    def __updateBranchButton(self):
+        if len(self.__controller.getBranchEndYears()) > 0:
+            self.__branchButton.config(state='normal')
+        else:
+            self.__branchButton.config(state='disabled')
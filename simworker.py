@@ -0,0 +1,126 @@
+#========================================================================
+#
+# simworker.py - class to run the population calculations in a
+#   background thread
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import queue
+import threading
+
+RUN_COMMAND = "Run"
+PAUSE_COMMAND = "Pause"
+SET_DELAY_COMMAND = "Set delay"
+STOP_COMMAND = "Stop"
+
+
+class SimWorker:
+    """Runs a calculator in a background thread, one year after another,
+    pushing (epoch, populations) results onto a bounded queue.
+
+    Commands are applied strictly in the order they were sent, and only
+    between years.  Each run is tagged with an epoch number chosen by the
+    sender, so the consumer can discard results from before a pause, reset or
+    override even if they were already queued.  When the result queue is
+    full the worker waits, so it never gets more than the queue size ahead of
+    the consumer.
+    """
+    def __init__(self, calculator, maxQueuedYears=64):
+        self.__calculator = calculator
+        self.__commands = queue.Queue()
+        self.__results = queue.Queue(maxsize=maxQueuedYears)
+        self.__thread = None
+
+        # worker thread state
+        self.__epoch = None
+        self.__populations = None
+        self.__year = None
+        self.__yearDelay = 0
+
+    def start(self):
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__runThread, daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stops the worker thread, waiting for it to finish"""
+        if self.__thread is not None:
+            self.__commands.put((STOP_COMMAND,))
+            self.__thread.join()
+            self.__thread = None
+
+    def runFrom(self, epoch, populations, year=None):
+        """Starts (or restarts) calculating years on from the given populations
+        (of year, if given, which the calculator uses to pick its migration)"""
+        self.__commands.put((RUN_COMMAND, epoch, dict(populations), year))
+
+    def pause(self):
+        self.__commands.put((PAUSE_COMMAND,))
+
+    def setYearDelay(self, yearDelay):
+        """Sets the minimum time, in seconds, between calculated years"""
+        self.__commands.put((SET_DELAY_COMMAND, yearDelay))
+
+    def getResults(self, maxResults):
+        """Returns up to maxResults queued (epoch, populations) results without waiting"""
+        results = []
+        try:
+            while len(results) < maxResults:
+                results.append(self.__results.get_nowait())
+        except queue.Empty:
+            pass
+        return results
+
+    def __runThread(self):
+        running = True
+        while running:
+            # wait for a command while paused, or for the year delay while running
+            try:
+                if self.__populations is None:
+                    command = self.__commands.get()
+                else:
+                    command = self.__commands.get(timeout=self.__yearDelay)
+                running = self.__applyCommand(command)
+                continue
+            except queue.Empty:
+                pass
+
+            if self.__year is not None:
+                self.__year += 1
+            self.__populations = self.__calculator.doSimulation(self.__populations, self.__year)
+            running = self.__queueResult((self.__epoch, self.__populations))
+
+    def __queueResult(self, result):
+        """Waits for space in the result queue, still handling commands meanwhile"""
+        while True:
+            try:
+                self.__results.put(result, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+
+            try:
+                command = self.__commands.get_nowait()
+            except queue.Empty:
+                continue
+
+            if not self.__applyCommand(command):
+                return False
+            if self.__populations is None or self.__epoch != result[0]:
+                # the result has been superseded
+                return True
+
+    def __applyCommand(self, command):
+        """Applies a command, returning False if the thread should stop"""
+        if command[0] == RUN_COMMAND:
+            self.__epoch, self.__populations, self.__year = command[1], command[2], command[3]
+        elif command[0] == PAUSE_COMMAND:
+            self.__populations = None
+        elif command[0] == SET_DELAY_COMMAND:
+            self.__yearDelay = command[1]
+        elif command[0] == STOP_COMMAND:
+            return False
+        return True
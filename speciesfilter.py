@@ -0,0 +1,83 @@
+#========================================================================
+#
+# speciesfilter.py - class to hold which species the species views show
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+
+class SpeciesFilter:
+    """The species picked out by a search text (matched anywhere in the
+    species name, ignoring case) and, optionally, a trophic level.
+
+    Views that show one widget per species show only the matching ones, and
+    subscribe to be told when the match changes.
+    """
+    def __init__(self, speciesIDList, trophicLevels):
+        """trophicLevels is {speciesID: level} (None where there is no level)"""
+        self.__speciesIDList = list(speciesIDList)
+        self.__trophicLevels = dict(trophicLevels)
+        self.__searchText = ""
+        self.__trophicLevel = None
+        self.__matchingSpeciesIDList = list(self.__speciesIDList)
+        self.__filterSubscribers = []
+
+    def subscribeToFilterChanges(self, subscriber):
+        """registers the subscriber to get speciesFilterChanged(...) calls when the matching species change"""
+        self.__filterSubscribers.append(subscriber)
+
+    def getSpeciesIDList(self):
+        return list(self.__speciesIDList)
+
+    def getTrophicLevelChoices(self):
+        """Returns the trophic levels of the species, lowest first"""
+        return sorted({level for level in self.__trophicLevels.values() if level is not None})
+
+    def getSpeciesTrophicLevel(self, speciesID):
+        return self.__trophicLevels.get(speciesID)
+
+    def getSearchText(self):
+        return self.__searchText
+
+    def getTrophicLevel(self):
+        """Returns the trophic level the species must be at, or None for any"""
+        return self.__trophicLevel
+
+    def getMatchingSpeciesIDList(self):
+        return list(self.__matchingSpeciesIDList)
+
+    def setSpecies(self, speciesIDList, trophicLevels):
+        self.__speciesIDList = list(speciesIDList)
+        self.__trophicLevels = dict(trophicLevels)
+        if self.__trophicLevel not in self.getTrophicLevelChoices():
+            self.__trophicLevel = None
+        self.__updateMatches(force=True)
+
+    def setSearchText(self, searchText):
+        self.__searchText = searchText
+        self.__updateMatches()
+
+    def setTrophicLevel(self, trophicLevel):
+        self.__trophicLevel = trophicLevel
+        self.__updateMatches()
+
+    def __updateMatches(self, force=False):
+        searchText = self.__searchText.strip().lower()
+        matchingSpeciesIDList = [speciesID for speciesID in self.__speciesIDList
+                                 if searchText in str(speciesID).lower()
+                                 and (self.__trophicLevel is None
+                                      or self.__trophicLevels.get(speciesID) == self.__trophicLevel)]
+        if force or matchingSpeciesIDList != self.__matchingSpeciesIDList:
+            self.__matchingSpeciesIDList = matchingSpeciesIDList
+            self.__informFilterSubscribers()
+
+    def __informFilterSubscribers(self):
+        filterData = {
+            "searchText": self.__searchText,
+            "trophicLevel": self.__trophicLevel,
+            "speciesIDList": self.getMatchingSpeciesIDList()
+        }
+        for subscriber in self.__filterSubscribers:
+            subscriber.speciesFilterChanged(filterData)
@@ -0,0 +1,125 @@
+#========================================================================
+#
+# speciesgraphgridview.py - class to show a page at a time of the graphs
+#   of many species
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import tkinter as tk
+
+from baseview import BaseView
+from speciesfilter import SpeciesFilter
+from sharedfigurerenderer import SUBPLOTS, OVERLAID
+from sharedfigureview import SharedFigureView
+from timeseriesgraphview import TimeSeriesGraphView
+
+# how the graphs are drawn: a figure each, or all in one shared figure
+SEPARATE = "Separate"
+GRAPH_MODES = [SEPARATE, SUBPLOTS, OVERLAID]
+
+
+class SpeciesGraphGridView(BaseView):
+    """Grid of graphs of the species matching a SpeciesFilter, a page at a time.
+
+    Only numRows x numColumns TimeSeriesGraphViews are ever made, whatever the
+    number of species: changing page (or filter) switches them to show other
+    species, and any not needed on the last page are hidden.  So the figures
+    kept, and the work done for each model update, are set by the page size.
+
+    With graphMode SUBPLOTS or OVERLAID, the graphs are instead all drawn in
+    one SharedFigureView covering the grid (as subplots, or as normalised
+    lines on one axes), so each frame is one render and one blit in all.
+    """
+    PADDING = 0
+    FONT = ('Arial', 12)
+
+    def __init__(self, tkRoot, model, controller, speciesFilter=None, renderScheduler=None,
+                 numRows=3, numColumns=4, graphMode=SEPARATE):
+        """speciesFilter defaults to one of all the model's series"""
+        super().__init__(tkRoot)
+        if graphMode not in GRAPH_MODES:
+            raise ValueError(f"Unknown graph mode '{graphMode}'")
+        if speciesFilter is None:
+            speciesFilter = SpeciesFilter(model.getSeriesIDList(), controller.getSpeciesTrophicLevels())
+
+        self.__speciesFilter = speciesFilter
+        self.__pageSize = numRows * numColumns
+        self.__speciesIDList = speciesFilter.getMatchingSpeciesIDList()
+        self.__pageIdx = 0
+
+        # the shared figure, if the graphs are drawn in one
+        self.__sharedFigureView = None
+        if graphMode != SEPARATE:
+            self.__sharedFigureView = SharedFigureView(self.getWidget(), self.__pageSize, numColumns, graphMode,
+                                                       renderScheduler)
+            self.__sharedFigureView.getWidget().grid(row=0, column=0, rowspan=numRows, columnspan=numColumns,
+                                                     sticky='NEWS')
+
+        # the pool of graphs
+        self.__graphViews = []
+        for slotIdx in range(self.__pageSize):
+            graphView = TimeSeriesGraphView(self.getWidget(), model, None, controller, renderScheduler,
+                                            self.__sharedFigureView, slotIdx)
+            if self.__sharedFigureView is None:
+                graphView.getWidget().grid(row=slotIdx // numColumns, column=slotIdx % numColumns,
+                                           padx=SpeciesGraphGridView.PADDING, pady=SpeciesGraphGridView.PADDING,
+                                           sticky='NEWS')
+            self.__graphViews.append(graphView)
+        for row in range(numRows):
+            self.getWidget().rowconfigure(row, weight=1)
+        for column in range(numColumns):
+            self.getWidget().columnconfigure(column, weight=1)
+
+        # add the page controls
+        pageControls = tk.Frame(self.getWidget())
+        pageControls.grid(row=numRows, column=0, columnspan=numColumns)
+        self.__prevButton = tk.Button(pageControls, text="< Prev", font=SpeciesGraphGridView.FONT,
+                                      command=lambda: self.showPage(self.__pageIdx - 1))
+        self.__prevButton.grid(row=0, column=0)
+        self.__pageVar = tk.StringVar()
+        pageLabel = tk.Label(pageControls, textvariable=self.__pageVar, font=SpeciesGraphGridView.FONT)
+        pageLabel.grid(row=0, column=1)
+        self.__nextButton = tk.Button(pageControls, text="Next >", font=SpeciesGraphGridView.FONT,
+                                      command=lambda: self.showPage(self.__pageIdx + 1))
+        self.__nextButton.grid(row=0, column=2)
+
+        self.__bindGraphs()
+
+        # subscribe to filter changes
+        self.__speciesFilter.subscribeToFilterChanges(self)
+
+    def getNumPages(self):
+        return max(1, -(-len(self.__speciesIDList) // self.__pageSize))
+
+    def speciesFilterChanged(self, filterData):
+        self.__speciesIDList = filterData["speciesIDList"]
+        self.__pageIdx = 0
+        self.__bindGraphs()
+
+    def showPage(self, pageIdx):
+        pageIdx = max(0, min(pageIdx, self.getNumPages() - 1))
+        if pageIdx != self.__pageIdx:
+            self.__pageIdx = pageIdx
+            self.__bindGraphs()
+
+    def __bindGraphs(self):
+        """Points each graph at the species now on its place in the page"""
+        firstSpeciesIdx = self.__pageIdx * self.__pageSize
+        pageSpeciesIDs = self.__speciesIDList[firstSpeciesIdx:firstSpeciesIdx + self.__pageSize]
+
+        for slotIdx, graphView in enumerate(self.__graphViews):
+            seriesID = pageSpeciesIDs[slotIdx] if slotIdx < len(pageSpeciesIDs) else None
+            graphView.setSeriesID(seriesID)
+            if self.__sharedFigureView is not None:
+                continue
+            if seriesID is None:
+                graphView.getWidget().grid_remove()
+            else:
+                graphView.getWidget().grid()
+
+        self.__pageVar.set(f"Page {self.__pageIdx + 1} of {self.getNumPages()}")
+        self.__prevButton.config(state='normal' if self.__pageIdx > 0 else 'disabled')
+        self.__nextButton.config(state='normal' if self.__pageIdx < self.getNumPages() - 1 else 'disabled')
@@ -8,20 +8,43 @@
 # ========================================================================
 
 import tkinter as tk
+from tkinter import ttk
+from time import perf_counter
 
 from baseview import BaseView
+from speciesfilter import SpeciesFilter
+from phasetimer import PHASE_TIMER
 
 
 class SpeciesListView(BaseView):
+    """Lists the species matching a SpeciesFilter, with a box for each one's
+    latest population, which can be typed over to override it.
+
+    Only VISIBLE_ROWS rows of widgets are ever made, whatever the number of
+    species: scrolling rebinds the rows to other species, and each row only
+    subscribes to its own species' values, so the cost of an update is set by
+    what is on screen.  The search box and trophic level menu above set the
+    filter.
+    """
     PADDING = 2
     FONT = ('Arial', 12)
+    VISIBLE_ROWS = 10
+    ANY_TROPHIC_LEVEL = "Any level"
 
-    def __init__(self, tkRoot, model, controller):
+    def __init__(self, tkRoot, model, controller, speciesFilter=None):
+        """speciesFilter defaults to one of all the model's series"""
         super().__init__(tkRoot)
-        self.__textBoxes = {}
+        if speciesFilter is None:
+            speciesFilter = SpeciesFilter(model.getSeriesIDList(), controller.getSpeciesTrophicLevels())
 
         self.__model = model
         self.__controller = controller
+        self.__speciesFilter = speciesFilter
+
+        # species shown, and the first of them in the top row
+        self.__speciesIDList = speciesFilter.getMatchingSpeciesIDList()
+        self.__firstRowIdx = 0
+        self.__textBoxState = 'normal'
 
         # for layout debug
         # self.getWidget().config(bg='yellow')
@@ -33,60 +56,178 @@ class SpeciesListView(BaseView):
         self.getWidget().columnconfigure(0, weight=1)
         self.getWidget().columnconfigure(1, weight=1)
 
-        rowCount = 0
-        for seriesID in self.__model.getSeriesIDList():
-            label = tk.Label(self.getWidget(), text=seriesID,
+        # add the filter widgets
+        self.__searchBox = tk.Entry(self.getWidget(), font=SpeciesListView.FONT)
+        self.__searchBox.bind("<KeyRelease>", lambda event: self.searchTextChanged())
+        self.__searchBox.grid(row=0, column=0, sticky='EW',
+                              padx=SpeciesListView.PADDING, pady=SpeciesListView.PADDING)
+
+        self.__trophicLevelVar = tk.StringVar(value=SpeciesListView.ANY_TROPHIC_LEVEL)
+        self.__trophicLevelBox = ttk.Combobox(self.getWidget(), textvariable=self.__trophicLevelVar,
+                                              state='readonly', width=10, font=SpeciesListView.FONT)
+        self.__trophicLevelBox.bind("<<ComboboxSelected>>", lambda event: self.trophicLevelChanged())
+        self.__trophicLevelBox.grid(row=0, column=1, columnspan=2, sticky='EW',
+                                    padx=SpeciesListView.PADDING, pady=SpeciesListView.PADDING)
+        self.__updateTrophicLevelChoices()
+
+        # the pool of rows, each showing whichever species is scrolled to it
+        self.__rowSeriesIDs = [None] * SpeciesListView.VISIBLE_ROWS
+        self.__rowIdxBySeriesID = {}
+        self.__labels = []
+        self.__textBoxes = []
+        for rowIdx in range(SpeciesListView.VISIBLE_ROWS):
+            label = tk.Label(self.getWidget(),
                              font=SpeciesListView.FONT,
                              padx=SpeciesListView.PADDING, pady=SpeciesListView.PADDING)
-            label.grid(row=rowCount, column=0, sticky='NEWS')
+            label.grid(row=rowIdx+1, column=0, sticky='NEWS')
+            self.__labels.append(label)
 
             textBox = tk.Entry(self.getWidget(), width=5,
                                justify='center',
                                validate="focusout",
-                               validatecommand=lambda seriesID=seriesID: self.__overrideSeriesValue(seriesID),
+                               validatecommand=lambda rowIdx=rowIdx: self.__overrideSeriesValue(rowIdx),
                                font=SpeciesListView.FONT)
             textBox.bind("<Return>", lambda e: self.getWidget().focus())
-            textBox.grid(row=rowCount, column=1, sticky='EW',
+            textBox.grid(row=rowIdx+1, column=1, sticky='EW',
                          padx=SpeciesListView.PADDING,
                          pady=SpeciesListView.PADDING)
-            self.__textBoxes[seriesID] = textBox
+            self.__textBoxes.append(textBox)
 
-            self.getWidget().rowconfigure(rowCount, weight=1)
-            rowCount += 1
+            for widget in (label, textBox):
+                widget.bind("<MouseWheel>", lambda event: self.mouseWheelScrolled(event))
 
-        # subscribe to state changes
-        self.__controller.subscribeToStateChanges(self)
+            self.getWidget().rowconfigure(rowIdx+1, weight=1)
 
-        # subscribe to time series changes
-        self.__model.subscribeToAllSeries(self)
-
-    def timeSeriesUpdated(self, seriesData):
-        seriesID = seriesData["seriesID"]
-        if seriesID in self.__textBoxes.keys():
-            # get new value (if one is there)
-            newValue = 0
-            seriesValues = seriesData["seriesValues"]
-            if len(seriesValues) > 0:
-                newValue = seriesValues[-1]
-
-            # update text box
-            textBox = self.__textBoxes[seriesID]
-            prevState = textBox.cget('state')
-            textBox.config(state='normal')
-            textBox.delete(0, tk.END)
-            textBox.insert(0, str(newValue))
-            textBox.config(state=prevState)
+        self.__scrollbar = tk.Scrollbar(self.getWidget(), orient=tk.VERTICAL,
+                                        command=lambda *args: self.scrollbarMoved(*args))
+        self.__scrollbar.grid(row=1, column=2, rowspan=SpeciesListView.VISIBLE_ROWS, sticky='NS')
+        self.getWidget().bind("<MouseWheel>", lambda event: self.mouseWheelScrolled(event))
+
+        self.__bindRows()
+
+        # subscribe to state and filter changes
+        self.__controller.subscribeToStateChanges(self)
+        self.__speciesFilter.subscribeToFilterChanges(self)
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        self.__showLatestValues({deltaData["seriesID"]: deltaData["seriesValues"]})
+
+    def timeSeriesBatchUpdated(self, batchData):
+        self.__showLatestValues({seriesID: deltaData["seriesValues"]
+                                 for seriesID, deltaData in batchData["deltas"].items()})
+
+    def speciesFilterChanged(self, filterData):
+        self.__speciesIDList = filterData["speciesIDList"]
+        self.__firstRowIdx = 0
+        self.__updateTrophicLevelChoices()
+        self.__bindRows()
+
+    def searchTextChanged(self):
+        self.__speciesFilter.setSearchText(self.__searchBox.get())
+
+    def trophicLevelChanged(self):
+        choice = self.__trophicLevelVar.get()
+        self.__speciesFilter.setTrophicLevel(None if choice == SpeciesListView.ANY_TROPHIC_LEVEL else int(choice))
+
+    def scrollbarMoved(self, action, amount, units=None):
+        """Scrolls as asked by the scrollbar: ("moveto", fraction) or ("scroll", count, "units"/"pages")"""
+        if action == "moveto":
+            self.scrollTo(int(round(float(amount) * len(self.__speciesIDList))))
+        elif action == "scroll":
+            rowsPerStep = SpeciesListView.VISIBLE_ROWS if units == "pages" else 1
+            self.scrollTo(self.__firstRowIdx + int(amount) * rowsPerStep)
+
+    def mouseWheelScrolled(self, event):
+        self.scrollTo(self.__firstRowIdx + (-1 if event.delta > 0 else 1))
+
+    def scrollTo(self, firstRowIdx):
+        """Shows the species from firstRowIdx (of those matching the filter) in the top row"""
+        firstRowIdx = max(0, min(firstRowIdx, len(self.__speciesIDList) - SpeciesListView.VISIBLE_ROWS))
+        if firstRowIdx != self.__firstRowIdx:
+            self.__firstRowIdx = firstRowIdx
+            self.__bindRows()
+
+    def __bindRows(self):
+        """Points each row at the species now scrolled to it"""
+        rowSeriesIDs = self.__speciesIDList[self.__firstRowIdx:self.__firstRowIdx + SpeciesListView.VISIBLE_ROWS]
+        rowSeriesIDs += [None] * (SpeciesListView.VISIBLE_ROWS - len(rowSeriesIDs))
+
+        # only species still in view keep their subscriptions
+        prevSeriesIDs = set(self.__rowIdxBySeriesID)
+        for seriesID in prevSeriesIDs.difference(rowSeriesIDs):
+            self.__model.unsubscribeFromSeriesDeltas(seriesID, self)
+        for seriesID in rowSeriesIDs:
+            if seriesID is not None and seriesID not in prevSeriesIDs:
+                # subscribe to later changes in the time series (only the latest value is shown)
+                self.__model.subscribeToSeriesDeltas(seriesID, self, windowSize=1,
+                                                     sinceYear=self.__model.getCurrentYear()+1)
+
+        prevRowSeriesIDs = self.__rowSeriesIDs
+        self.__rowSeriesIDs = rowSeriesIDs
+        self.__rowIdxBySeriesID = {seriesID: rowIdx for rowIdx, seriesID in enumerate(rowSeriesIDs)
+                                   if seriesID is not None}
+
+        for rowIdx, seriesID in enumerate(rowSeriesIDs):
+            if seriesID == prevRowSeriesIDs[rowIdx]:
+                continue
+
+            label = self.__labels[rowIdx]
+            textBox = self.__textBoxes[rowIdx]
+            if seriesID is None:
+                label.grid_remove()
+                textBox.grid_remove()
+            else:
+                label.config(text=seriesID)
+                label.grid()
+                textBox.grid()
+                self.__showLatestValues({seriesID: [self.__model.getSeriesValue(seriesID) or 0]})
+
+        # the scrollbar's slider shows the fraction of the species in view
+        numSpecies = max(1, len(self.__speciesIDList))
+        self.__scrollbar.set(self.__firstRowIdx / numSpecies,
+                             min(1.0, (self.__firstRowIdx + SpeciesListView.VISIBLE_ROWS) / numSpecies))
+
+    def __updateTrophicLevelChoices(self):
+        self.__trophicLevelBox.config(values=[SpeciesListView.ANY_TROPHIC_LEVEL]
+                                      + [str(level) for level in self.__speciesFilter.getTrophicLevelChoices()])
+
+    def __showLatestValues(self, seriesValuesDict):
+        """Refreshes the text boxes of all the given series in one pass"""
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        for seriesID, seriesValues in seriesValuesDict.items():
+            if seriesID in self.__rowIdxBySeriesID:
+                # get new value (if one is there)
+                newValue = 0
+                if len(seriesValues) > 0:
+                    newValue = seriesValues[-1]
+
+                # update text box
+                textBox = self.__textBoxes[self.__rowIdxBySeriesID[seriesID]]
+                textBox.config(state='normal')
+                textBox.delete(0, tk.END)
+                textBox.insert(0, str(int(newValue)))
+                textBox.config(state=self.__textBoxState)
+
+        if timing:
+            PHASE_TIMER.record("SpeciesListView.update", startTime)
 
     def simStateChanged(self, newStateInfo):
-        newTextBoxState = 'normal'
+        self.__textBoxState = 'normal'
         if newStateInfo["Playing"]:
-            newTextBoxState = 'readonly'
+            self.__textBoxState = 'readonly'
+
+        for textBox in self.__textBoxes:
+            textBox.config(state=self.__textBoxState)
 
-        for textBox in self.__textBoxes.values():
-            textBox.config(state=newTextBoxState)
+    def __overrideSeriesValue(self, rowIdx):
+        seriesID = self.__rowSeriesIDs[rowIdx]
+        if seriesID is None:
+            return True
 
-    def __overrideSeriesValue(self, seriesID):
-        textBox = self.__textBoxes[seriesID]
+        textBox = self.__textBoxes[rowIdx]
         stringValue = textBox.get()
         try:
             intValue = int(stringValue)
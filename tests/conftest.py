@@ -0,0 +1,58 @@
+#========================================================================
+#
+# conftest.py - shared setup for the tests
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import copy
+import sys
+from os import path
+
+import pytest
+
+# the modules under test live in the repository root
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from popsimcalculator import *
+
+
+class FakeTkRoot:
+    """Stands in for a Tk root, queueing after() callbacks to be run by runCallbacks()"""
+    def __init__(self):
+        self.__callbacks = []
+
+    def after(self, delay, callback):
+        self.__callbacks.append(callback)
+        return f"after#{len(self.__callbacks)}"
+
+    def after_cancel(self, afterID):
+        pass
+
+    def focus(self):
+        pass
+
+    def runCallbacks(self, maxCallbacks):
+        """Runs queued callbacks (including any they queue) until maxCallbacks have run or none are left"""
+        for callbackIdx in range(maxCallbacks):
+            if len(self.__callbacks) == 0:
+                return
+            self.__callbacks.pop(0)()
+
+
+@pytest.fixture
+def tkRoot():
+    return FakeTkRoot()
+
+
+@pytest.fixture
+def migratingFoodWeb():
+    """The river food web with migration on, so that every year's draw matters to a replay"""
+    foodWebGraph = copy.deepcopy(FOOD_WEB_GRAPH)
+    for speciesData in foodWebGraph.values():
+        speciesData[IMMIGRATION_RATE] = 1
+        speciesData[EMIGRATION_RATE] = 0.01
+        speciesData[RECOLONISATION_RATE] = 0.1
+    return foodWebGraph
@@ -0,0 +1,70 @@
+#========================================================================
+#
+# test_checkpointlog.py - tests of replaying runs from a CheckpointLog
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from checkpointlog import CheckpointLog
+from popsimcalculator import *
+
+START_YEAR = 2024
+NUM_YEARS = 250
+CHECKPOINT_INTERVAL = 50
+# (year, seriesID, value), applied in this order
+OVERRIDES = [(START_YEAR, TROUT, 500), (START_YEAR + 37, OSPREY, 0), (START_YEAR + 37, OSPREY, 40),
+             (START_YEAR + 100, MAYFLY, 123456), (START_YEAR + 199, HERON, 3)]
+
+
+def runWithOverrides(calculator, checkpointLog, startPopulations):
+    """Runs the calculator as the controller does, recording into checkpointLog.
+    Returns each year's populations."""
+    populations = dict(startPopulations)
+    yearPopulationsList = []
+    for year in range(START_YEAR, START_YEAR + NUM_YEARS + 1):
+        if year > START_YEAR:
+            populations = calculator.doSimulation(populations, year)
+            checkpointLog.recordYear(year, populations)
+        for overrideYear, seriesID, value in OVERRIDES:
+            if overrideYear == year:
+                populations[seriesID] = value
+                checkpointLog.recordOverride(year, seriesID, value)
+        yearPopulationsList.append(dict(populations))
+    return yearPopulationsList
+
+
+def makeRun(foodWebGraph):
+    calculator = PopSimCalculator(foodWebGraph, migrationSeed=11)
+    startPopulations = {speciesID: 1000 for speciesID in calculator.getSpeciesIDList()}
+    checkpointLog = CheckpointLog(START_YEAR, startPopulations, CHECKPOINT_INTERVAL)
+    return calculator, checkpointLog, runWithOverrides(calculator, checkpointLog, startPopulations)
+
+
+def test_replayToMatchesOriginalRun(migratingFoodWeb):
+    calculator, checkpointLog, yearPopulationsList = makeRun(migratingFoodWeb)
+
+    assert checkpointLog.getCheckpointYears() == list(range(START_YEAR, START_YEAR + NUM_YEARS + 1,
+                                                            CHECKPOINT_INTERVAL))
+    for yearIdx, populations in enumerate(yearPopulationsList):
+        assert checkpointLog.replayTo(calculator, START_YEAR + yearIdx) == populations
+
+
+def test_replayOfRangeMatchesOriginalRun(migratingFoodWeb):
+    calculator, checkpointLog, yearPopulationsList = makeRun(migratingFoodWeb)
+
+    firstYear, replayedList = checkpointLog.replay(calculator, START_YEAR + 180, START_YEAR + 30)
+    assert firstYear == START_YEAR + 30
+    assert replayedList == yearPopulationsList[30:181]
+
+
+def test_branchKeepsRecordUpToBranchYear(migratingFoodWeb):
+    calculator, checkpointLog, yearPopulationsList = makeRun(migratingFoodWeb)
+
+    branchLog = checkpointLog.branchAt(START_YEAR + 120)
+    assert branchLog.getCheckpointYears() == [START_YEAR, START_YEAR + 50, START_YEAR + 100]
+    assert branchLog.getOverrides() == [override for override in OVERRIDES if override[0] <= START_YEAR + 120]
+    assert branchLog.replayTo(calculator, START_YEAR + 120) == yearPopulationsList[120]
+    # the original log is untouched
+    assert checkpointLog.getOverrides() == OVERRIDES
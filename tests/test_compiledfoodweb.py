@@ -0,0 +1,82 @@
+#========================================================================
+#
+# test_compiledfoodweb.py - tests of CompiledFoodWeb's tables and
+#   validation
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import copy
+
+import numpy as np
+import pytest
+
+from compiledfoodweb import CompiledFoodWeb
+from popsimcalculator import *
+
+
+def brokenFoodWeb(breakFoodWeb):
+    foodWebGraph = copy.deepcopy(FOOD_WEB_GRAPH)
+    breakFoodWeb(foodWebGraph)
+    return foodWebGraph
+
+
+@pytest.mark.parametrize("breakFoodWeb, message", [
+    (lambda graph: graph[TROUT].pop(GROWTH_RATE_FACTOR), "has no value for"),
+    (lambda graph: graph[TROUT].pop(PREY), "has no value for"),
+    (lambda graph: graph[TROUT][PREY].append("Dodo"), "unknown species Dodo"),
+    (lambda graph: graph[OSPREY][PREY].append(TROUT), "more than once"),
+    (lambda graph: graph[TROUT].update({INDIVIDUAL_BIOMASS: 0}), "positive individual biomass"),
+    (lambda graph: graph[OSPREY][PREY].append(MAYFLY), "is not listed as one of its predators"),
+    (lambda graph: graph[OSPREY].update({REQUIRED_BIOMASS_FACTOR: 0}), "no required biomass"),
+    (lambda graph: graph[TROUT].update({IMMIGRATION_RATE: -1}), "negative immigration rate"),
+    (lambda graph: graph[TROUT].update({EMIGRATION_RATE: 1.5}), "between 0 and 1"),
+    (lambda graph: graph[TROUT].update({RECOLONISATION_RATE: -0.1}), "between 0 and 1"),
+    (lambda graph: graph[TROUT].update({DISPERSAL_RATE: 2}), "between 0 and 1"),
+])
+def test_inconsistentGraphsAreRejected(breakFoodWeb, message):
+    with pytest.raises(ValueError, match=message):
+        CompiledFoodWeb(brokenFoodWeb(breakFoodWeb))
+
+
+def test_basalSpeciesNeedNoRequiredBiomass():
+    CompiledFoodWeb(brokenFoodWeb(lambda graph: graph[ALGAE].update({REQUIRED_BIOMASS_FACTOR: 0})))
+
+
+def test_csrKeepsGraphOrder():
+    foodWeb = CompiledFoodWeb(FOOD_WEB_GRAPH)
+    speciesIDList = foodWeb.getSpeciesIDList()
+
+    for indptrIndices, key in ((foodWeb.getPredatorCSR(), PREDATORS), (foodWeb.getPreyCSR(), PREY)):
+        indptr, indices = indptrIndices
+        for speciesIdx, speciesID in enumerate(speciesIDList):
+            rowSpeciesIDs = [speciesIDList[idx] for idx in indices[indptr[speciesIdx]:indptr[speciesIdx+1]]]
+            assert rowSpeciesIDs == FOOD_WEB_GRAPH[speciesID][key]
+
+
+def test_edgeTables():
+    foodWeb = CompiledFoodWeb(FOOD_WEB_GRAPH)
+    predatorIndptr, predatorIndices = foodWeb.getPredatorCSR()
+    preyIndptr, preyIndices = foodWeb.getPreyCSR()
+    preyEdgePrey = np.repeat(np.arange(foodWeb.getNumSpecies()), np.diff(predatorIndptr))
+    predatorEdgePredator = np.repeat(np.arange(foodWeb.getNumSpecies()), np.diff(preyIndptr))
+
+    # each predator edge maps to the prey edge with the same (prey, predator) pair
+    for predatorEdge, preyEdge in enumerate(foodWeb.getPredatorEdgeToPreyEdge()):
+        assert preyEdgePrey[preyEdge] == preyIndices[predatorEdge]
+        assert predatorIndices[preyEdge] == predatorEdgePredator[predatorEdge]
+
+    # every predator in this graph really eats its prey
+    assert all(foodWeb.getPreyEdgeHasPressure())
+
+
+def test_trophicLevels():
+    foodWeb = CompiledFoodWeb(FOOD_WEB_GRAPH)
+    trophicLevels = dict(zip(foodWeb.getSpeciesIDList(), foodWeb.getTrophicLevels()))
+
+    assert trophicLevels[ALGAE] == 1
+    assert trophicLevels[MAYFLY] == 2
+    assert trophicLevels[TROUT] == 2
+    assert trophicLevels[OSPREY] == 3
@@ -0,0 +1,117 @@
+#========================================================================
+#
+# test_ensemblestatistics.py - tests of EnsembleStatistics' moments and
+#   quantile estimates against numpy
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from ensemblestatistics import DEFAULT_QUANTILES, EnsembleStatistics
+
+SPECIES_ID_LIST = ["a", "b", "c"]
+NUM_REPLICATES = 5000
+# how far (as a fraction of the replicates) an estimated quantile may be from the exact one
+RANK_TOLERANCE = 0.01
+MERGED_RANK_TOLERANCE = 0.03
+# P² may nudge a marker off an exact value by a rounding-sized amount
+VALUE_TOLERANCE = 1e-6
+
+
+def drawReplicates(seed, numYears=2):
+    """Returns replicates of shape (replicates, years, species): a lognormal,
+    a uniform and a species extinct in a third of the replicates"""
+    rng = np.random.default_rng(seed)
+    shape = (NUM_REPLICATES, numYears+1)
+    return np.stack([rng.lognormal(5, 2, shape),
+                     rng.uniform(0, 1000, shape),
+                     np.where(rng.random(shape) < 1/3, 0.0, rng.exponential(100, shape))], axis=-1)
+
+
+def addInBatches(statistics, populations, batchSize):
+    for firstIdx in range(0, len(populations), batchSize):
+        statistics.addRuns(populations[firstIdx:firstIdx+batchSize])
+
+
+def checkQuantiles(statistics, populations, quantiles=DEFAULT_QUANTILES, rankTolerance=RANK_TOLERANCE):
+    for quantile in quantiles:
+        estimates = statistics.getQuantile(quantile)
+        lowerBounds = np.quantile(populations, max(0, quantile - rankTolerance), axis=0) - VALUE_TOLERANCE
+        upperBounds = np.quantile(populations, min(1, quantile + rankTolerance), axis=0) + VALUE_TOLERANCE
+        assert np.all((estimates >= lowerBounds) & (estimates <= upperBounds)), quantile
+
+
+@pytest.mark.parametrize("batchSize", [1, 7, 256])
+def test_momentsAndQuantilesMatchNumpy(batchSize):
+    populations = drawReplicates(batchSize)
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 2000, 2)
+
+    addInBatches(statistics, populations, batchSize)
+
+    assert statistics.getNumReplicates() == NUM_REPLICATES
+    assert np.allclose(statistics.getMean(), populations.mean(axis=0))
+    assert np.allclose(statistics.getVariance(), populations.var(axis=0, ddof=1))
+    assert np.array_equal(statistics.getMin(), populations.min(axis=0))
+    assert np.array_equal(statistics.getMax(), populations.max(axis=0))
+    checkQuantiles(statistics, populations)
+
+
+def test_otherQuantilesAreAskedForUpFront():
+    populations = drawReplicates(1)
+    quantiles = (0.1, 0.25, 0.75)
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 2, quantiles)
+
+    statistics.addRuns(populations)
+
+    checkQuantiles(statistics, populations, quantiles)
+    seriesStats = statistics.getSeriesStats("b", quantiles)
+    assert list(seriesStats["quantiles"]) == list(quantiles)
+    assert np.array_equal(seriesStats["years"], [0, 1, 2])
+
+
+def test_mergedStatisticsMatchNumpy():
+    populations = drawReplicates(2)
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 2)
+    otherStatistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 2)
+    for yearIdx in range(3):
+        statistics.addYear(yearIdx, populations[:NUM_REPLICATES//3, yearIdx])
+    addInBatches(otherStatistics, populations[NUM_REPLICATES//3:], 256)
+
+    statistics.merge(otherStatistics)
+
+    assert statistics.getNumReplicates() == NUM_REPLICATES
+    assert np.allclose(statistics.getMean(), populations.mean(axis=0))
+    assert np.allclose(statistics.getVariance(), populations.var(axis=0, ddof=1))
+    checkQuantiles(statistics, populations, rankTolerance=MERGED_RANK_TOLERANCE)
+
+
+def test_mergeNeedsTheSameQuantiles():
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 2)
+
+    with pytest.raises(ValueError):
+        statistics.merge(EnsembleStatistics(SPECIES_ID_LIST, 0, 2, (0.5,)))
+    with pytest.raises(ValueError):
+        statistics.merge(EnsembleStatistics(SPECIES_ID_LIST, 0, 3))
+
+
+def test_identicalReplicatesGiveExactQuantiles():
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 0)
+    for batchIdx in range(10):
+        statistics.addYear(0, np.tile([0.0, 17.0, 1e12], (50, 1)))
+
+    for quantile in (0, 0.05, 0.3, 0.5, 0.95, 1):
+        assert np.array_equal(statistics.getQuantile(quantile)[0], [0.0, 17.0, 1e12])
+
+
+def test_yearsWithoutReplicatesHaveNoQuantiles():
+    statistics = EnsembleStatistics(SPECIES_ID_LIST, 0, 3)
+    statistics.addRuns(np.ones((4, 2, 3)))
+
+    assert statistics.getNumReplicates() == 0
+    assert np.all(np.isnan(statistics.getQuantile(0.5)[2:]))
+    with pytest.raises(ValueError):
+        statistics.getQuantile(1.5)
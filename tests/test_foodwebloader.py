@@ -0,0 +1,83 @@
+#========================================================================
+#
+# test_foodwebloader.py - tests of loading food webs from files
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import json
+
+import pytest
+
+from foodwebloader import loadFoodWeb, readFoodWebGraph
+from popsimcalculator import *
+
+
+def makeSpecies(**entries):
+    species = {"requiredBiomassFactor": 2, "individualBiomass": 1,
+               "growthRateFactor": 1.1, "declineRateFactor": 0.8}
+    species.update(entries)
+    return species
+
+
+def writeJSON(tmp_path, document):
+    filePath = tmp_path / "web.json"
+    filePath.write_text(json.dumps(document))
+    return str(filePath)
+
+
+def test_loadsValidFoodWeb(tmp_path):
+    filePath = writeJSON(tmp_path, {"species": {"Fox": makeSpecies(prey=["Rabbit"]),
+                                                "Rabbit": makeSpecies(predators=["Fox"]),
+                                                "Grass": makeSpecies()},
+                                    "edges": [["Rabbit", "Grass"]]})
+
+    compiledFoodWeb = loadFoodWeb(filePath, cacheDir=str(tmp_path / "cache"))
+    assert compiledFoodWeb.getSpeciesIDList() == ["Fox", "Rabbit", "Grass"]
+    foodWebGraph = compiledFoodWeb.getFoodWebGraph()
+    assert foodWebGraph["Rabbit"][PREY] == ["Grass"]
+    assert foodWebGraph["Grass"][PREDATORS] == ["Rabbit"]
+
+    # loading again comes from the cache, and gives the same web
+    assert loadFoodWeb(filePath, cacheDir=str(tmp_path / "cache")).getFoodWebGraph() == foodWebGraph
+
+
+@pytest.mark.parametrize("document, message", [
+    ([], "must be a table"),
+    ({"specie": {}}, "Unknown food web entry 'specie'"),
+    ({"formatVersion": 99, "species": {"A": makeSpecies()}}, "Unsupported food web format version"),
+    ({"species": {}}, "one or more 'species'"),
+    ({"species": {"A": 5}}, "must be a table of values"),
+    ({"species": {"A": {"individualBiomass": 1}}}, "has no 'requiredBiomassFactor'"),
+    ({"species": {"A": makeSpecies(individualBiomass="heavy")}}, "'individualBiomass' must be a number"),
+    ({"species": {"A": makeSpecies(colour="red")}}, "unknown value 'colour'"),
+    ({"species": {"A": makeSpecies(prey="B")}}, "must be a list of species names"),
+    ({"species": {"A": makeSpecies(prey=["B", "B"]), "B": makeSpecies(predators=["A"])}},
+     "lists the same species more than once"),
+    ({"species": {"A": makeSpecies()}, "edges": [["A", "B"]]}, "unknown species B"),
+    ({"species": {"A": makeSpecies()}, "edges": [[["x"], "A"]]}, "pair of species names"),
+    ({"species": {"A": makeSpecies(), "B": makeSpecies()}, "edges": [["A", "B"], ["A", "B"]]}, "repeats A eating B"),
+    ({"species": {"A": makeSpecies(prey=["B"]), "B": makeSpecies()}}, "not listed as one of its predators"),
+    ({"species": {"A": makeSpecies(individualBiomass=0)}}, "positive individual biomass"),
+])
+def test_schemaErrorsNameTheFile(tmp_path, document, message):
+    filePath = writeJSON(tmp_path, document)
+    with pytest.raises(ValueError, match=message) as errorInfo:
+        loadFoodWeb(filePath, cacheDir=str(tmp_path / "cache"))
+    assert str(errorInfo.value).startswith(filePath)
+
+
+def test_unknownFileTypeFails(tmp_path):
+    filePath = tmp_path / "web.xml"
+    filePath.write_text("<web/>")
+    with pytest.raises(ValueError, match="Unknown food web file type"):
+        readFoodWebGraph(str(filePath))
+
+
+def test_csvNeedsSpeciesColumn(tmp_path):
+    (tmp_path / "web.csv").write_text("predator,prey\nA,B\n")
+    (tmp_path / "web.species.csv").write_text("name,individualBiomass\nA,1\n")
+    with pytest.raises(ValueError, match="'species' column"):
+        readFoodWebGraph(str(tmp_path / "web.csv"))
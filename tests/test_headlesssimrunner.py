@@ -0,0 +1,98 @@
+#========================================================================
+#
+# test_headlesssimrunner.py - tests of HeadlessSimRunner's cycle
+#   detection and extrapolation
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from foodwebgenerator import makeRandomFoodWeb
+from headlesssimrunner import *
+from popsimcalculator import *
+from popsimkernel import PopSimKernel
+from timeseriesmodel import TimeSeriesModel
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+# a web whose populations settle into a 35 year cycle from year 326
+CYCLING_FOOD_WEB = makeRandomFoodWeb(3, 46)
+CYCLE_START_IDX = 326
+CYCLE_PERIOD = 35
+NUM_YEARS = 1000
+INITIAL_POPULATIONS = {speciesID: 1000 for speciesID in CYCLING_FOOD_WEB}
+
+CALCULATOR_MAKERS = [PopSimCalculator, VectorPopSimCalculator,
+                     lambda foodWebGraph: PopSimKernel(foodWebGraph, useJIT=False)]
+
+
+@pytest.mark.parametrize("makeCalculator", CALCULATOR_MAKERS)
+def test_stopAtCycle(makeCalculator):
+    fullRun = HeadlessSimRunner(makeCalculator(CYCLING_FOOD_WEB)).run(NUM_YEARS, INITIAL_POPULATIONS)
+    runner = HeadlessSimRunner(makeCalculator(CYCLING_FOOD_WEB))
+
+    populations = runner.run(NUM_YEARS, INITIAL_POPULATIONS, cycleHandling=CYCLE_STOP)
+
+    detectedIdx = CYCLE_START_IDX + CYCLE_PERIOD
+    assert runner.getLastCycle() == {"cycleStartIdx": CYCLE_START_IDX, "period": CYCLE_PERIOD,
+                                     "detectedIdx": detectedIdx}
+    assert len(populations) == detectedIdx + 1
+    assert np.array_equal(populations, fullRun[:detectedIdx+1])
+    assert np.array_equal(populations[CYCLE_START_IDX], populations[detectedIdx])
+
+
+@pytest.mark.parametrize("makeCalculator", CALCULATOR_MAKERS)
+def test_extrapolatedCycleMatchesFullRun(makeCalculator):
+    fullRun = HeadlessSimRunner(makeCalculator(CYCLING_FOOD_WEB)).run(NUM_YEARS, INITIAL_POPULATIONS)
+    runner = HeadlessSimRunner(makeCalculator(CYCLING_FOOD_WEB))
+
+    populations = runner.run(NUM_YEARS, INITIAL_POPULATIONS, cycleHandling=CYCLE_EXTRAPOLATE)
+
+    assert runner.getLastCycle()["period"] == CYCLE_PERIOD
+    assert np.array_equal(populations, fullRun)
+
+
+def test_fixedPointIsAPeriodOfOne():
+    foodWebGraph = makeRandomFoodWeb(3, 0)
+    runner = HeadlessSimRunner(PopSimCalculator(foodWebGraph))
+
+    populations = runner.run(500, {speciesID: 100 for speciesID in foodWebGraph}, cycleHandling=CYCLE_EXTRAPOLATE)
+
+    cycle = runner.getLastCycle()
+    assert cycle["period"] == 1
+    assert np.all(populations[cycle["cycleStartIdx"]:] == populations[-1])
+
+
+def test_noCycleHandlingWithMigration(migratingFoodWeb):
+    runner = HeadlessSimRunner(PopSimCalculator(migratingFoodWeb, migrationSeed=1))
+
+    populations = runner.run(200, {speciesID: 1000 for speciesID in migratingFoodWeb}, startYear=0,
+                             cycleHandling=CYCLE_STOP)
+
+    assert len(populations) == 201
+    assert runner.getLastCycle() is None
+
+
+def test_extrapolatedYearsReachTheModel():
+    model = TimeSeriesModel()
+    for speciesID in CYCLING_FOOD_WEB:
+        model.addTimeSeries(speciesID)
+    model.setCurrentValues(INITIAL_POPULATIONS)
+    runner = HeadlessSimRunner(VectorPopSimCalculator(CYCLING_FOOD_WEB), model)
+
+    populations = runner.run(NUM_YEARS, notifyEvery=100, cycleHandling=CYCLE_EXTRAPOLATE)
+
+    assert model.getCurrentYear() == NUM_YEARS
+    assert np.array_equal(model.getValuesForYears(0, NUM_YEARS), populations)
+
+
+def test_badArguments():
+    runner = HeadlessSimRunner(PopSimCalculator(CYCLING_FOOD_WEB))
+
+    with pytest.raises(ValueError):
+        runner.run(10)
+    with pytest.raises(ValueError):
+        runner.run(10, INITIAL_POPULATIONS, cycleHandling="Sometimes")
@@ -0,0 +1,108 @@
+#========================================================================
+#
+# test_kernelequivalence.py - tests that every calculator gives exactly
+#   the same populations as PopSimCalculator
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import random
+
+import numpy as np
+import pytest
+
+from popsimcalculator import *
+from foodwebgenerator import makeRandomFoodWeb
+from popsimkernel import PopSimKernel
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+# float64 holds every whole number up to here exactly; above it the reference's
+# ints and the other calculators' floats can round differently
+MAX_EXACT_POPULATION = 2**53
+
+NUM_WEBS = 12
+MAX_SPECIES = 60
+NUM_YEARS = 200
+SEED = 1
+
+
+def makeRandomPopulations(speciesIDList, rng):
+    """Returns populations spanning several orders of magnitude, some of them extinct"""
+    return {speciesID: rng.choice([0, rng.randint(0, 10**rng.randint(1, 7))]) for speciesID in speciesIDList}
+
+
+def runReference(foodWebGraph, initialPopulations, numYears, migrationSeed):
+    """Runs PopSimCalculator, returning (years, species) populations.  The run
+    stops early once any population is too big to compare exactly (or the
+    reference overflows), in which case fewer rows are returned."""
+    calculator = PopSimCalculator(foodWebGraph, migrationSeed=migrationSeed)
+    speciesIDList = calculator.getSpeciesIDList()
+    yearPopulations = dict(initialPopulations)
+    rows = [[yearPopulations[speciesID] for speciesID in speciesIDList]]
+    try:
+        for yearIdx in range(numYears):
+            yearPopulations = calculator.doSimulation(yearPopulations)
+            if max(yearPopulations.values()) > MAX_EXACT_POPULATION:
+                break
+            rows.append([yearPopulations[speciesID] for speciesID in speciesIDList])
+    except OverflowError:
+        pass
+    return np.array(rows, dtype=np.float64)
+
+
+def runVector(foodWebGraph, initialArray, numYears, migrationSeed):
+    vectorCalculator = VectorPopSimCalculator(foodWebGraph, migrationSeed=migrationSeed)
+    return vectorCalculator.runSimulationArray(initialArray[np.newaxis, :], numYears)[0]
+
+
+def runPythonKernel(foodWebGraph, initialArray, numYears, migrationSeed):
+    kernel = PopSimKernel(foodWebGraph, useJIT=False, migrationSeed=migrationSeed)
+    assert not kernel.isCompiled()
+    return kernel.runYears(initialArray, numYears)
+
+
+def runJITKernel(foodWebGraph, initialArray, numYears, migrationSeed):
+    kernel = PopSimKernel(foodWebGraph, migrationSeed=migrationSeed)
+    assert kernel.isCompiled()
+    return kernel.runYears(initialArray, numYears)
+
+
+def findMismatches(runCandidate):
+    """Compares the candidate with the reference on random webs (every other
+    one with migration, drawn from the same seed by both calculators),
+    returning a list of mismatch descriptions"""
+    rng = random.Random(SEED)
+    foodWebGraphs = [FOOD_WEB_GRAPH] + [makeRandomFoodWeb(rng.randint(3, MAX_SPECIES), rng,
+                                                          withMigration=webIdx % 2 == 1)
+                                        for webIdx in range(NUM_WEBS)]
+
+    mismatches = []
+    for webIdx, foodWebGraph in enumerate(foodWebGraphs):
+        speciesIDList = list(foodWebGraph.keys())
+        initialPopulations = makeRandomPopulations(speciesIDList, rng)
+        initialArray = np.array([initialPopulations[speciesID] for speciesID in speciesIDList], dtype=np.float64)
+        reference = runReference(foodWebGraph, initialPopulations, NUM_YEARS, SEED)
+        with np.errstate(over="ignore", invalid="ignore"):
+            populations = runCandidate(foodWebGraph, initialArray, NUM_YEARS, SEED)
+
+        compared = populations[:len(reference)]
+        if not np.array_equal(compared, reference):
+            yearIdx, speciesIdx = np.argwhere(compared != reference)[0]
+            mismatches.append(f"web {webIdx} differs from the reference in year {yearIdx} for species {speciesIdx}")
+
+    return mismatches
+
+
+def test_vectorMatchesReference():
+    assert findMismatches(runVector) == []
+
+
+def test_pythonKernelMatchesReference():
+    assert findMismatches(runPythonKernel) == []
+
+
+def test_jitKernelMatchesReference():
+    pytest.importorskip("numba")
+    assert findMismatches(runJITKernel) == []
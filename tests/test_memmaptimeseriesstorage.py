@@ -0,0 +1,104 @@
+#========================================================================
+#
+# test_memmaptimeseriesstorage.py - tests of MemmapTimeSeriesStorage,
+#   including reopening its files
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import os
+
+import numpy as np
+import pytest
+
+from memmaptimeseriesstorage import *
+from timeseriesmodel import TimeSeriesModel
+
+
+def makeRows(firstRow, numRows, numColumns):
+    """Rows whose values encode their absolute row and column"""
+    rows = np.arange(firstRow, firstRow + numRows)[:, np.newaxis]
+    return (rows*10 + np.arange(numColumns)).astype(np.float64)
+
+
+def writeStorage(filePath, numRows, growRows=8):
+    storage = MemmapTimeSeriesStorage(filePath, growRows=growRows)
+    storage.setStartYear(1950)
+    storage.addColumn("a")
+    storage.addColumn("b")
+    storage.setLastRow([0, 1])
+    storage.appendRows(numRows-1, makeRows(1, numRows-1, 2))
+    return storage
+
+
+def test_reopenAfterClose(tmp_path):
+    filePath = str(tmp_path / "series.pst")
+    storage = writeStorage(filePath, 100)
+    storage.close()
+
+    # trimmed to exactly the header and the rows used
+    reopened = MemmapTimeSeriesStorage(filePath, mode="r")
+    assert os.path.getsize(filePath) % HEADER_ALIGNMENT == 100 * 2 * 8
+    assert reopened.getStartYear() == 1950
+    assert reopened.getColumnIDs() == ["a", "b"]
+    assert reopened.getNumRows() == 100
+    assert np.array_equal(reopened.getRows(), makeRows(0, 100, 2))
+    reopened.close()
+
+
+def test_reopenWithoutCloseKeepsFlushedRows(tmp_path):
+    filePath = str(tmp_path / "series.pst")
+    storage = writeStorage(filePath, 30)
+    storage.flush()
+
+    # as after a crash: the file still has its unused, grown capacity
+    reopened = MemmapTimeSeriesStorage(filePath, mode="r")
+    assert reopened.getNumRows() == 30
+    assert np.array_equal(reopened.getRows(), makeRows(0, 30, 2))
+
+
+def test_reopenToCarryOnAppending(tmp_path):
+    filePath = str(tmp_path / "series.pst")
+    writeStorage(filePath, 20).close()
+
+    storage = MemmapTimeSeriesStorage(filePath, mode="r+")
+    storage.appendRows(30, makeRows(20, 30, 2))
+    storage.truncateRows(45)
+    storage.setValue(3, 1, -1)
+    storage.close()
+
+    expected = makeRows(0, 45, 2)
+    expected[3, 1] = -1
+    assert np.array_equal(MemmapTimeSeriesStorage(filePath, mode="r").getRows(), expected)
+
+
+def test_modelRestoresFromReopenedFile(tmp_path):
+    filePath = str(tmp_path / "series.pst")
+    storage = MemmapTimeSeriesStorage(filePath)
+    model = TimeSeriesModel(storage)
+    model.reset(2000)
+    model.addTimeSeries("a")
+    for year in range(2001, 2011):
+        model.advanceYear()
+        model.setSeriesValue("a", year)
+    storage.close()
+
+    restored = TimeSeriesModel(MemmapTimeSeriesStorage(filePath, mode="r+"), restore=True)
+
+    assert restored.getSeriesIDList() == ["a"]
+    assert restored.getStartYear() == 2000
+    assert restored.getCurrentYear() == 2010
+    assert restored.getSeriesValue("a", 2007) == 2007
+
+
+def test_rejectsOtherFiles(tmp_path):
+    filePath = str(tmp_path / "other.bin")
+    with open(filePath, "wb") as otherFile:
+        otherFile.write(b"not a storage file at all, honestly")
+
+    with pytest.raises(ValueError):
+        MemmapTimeSeriesStorage(filePath, mode="r")
+    with pytest.raises(ValueError):
+        MemmapTimeSeriesStorage(filePath, mode="a")
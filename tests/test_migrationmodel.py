@@ -0,0 +1,92 @@
+#========================================================================
+#
+# test_migrationmodel.py - tests that MigrationModel's draws depend only
+#   on the seed and year
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from compiledfoodweb import CompiledFoodWeb
+from migrationmodel import MigrationModel
+from popsimcalculator import *
+
+NUM_YEARS = 50
+
+
+def makePopulations(foodWeb, numMembers=None):
+    shape = (foodWeb.getNumSpecies(),) if numMembers is None else (numMembers, foodWeb.getNumSpecies())
+    populations = np.random.default_rng(4).integers(0, 5000, shape).astype(np.float64)
+    populations[..., 0] = 0
+    return populations
+
+
+def drawYears(model, populations, years):
+    return [model.drawMigration(populations, year) for year in years]
+
+
+def test_sameSeedSameDraws(migratingFoodWeb):
+    foodWeb = CompiledFoodWeb(migratingFoodWeb)
+    populations = makePopulations(foodWeb)
+    years = range(1, NUM_YEARS+1)
+
+    firstDraws = drawYears(MigrationModel(foodWeb, 42), populations, years)
+    secondDraws = drawYears(MigrationModel(foodWeb, 42), populations, years)
+
+    assert all(np.array_equal(first, second) for first, second in zip(firstDraws, secondDraws))
+
+
+def test_drawsDependOnlyOnTheYear(migratingFoodWeb):
+    foodWeb = CompiledFoodWeb(migratingFoodWeb)
+    populations = makePopulations(foodWeb)
+    inOrder = drawYears(MigrationModel(foodWeb, 42), populations, range(1, NUM_YEARS+1))
+
+    # recalculating years out of order, or after others, gives the same draws
+    model = MigrationModel(foodWeb, 42)
+    for year in [37, 2, 50, 2, 1, 37]:
+        assert np.array_equal(model.drawMigration(populations, year), inOrder[year-1])
+
+    # with no year given, draws follow on from the last year drawn
+    model.drawMigration(populations, 9)
+    assert np.array_equal(model.drawMigration(populations), inOrder[9])
+
+
+def test_differentSeedsAndYearsDiffer(migratingFoodWeb):
+    foodWeb = CompiledFoodWeb(migratingFoodWeb)
+    populations = makePopulations(foodWeb)
+
+    seedDraws = [MigrationModel(foodWeb, seed).drawMigration(populations, 1) for seed in range(5)]
+    yearDraws = drawYears(MigrationModel(foodWeb, 0), populations, range(1, 6))
+
+    for draws in (seedDraws, yearDraws):
+        assert len({drawn.tobytes() for drawn in draws}) == len(draws)
+
+
+def test_membersGetTheirOwnDraws(migratingFoodWeb):
+    foodWeb = CompiledFoodWeb(migratingFoodWeb)
+    populations = makePopulations(foodWeb, numMembers=4)
+    populations[:] = populations[0]
+
+    migration = MigrationModel(foodWeb, 42).drawMigration(populations, 3)
+
+    assert migration.shape == populations.shape
+    assert len({memberMigration.tobytes() for memberMigration in migration}) == 4
+
+
+def test_drawsAreWholeAndLeaveNoNegativePopulations(migratingFoodWeb):
+    foodWeb = CompiledFoodWeb(migratingFoodWeb)
+    populations = makePopulations(foodWeb, numMembers=20)
+    model = MigrationModel(foodWeb, 7)
+
+    for year in range(1, NUM_YEARS+1):
+        migration = model.drawMigration(populations, year)
+        assert np.all(migration == np.trunc(migration))
+        populations = populations + migration
+        assert np.all(populations >= 0)
+
+
+def test_noRatesNoMigration():
+    assert not MigrationModel.hasMigration(CompiledFoodWeb(FOOD_WEB_GRAPH))
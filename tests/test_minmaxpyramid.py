@@ -0,0 +1,85 @@
+#========================================================================
+#
+# test_minmaxpyramid.py - tests of MinMaxPyramid against brute-force
+#   min/max
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from minmaxpyramid import MinMaxPyramid
+
+
+def checkAgainstBruteForce(pyramid, values, maxPoints):
+    assert len(pyramid) == len(values)
+    assert np.array_equal(pyramid.getValues(), values)
+    if len(values) > 0:
+        assert pyramid.getMin() == values.min()
+        assert pyramid.getMax() == values.max()
+
+    indices, decimatedValues = pyramid.getDecimated(maxPoints)
+    if len(values) <= maxPoints:
+        assert np.array_equal(decimatedValues, values)
+        return
+
+    assert 2 <= len(decimatedValues) <= maxPoints
+    blockSize = int(2*(indices[1] - indices[0]))
+    for blockIdx, blockStart in enumerate(indices[0::2].astype(int)):
+        block = values[blockStart:blockStart + blockSize]
+        assert decimatedValues[2*blockIdx] == block.min()
+        assert decimatedValues[2*blockIdx + 1] == block.max()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_randomEditsMatchBruteForce(seed):
+    rng = np.random.default_rng(seed)
+    pyramid = MinMaxPyramid(initialCapacity=4)
+    values = np.empty(0)
+
+    for step in range(200):
+        action = rng.integers(4)
+        if action == 0:
+            newValues = rng.integers(-1000, 1000, rng.integers(1, 50)).astype(np.float64)
+            pyramid.append(newValues)
+            values = np.append(values, newValues)
+        elif action == 1:
+            numValues = int(rng.integers(0, len(values)+1))
+            pyramid.truncate(numValues)
+            values = values[:numValues]
+        elif action == 2:
+            fromIdx = int(rng.integers(0, len(values)+1))
+            newValues = rng.integers(-1000, 1000, rng.integers(0, 30)).astype(np.float64)
+            pyramid.setValues(fromIdx, newValues)
+            values = np.append(values[:fromIdx], newValues)
+        else:
+            numValues = int(rng.integers(0, len(values)//4 + 1))
+            pyramid.dropFirst(numValues)
+            values = values[numValues:]
+
+        checkAgainstBruteForce(pyramid, values, int(rng.integers(2, 100)))
+
+
+def test_singleSpikeStaysVisible():
+    pyramid = MinMaxPyramid()
+    values = np.full(100000, 50.0)
+    values[31337] = 1e9
+    values[77777] = 0
+    pyramid.append(values)
+
+    indices, decimatedValues = pyramid.getDecimated(500)
+
+    assert len(decimatedValues) <= 500
+    assert decimatedValues.max() == 1e9
+    assert decimatedValues.min() == 0
+
+
+def test_emptyPyramid():
+    pyramid = MinMaxPyramid()
+
+    assert pyramid.getMin() == 0 and pyramid.getMax() == 0
+    indices, decimatedValues = pyramid.getDecimated(10)
+    assert len(indices) == 0 and len(decimatedValues) == 0
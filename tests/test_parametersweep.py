@@ -0,0 +1,82 @@
+#========================================================================
+#
+# test_parametersweep.py - tests of resuming ParameterSweep results files
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import json
+
+import pytest
+
+from parametersweep import *
+
+GRID = {GROWTH_RATE_FACTOR: [1.05, 1.1], "MAX_PREDATION_FACTOR": [2, 4]}
+INITIAL_POPULATIONS = {speciesID: 1000 for speciesID in FOOD_WEB_GRAPH}
+NUM_YEARS = 40
+
+
+def makeSweep(numYears=NUM_YEARS):
+    return ParameterSweep(GRID, INITIAL_POPULATIONS, numYears)
+
+
+def readLines(resultsPath):
+    with open(resultsPath) as resultsFile:
+        return resultsFile.readlines()
+
+
+def test_runWritesHeaderAndEveryPoint(tmp_path):
+    resultsPath = str(tmp_path / "sweep.jsonl")
+    sweep = makeSweep()
+
+    results = sweep.run(resultsPath, maxWorkers=1, pointsPerTask=3)
+
+    lines = readLines(resultsPath)
+    assert json.loads(lines[0]) == {SWEEP_HEADER_KEY: sweep.getHeader()}
+    assert len(lines) == 5
+    assert sorted(getPointKey(result["point"]) for result in results) == \
+        sorted(getPointKey(point) for point in sweep.getPoints())
+    assert loadSweepResults(resultsPath) == results
+
+
+def test_resumeSkipsCompletedPointsAndTornLine(tmp_path):
+    resultsPath = str(tmp_path / "sweep.jsonl")
+    makeSweep().run(resultsPath, maxWorkers=1)
+    lines = readLines(resultsPath)
+
+    # as if interrupted part way through writing the third result
+    with open(resultsPath, "w") as resultsFile:
+        resultsFile.writelines(lines[:3])
+        resultsFile.write(lines[3][:20])
+    assert len(loadSweepResults(resultsPath)) == 2
+
+    results = makeSweep().run(resultsPath, maxWorkers=1)
+
+    resumedLines = readLines(resultsPath)
+    assert resumedLines[:3] == lines[:3]
+    assert len(resumedLines) == 5
+    assert all(json.loads(line) for line in resumedLines)
+    assert len(results) == 4
+    assert len({getPointKey(result["point"]) for result in results}) == 4
+
+
+def test_resumeFromCompleteFileRunsNothing(tmp_path):
+    resultsPath = str(tmp_path / "sweep.jsonl")
+    firstResults = makeSweep().run(resultsPath, maxWorkers=1)
+
+    secondResults = makeSweep().run(resultsPath, maxWorkers=1)
+
+    assert secondResults == firstResults
+    assert len(readLines(resultsPath)) == 5
+
+
+def test_differentSweepWillNotResume(tmp_path):
+    resultsPath = str(tmp_path / "sweep.jsonl")
+    makeSweep().run(resultsPath, maxWorkers=1)
+    lines = readLines(resultsPath)
+
+    with pytest.raises(ValueError):
+        makeSweep(numYears=NUM_YEARS+1).run(resultsPath, maxWorkers=1)
+    assert readLines(resultsPath) == lines
@@ -0,0 +1,64 @@
+#========================================================================
+#
+# test_patchgridsimulator.py - tests that PatchGridSimulator gives the
+#   same populations for any number of workers
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from patchgridsimulator import *
+
+NUM_PATCHES = 9
+NUM_YEARS = 40
+
+
+def makeSimulator(foodWebGraph):
+    simulator = PatchGridSimulator(makeRiverNetwork(NUM_PATCHES, 3), foodWebGraph=foodWebGraph, migrationSeed=5)
+    populations = np.random.default_rng(2).integers(0, 5000, (NUM_PATCHES, len(simulator.getSpeciesIDList())))
+    simulator.setPopulations(populations.astype(np.float64))
+    return simulator
+
+
+@pytest.mark.parametrize("numWorkers", [2, 4])
+def test_parallelRunMatchesSerial(migratingFoodWeb, numWorkers):
+    serial = makeSimulator(migratingFoodWeb)
+    parallel = makeSimulator(migratingFoodWeb)
+
+    serialHistory = serial.run(NUM_YEARS, numWorkers=1)
+    parallelHistory = parallel.run(NUM_YEARS, numWorkers=numWorkers)
+
+    assert np.array_equal(parallelHistory, serialHistory)
+    assert parallel.getYear() == serial.getYear() == NUM_YEARS
+    assert np.array_equal(parallel.getPopulations(), serial.getPopulations())
+
+
+def test_runMatchesSteps(migratingFoodWeb):
+    stepped = makeSimulator(migratingFoodWeb)
+    history = [stepped.getPopulations()]
+    for yearIdx in range(NUM_YEARS):
+        stepped.step()
+        history.append(stepped.getPopulations())
+
+    assert np.array_equal(makeSimulator(migratingFoodWeb).run(NUM_YEARS), np.array(history))
+
+
+def test_dispersalMovesPopulationsBetweenPatches():
+    simulator = PatchGridSimulator(makeRiverNetwork(NUM_PATCHES, 3), foodWebGraph=FOOD_WEB_GRAPH)
+    populations = np.zeros((NUM_PATCHES, len(simulator.getSpeciesIDList())))
+    populations[0] = 10000
+    simulator.setPopulations(populations)
+
+    simulator.run(5, numWorkers=2, keepHistory=False)
+
+    assert np.all(simulator.getPopulations() >= 0)
+    assert np.any(simulator.getPopulations()[1:] > 0)
+
+
+def test_rejectsOverfullConnectivity():
+    with pytest.raises(ValueError):
+        PatchGridSimulator(([0, 0], [1, 2], [0.7, 0.6]))
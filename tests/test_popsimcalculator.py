@@ -0,0 +1,55 @@
+#========================================================================
+#
+# test_popsimcalculator.py - tests of PopSimCalculator's batch runs
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from foodwebgenerator import makeRandomFoodWeb
+from popsimcalculator import *
+
+NUM_YEARS = 100
+NUM_SCENARIOS = 5
+
+
+def runOneScenario(foodWebGraph, startPopulations, numYears, migrationSeed=None):
+    calculator = PopSimCalculator(foodWebGraph, migrationSeed=migrationSeed)
+    populations = dict(startPopulations)
+    yearPopulationsList = [populations]
+    for year in range(1, numYears+1):
+        populations = calculator.doSimulation(populations, year)
+        yearPopulationsList.append(populations)
+    return yearPopulationsList
+
+
+def test_doBatchSimulationMatchesDoSimulation():
+    for foodWebGraph in [FOOD_WEB_GRAPH, makeRandomFoodWeb(30, 6)]:
+        calculator = PopSimCalculator(foodWebGraph)
+        speciesIDList = calculator.getSpeciesIDList()
+        initialPopulations = np.random.default_rng(2).integers(0, 50000, (NUM_SCENARIOS, len(speciesIDList)))
+
+        batch = calculator.doBatchSimulation(initialPopulations, NUM_YEARS)
+
+        assert batch.shape == (NUM_SCENARIOS, NUM_YEARS+1, len(speciesIDList))
+        for scenarioIdx in range(NUM_SCENARIOS):
+            startPopulations = dict(zip(speciesIDList, initialPopulations[scenarioIdx].tolist()))
+            expected = runOneScenario(foodWebGraph, startPopulations, NUM_YEARS)
+            for yearIdx, expectedPopulations in enumerate(expected):
+                assert dict(zip(speciesIDList, batch[scenarioIdx, yearIdx].astype(int).tolist())) == expectedPopulations
+
+
+def test_doBatchSimulationSingleScenarioMatchesWithMigration(migratingFoodWeb):
+    calculator = PopSimCalculator(migratingFoodWeb, migrationSeed=3)
+    speciesIDList = calculator.getSpeciesIDList()
+    startPopulations = {speciesID: 2000 for speciesID in speciesIDList}
+
+    batch = calculator.doBatchSimulation([[startPopulations[speciesID] for speciesID in speciesIDList]],
+                                         NUM_YEARS, startYear=0)
+
+    expected = runOneScenario(migratingFoodWeb, startPopulations, NUM_YEARS, migrationSeed=3)
+    for yearIdx, expectedPopulations in enumerate(expected):
+        assert dict(zip(speciesIDList, batch[0, yearIdx].astype(int).tolist())) == expectedPopulations
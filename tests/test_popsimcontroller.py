@@ -0,0 +1,76 @@
+#========================================================================
+#
+# test_popsimcontroller.py - tests of rewinding and branching runs in
+#   PopSimController
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import *
+from popsimcontroller import CHECKPOINT_INTERVAL, PopSimController
+from timeseriesmodel import TimeSeriesModel
+
+
+def makeController(tkRoot, foodWebGraph):
+    model = TimeSeriesModel()
+    controller = PopSimController(tkRoot, model, foodWeb=foodWebGraph)
+    for seriesID in model.getSeriesIDList():
+        controller.overrideSeriesValue(seriesID, 1000)
+    return model, controller
+
+
+def playYears(tkRoot, controller, numYears):
+    """Plays the simulation for numYears ticks, then pauses it"""
+    controller.startSim()
+    tkRoot.runCallbacks(numYears)
+    controller.pauseUnpauseSim()
+    # let the tick already queued see that the simulation is paused
+    tkRoot.runCallbacks(1)
+
+
+def getRunValues(model):
+    return model.getValuesForYears(model.getFirstStoredYear(), model.getCurrentYear()).copy()
+
+
+def test_rewindThenRestoreBranchRestoresOriginalYears(tkRoot, migratingFoodWeb):
+    model, controller = makeController(tkRoot, migratingFoodWeb)
+    startYear = model.getStartYear()
+    playYears(tkRoot, controller, 2*CHECKPOINT_INTERVAL + 30)
+    controller.overrideSeriesValue(TROUT, 5)
+    playYears(tkRoot, controller, 40)
+    originalEndYear = model.getCurrentYear()
+    originalValues = getRunValues(model)
+
+    # follow a different trajectory from an earlier year
+    rewindYear = startYear + CHECKPOINT_INTERVAL + 20
+    controller.rewindToYear(rewindYear)
+    assert model.getCurrentYear() == rewindYear
+    assert np.array_equal(getRunValues(model), originalValues[:rewindYear - startYear + 1])
+    controller.overrideSeriesValue(OSPREY, 0)
+    playYears(tkRoot, controller, 25)
+    assert controller.getBranchEndYears() == [originalEndYear]
+    assert not np.array_equal(getRunValues(model), originalValues[:model.getCurrentYear() - startYear + 1])
+
+    # switching back replays the original trajectory exactly
+    controller.restoreBranch()
+    assert model.getCurrentYear() == originalEndYear
+    assert np.array_equal(getRunValues(model), originalValues)
+    assert controller.getBranchEndYears() == [rewindYear + 25]
+
+
+def test_restoreBranchWithoutOverridesAfterRewindYear(tkRoot, migratingFoodWeb):
+    model, controller = makeController(tkRoot, migratingFoodWeb)
+    playYears(tkRoot, controller, 60)
+    originalValues = getRunValues(model)
+
+    # rewinding and playing on without any overrides follows the same trajectory
+    controller.rewindToYear(model.getStartYear() + 10)
+    playYears(tkRoot, controller, 20)
+    assert np.array_equal(getRunValues(model), originalValues[:31])
+
+    controller.restoreBranch()
+    assert np.array_equal(getRunValues(model), originalValues)
@@ -0,0 +1,93 @@
+#========================================================================
+#
+# test_runexport.py - tests of exporting and importing whole runs
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from runexport import RunExportStream, exportRun, importRun, loadRun, loadRunInfo
+from timeseriesmodel import TimeSeriesModel
+
+SERIES_IDS = ["A", "B", "C"]
+START_YEAR = 2024
+
+
+def makeModel(numYears, seed=0):
+    rng = np.random.default_rng(seed)
+    model = TimeSeriesModel()
+    model.reset(startYear=START_YEAR)
+    for seriesID in SERIES_IDS:
+        model.addTimeSeries(seriesID)
+    model.setCurrentValues({seriesID: 100.0 for seriesID in SERIES_IDS})
+    model.extendSeries({seriesID: rng.integers(0, 1000, numYears).astype(float) for seriesID in SERIES_IDS})
+    return model
+
+
+def getRunValues(model):
+    return model.getValuesForYears(model.getFirstStoredYear(), model.getCurrentYear())
+
+
+def test_exportImportRoundTrip(tmp_path):
+    model = makeModel(300)
+    filePath = str(tmp_path / "run.npz")
+    foodWebGraph = {"A": {}, "B": {}, "C": {}}
+    exportRun(model, filePath, foodWebGraph, {"migrationSeed": 7})
+
+    importedModel, metadata = importRun(filePath)
+    assert importedModel.getSeriesIDList() == SERIES_IDS
+    assert importedModel.getFirstStoredYear() == START_YEAR
+    assert importedModel.getCurrentYear() == START_YEAR + 300
+    assert np.array_equal(getRunValues(importedModel), getRunValues(model))
+    assert metadata["foodWebGraph"] == foodWebGraph
+    assert metadata["calculatorArgs"] == {"migrationSeed": 7}
+
+
+def test_importIntoExistingModelReplacesValues(tmp_path):
+    filePath = str(tmp_path / "run.npz")
+    exportRun(makeModel(50, seed=1), filePath)
+
+    model = makeModel(80, seed=2)
+    importRun(filePath, model)
+    assert model.getCurrentYear() == START_YEAR + 50
+    assert np.array_equal(getRunValues(model), getRunValues(makeModel(50, seed=1)))
+
+
+def test_importIntoModelWithOtherSeriesFails(tmp_path):
+    filePath = str(tmp_path / "run.npz")
+    exportRun(makeModel(10), filePath)
+
+    model = TimeSeriesModel()
+    model.addTimeSeries("Z")
+    with pytest.raises(ValueError):
+        importRun(filePath, model)
+    assert loadRunInfo(filePath)[0] == SERIES_IDS
+
+
+def test_streamCutShortLoadsWrittenYears(tmp_path):
+    model = makeModel(0)
+    filePath = str(tmp_path / "stream.npz")
+    exportStream = RunExportStream(model, filePath, chunkYears=10)
+    rng = np.random.default_rng(3)
+    for yearIdx in range(35):
+        model.extendSeries({seriesID: [float(rng.integers(0, 1000))] for seriesID in SERIES_IDS})
+
+    # read back without closing the stream, as if the run had been killed
+    seriesIDList, populations, metadata = loadRun(filePath)
+    numYearsWritten = len(populations)
+    assert seriesIDList == SERIES_IDS
+    assert 0 < numYearsWritten <= 35 and numYearsWritten % 10 == 0
+    assert metadata["startYear"] == START_YEAR
+    assert metadata["endYear"] == START_YEAR + numYearsWritten - 1
+    assert np.array_equal(populations, getRunValues(model)[:numYearsWritten])
+
+    importedModel, metadata = importRun(filePath)
+    assert importedModel.getCurrentYear() == START_YEAR + numYearsWritten - 1
+
+    # closing writes the rest
+    exportStream.close()
+    assert np.array_equal(loadRun(filePath)[1], getRunValues(model))
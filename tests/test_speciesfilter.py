@@ -0,0 +1,85 @@
+#========================================================================
+#
+# test_speciesfilter.py - tests of SpeciesFilter's matching and its
+#   change notifications
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from speciesfilter import SpeciesFilter
+
+SPECIES_ID_LIST = ["Algae", "Mayfly Larvae", "Caddisfly Larvae", "Trout", "Heron", "Detritus"]
+TROPHIC_LEVELS = {"Algae": 1, "Mayfly Larvae": 2, "Caddisfly Larvae": 2, "Trout": 3, "Heron": 4,
+                  "Detritus": None}
+
+
+class FilterRecorder:
+    def __init__(self):
+        self.filterDataList = []
+
+    def speciesFilterChanged(self, filterData):
+        self.filterDataList.append(filterData)
+
+
+def makeFilter():
+    speciesFilter = SpeciesFilter(SPECIES_ID_LIST, TROPHIC_LEVELS)
+    recorder = FilterRecorder()
+    speciesFilter.subscribeToFilterChanges(recorder)
+    return speciesFilter, recorder
+
+
+def test_everythingMatchesAtFirst():
+    speciesFilter, recorder = makeFilter()
+
+    assert speciesFilter.getMatchingSpeciesIDList() == SPECIES_ID_LIST
+    assert speciesFilter.getTrophicLevelChoices() == [1, 2, 3, 4]
+
+
+def test_searchTextMatchesAnywhereIgnoringCase():
+    speciesFilter, recorder = makeFilter()
+
+    speciesFilter.setSearchText("  LARV ")
+    assert speciesFilter.getMatchingSpeciesIDList() == ["Mayfly Larvae", "Caddisfly Larvae"]
+
+    speciesFilter.setSearchText("fly l")
+    assert speciesFilter.getMatchingSpeciesIDList() == ["Mayfly Larvae", "Caddisfly Larvae"]
+
+    speciesFilter.setSearchText("zebra")
+    assert speciesFilter.getMatchingSpeciesIDList() == []
+
+
+def test_trophicLevelAndSearchTextCombine():
+    speciesFilter, recorder = makeFilter()
+
+    speciesFilter.setTrophicLevel(2)
+    assert speciesFilter.getMatchingSpeciesIDList() == ["Mayfly Larvae", "Caddisfly Larvae"]
+
+    speciesFilter.setSearchText("may")
+    assert speciesFilter.getMatchingSpeciesIDList() == ["Mayfly Larvae"]
+
+    speciesFilter.setTrophicLevel(None)
+    speciesFilter.setSearchText("")
+    assert speciesFilter.getMatchingSpeciesIDList() == SPECIES_ID_LIST
+
+
+def test_subscribersHearOnlyOfChanges():
+    speciesFilter, recorder = makeFilter()
+
+    speciesFilter.setSearchText("trout")
+    speciesFilter.setSearchText("TROUT")
+    speciesFilter.setTrophicLevel(3)
+
+    assert recorder.filterDataList == [{"searchText": "trout", "trophicLevel": None, "speciesIDList": ["Trout"]}]
+
+
+def test_newSpeciesDropAMissingTrophicLevel():
+    speciesFilter, recorder = makeFilter()
+    speciesFilter.setTrophicLevel(4)
+
+    speciesFilter.setSpecies(["Algae", "Trout"], {"Algae": 1, "Trout": 3})
+
+    assert speciesFilter.getTrophicLevel() is None
+    assert speciesFilter.getMatchingSpeciesIDList() == ["Algae", "Trout"]
+    assert recorder.filterDataList[-1]["speciesIDList"] == ["Algae", "Trout"]
@@ -0,0 +1,213 @@
+#========================================================================
+#
+# test_timeseriesmodel.py - tests of TimeSeriesModel's subscriber updates
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from timeseriesmodel import TimeSeriesModel
+
+
+class DeltaRecorder:
+    """Rebuilds each series from the deltas it is sent, as a graph would"""
+    def __init__(self):
+        self.deltaDataList = []
+        self.seriesByYear = {}
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        # the values are a view into the model's storage, so copy them
+        deltaData = dict(deltaData, seriesValues=list(deltaData["seriesValues"]))
+        self.deltaDataList.append(deltaData)
+        seriesByYear = self.seriesByYear.setdefault(deltaData["seriesID"], {})
+        if deltaData["reset"]:
+            seriesByYear.clear()
+        for year in [year for year in seriesByYear if year >= deltaData["fromYear"]]:
+            del seriesByYear[year]
+        for yearOffset, value in enumerate(deltaData["seriesValues"]):
+            seriesByYear[deltaData["fromYear"] + yearOffset] = int(value)
+
+
+def makeModel(startYear=2000, seriesIDList=("a", "b")):
+    model = TimeSeriesModel()
+    model.reset(startYear)
+    for seriesID in seriesIDList:
+        model.addTimeSeries(seriesID)
+    return model
+
+
+def runYears(model, numYears):
+    """Advances numYears years, giving series "a" the year as its value"""
+    for yearIdx in range(numYears):
+        model.advanceYear()
+        model.setSeriesValue("a", model.getCurrentYear())
+
+
+def expectedSeries(model, seriesID):
+    firstYear = model.getFirstStoredYear()
+    return {firstYear + offset: int(value) for offset, value in enumerate(model.getSeriesValues(seriesID))}
+
+
+def test_deltasCarryOnlyNewYears():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder)
+
+    runYears(model, 5)
+
+    firstDelta = recorder.deltaDataList[0]
+    assert firstDelta["reset"] and firstDelta["fromYear"] == 2000
+    for deltaData in recorder.deltaDataList[1:]:
+        assert not deltaData["reset"]
+        assert deltaData["fromYear"] == deltaData["endYear"]
+        assert len(deltaData["seriesValues"]) == 1
+    assert recorder.seriesByYear["a"] == expectedSeries(model, "a")
+
+
+def test_editingAPastYearResendsFromThatYear():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder)
+    runYears(model, 10)
+
+    model.setSeriesValue("a", -5, 2003)
+
+    lastDelta = recorder.deltaDataList[-1]
+    assert lastDelta["fromYear"] == 2003 and lastDelta["endYear"] == 2010
+    assert recorder.seriesByYear["a"] == expectedSeries(model, "a")
+    assert recorder.seriesByYear["a"][2003] == -5
+
+
+def test_truncateAndEraseReplaceHeldValues():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder)
+    runYears(model, 10)
+
+    model.truncate(2004)
+    assert recorder.deltaDataList[-1]["fromYear"] == 2004
+    runYears(model, 2)
+    assert recorder.seriesByYear["a"] == expectedSeries(model, "a")
+
+    model.erase(1990)
+    assert recorder.deltaDataList[-1]["reset"]
+    runYears(model, 3)
+    assert recorder.seriesByYear["a"] == expectedSeries(model, "a")
+
+
+def test_windowedSubscriptionGetsTrailingValues():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder, windowSize=3)
+
+    runYears(model, 6)
+
+    lastDelta = recorder.deltaDataList[-1]
+    assert lastDelta["fromYear"] == 2004
+    assert lastDelta["seriesValues"] == [2004, 2005, 2006]
+
+
+def test_sinceYearSkipsEarlierHistory():
+    model = makeModel()
+    runYears(model, 10)
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder, sinceYear=2008)
+
+    model.setSeriesValue("a", 99)
+
+    assert recorder.deltaDataList[0]["fromYear"] == 2008
+    assert recorder.seriesByYear["a"] == {2008: 2008, 2009: 2009, 2010: 99}
+
+
+def test_unsubscribedGetsNothing():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToSeriesDeltas("a", recorder)
+    runYears(model, 2)
+
+    model.unsubscribeFromSeriesDeltas("a", recorder)
+    runYears(model, 2)
+
+    assert len(recorder.deltaDataList) == 2
+
+
+class BatchRecorder(DeltaRecorder):
+    """Also records the batches it is sent, passing their deltas on as singles"""
+    def __init__(self):
+        super().__init__()
+        self.batchDataList = []
+
+    def timeSeriesBatchUpdated(self, batchData):
+        self.batchDataList.append(batchData)
+        for deltaData in batchData["deltas"].values():
+            self.timeSeriesDeltaUpdated(deltaData)
+
+
+class YearRecorder:
+    def __init__(self):
+        self.yearDataList = []
+
+    def yearsUpdated(self, yearData):
+        self.yearDataList.append(yearData)
+
+
+def test_batchUpdateSendsOneBatch():
+    model = makeModel()
+    batchRecorder = BatchRecorder()
+    yearRecorder = YearRecorder()
+    model.subscribeToAllSeriesDeltas(batchRecorder)
+    model.subscribeToYearChange(yearRecorder)
+
+    with model.batchUpdate():
+        for yearIdx in range(5):
+            model.advanceYear()
+            model.setCurrentValues({"a": yearIdx, "b": 10*yearIdx})
+
+    assert len(batchRecorder.batchDataList) == 1
+    assert len(yearRecorder.yearDataList) == 1
+    batchData = batchRecorder.batchDataList[0]
+    assert batchData["endYear"] == 2005
+    assert set(batchData["deltas"]) == {"a", "b"}
+    assert batchRecorder.seriesByYear == {"a": expectedSeries(model, "a"), "b": expectedSeries(model, "b")}
+
+
+def test_nestedBatchesSendAtTheOuterEnd():
+    model = makeModel()
+    batchRecorder = BatchRecorder()
+    model.subscribeToAllSeriesDeltas(batchRecorder)
+
+    with model.batchUpdate():
+        with model.batchUpdate():
+            runYears(model, 3)
+        assert batchRecorder.batchDataList == []
+        runYears(model, 3)
+
+    assert len(batchRecorder.batchDataList) == 1
+    assert list(batchRecorder.batchDataList[0]["deltas"]) == ["a"]
+    assert batchRecorder.seriesByYear["a"] == expectedSeries(model, "a")
+
+
+def test_batchFallsBackToDeltasWithoutBatchSupport():
+    model = makeModel()
+    recorder = DeltaRecorder()
+    model.subscribeToAllSeriesDeltas(recorder)
+
+    with model.batchUpdate():
+        runYears(model, 4)
+        model.setSeriesValue("b", 7)
+
+    assert sorted(deltaData["seriesID"] for deltaData in recorder.deltaDataList) == ["a", "b"]
+    assert recorder.seriesByYear == {"a": expectedSeries(model, "a"), "b": expectedSeries(model, "b")}
+
+
+def test_unchangedSeriesAreLeftOutOfTheBatch():
+    model = makeModel()
+    batchRecorder = BatchRecorder()
+    model.subscribeToAllSeriesDeltas(batchRecorder)
+    model.informAllSubscribers()
+
+    with model.batchUpdate():
+        model.setSeriesValue("b", 3)
+
+    assert list(batchRecorder.batchDataList[-1]["deltas"]) == ["b"]
@@ -0,0 +1,101 @@
+#========================================================================
+#
+# test_timeseriesstorage.py - tests of ArrayTimeSeriesStorage
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+import pytest
+
+from timeseriesstorage import ArrayTimeSeriesStorage
+
+
+def makeRows(firstRow, numRows, numColumns):
+    """Rows whose values encode their absolute row and column"""
+    rows = np.arange(firstRow, firstRow + numRows)[:, np.newaxis]
+    return rows*10 + np.arange(numColumns)
+
+
+def test_growthKeepsEveryRow():
+    storage = ArrayTimeSeriesStorage(initialCapacity=2)
+    storage.clear(3)
+    storage.setLastRow([0, 1, 2])
+
+    # appended in uneven chunks, so the capacity doubles several times
+    for numRows in [1, 3, 7, 20, 100]:
+        storage.appendRows(numRows, makeRows(storage.getNumRows(), numRows, 3))
+
+    assert storage.getNumRows() == 132
+    assert storage.getFirstRow() == 0
+    assert np.array_equal(storage.getRows(), makeRows(0, 132, 3))
+    assert np.array_equal(storage.getColumn(2), makeRows(0, 132, 3)[:, 2])
+    assert storage.getValue(131, 1) == 1311
+
+
+def test_appendWithoutValuesRepeatsLastRow():
+    storage = ArrayTimeSeriesStorage(initialCapacity=4)
+    storage.clear(2)
+    storage.setLastRow([5, 6])
+
+    storage.appendRows(10)
+
+    assert np.array_equal(storage.getRows(), np.tile([5, 6], (11, 1)))
+
+
+def test_addColumnAfterRows():
+    storage = ArrayTimeSeriesStorage(initialCapacity=4)
+    storage.clear(1)
+    storage.appendRows(5, np.ones((5, 1)))
+
+    assert storage.addColumn("new") == 1
+    assert storage.getColumnIDs() == [None, "new"]
+    assert np.array_equal(storage.getColumn(1), np.zeros(6))
+
+
+@pytest.mark.parametrize("chunkSize", [1, 3, 8, 25])
+def test_ringBufferWrapKeepsNewestRows(chunkSize):
+    maxRows = 8
+    storage = ArrayTimeSeriesStorage(maxRows=maxRows)
+    storage.clear(2)
+    storage.setLastRow([0, 1])
+
+    while storage.getNumRows() < 100:
+        storage.appendRows(chunkSize, makeRows(storage.getNumRows(), chunkSize, 2))
+
+        numRows = storage.getNumRows()
+        firstRow = max(0, numRows - maxRows)
+        assert storage.getFirstRow() == firstRow
+        rows = storage.getRows()
+        # retained rows are one contiguous, read-only view, oldest first
+        assert np.array_equal(rows, makeRows(firstRow, numRows - firstRow, 2))
+        assert not rows.flags.writeable
+        assert np.array_equal(storage.getLastRow(), makeRows(numRows-1, 1, 2)[0])
+
+    # rows that have been overwritten are gone, except the very first
+    assert storage.getValue(1, 0) is None
+    assert storage.getValue(0, 1) == 1
+
+
+def test_ringBufferSetValueAndPartialRows():
+    storage = ArrayTimeSeriesStorage(maxRows=5)
+    storage.clear(1)
+    storage.appendRows(12, makeRows(1, 12, 1))
+
+    storage.setValue(10, 0, -1)
+
+    assert np.array_equal(storage.getRows(9, 12).ravel(), [90, -1, 110])
+    assert np.array_equal(storage.getRows(0, 3), np.empty((0, 1)))
+
+
+def test_truncateKeepsOldestRetainedRow():
+    storage = ArrayTimeSeriesStorage(maxRows=4)
+    storage.clear(1)
+    storage.appendRows(10, makeRows(1, 10, 1))
+
+    storage.truncateRows(2)
+
+    assert storage.getNumRows() == 8
+    assert np.array_equal(storage.getRows().ravel(), [70])
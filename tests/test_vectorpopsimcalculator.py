@@ -0,0 +1,88 @@
+#========================================================================
+#
+# test_vectorpopsimcalculator.py - tests that VectorPopSimCalculator
+#   matches PopSimCalculator
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import random
+
+import numpy as np
+import pytest
+
+from foodwebgenerator import makeRandomFoodWeb
+from popsimcalculator import *
+from vectorpopsimcalculator import VectorPopSimCalculator
+
+NUM_YEARS = 200
+MIGRATION_SEED = 5
+
+
+def runReference(foodWebGraph, startPopulations, numYears):
+    calculator = PopSimCalculator(foodWebGraph, migrationSeed=MIGRATION_SEED)
+    populations = dict(startPopulations)
+    yearPopulationsList = [populations]
+    for year in range(1, numYears+1):
+        populations = calculator.doSimulation(populations, year)
+        yearPopulationsList.append(populations)
+    return yearPopulationsList
+
+
+def randomStartPopulations(foodWebGraph, seed):
+    rng = random.Random(seed)
+    return {speciesID: rng.randint(0, 100000) for speciesID in foodWebGraph}
+
+
+@pytest.mark.parametrize("foodWebGraph", [FOOD_WEB_GRAPH] + [makeRandomFoodWeb(numSpecies, seed)
+                                                             for numSpecies, seed in [(5, 1), (20, 2), (60, 3)]])
+def test_doSimulationMatchesReference(foodWebGraph):
+    startPopulations = randomStartPopulations(foodWebGraph, 7)
+    vectorCalculator = VectorPopSimCalculator(foodWebGraph, migrationSeed=MIGRATION_SEED)
+
+    populations = dict(startPopulations)
+    for year, expectedPopulations in enumerate(runReference(foodWebGraph, startPopulations, NUM_YEARS)):
+        assert populations == expectedPopulations, f"year {year}"
+        populations = vectorCalculator.doSimulation(populations, year+1)
+
+
+def test_migrationMatchesReference(migratingFoodWeb):
+    startPopulations = randomStartPopulations(migratingFoodWeb, 8)
+    vectorCalculator = VectorPopSimCalculator(migratingFoodWeb, migrationSeed=MIGRATION_SEED)
+
+    populations = dict(startPopulations)
+    for year, expectedPopulations in enumerate(runReference(migratingFoodWeb, startPopulations, NUM_YEARS)):
+        assert populations == expectedPopulations, f"year {year}"
+        populations = vectorCalculator.doSimulation(populations, year+1)
+
+
+def test_scenarioRunsAreReproducible():
+    foodWebGraph = makeRandomFoodWeb(15, 4, withMigration=True)
+    numSpecies = len(foodWebGraph)
+    initialPopulations = np.random.default_rng(9).integers(0, 100000, (4, numSpecies)).astype(np.float64)
+
+    firstRun = VectorPopSimCalculator(foodWebGraph, migrationSeed=MIGRATION_SEED).runSimulationArray(
+        initialPopulations, 50, startYear=0)
+    secondRun = VectorPopSimCalculator(foodWebGraph, migrationSeed=MIGRATION_SEED).runSimulationArray(
+        initialPopulations, 50, startYear=0)
+
+    assert firstRun.shape == (4, 51, numSpecies)
+    assert np.array_equal(firstRun, secondRun)
+    assert np.all(firstRun >= 0)
+    assert np.all(firstRun == np.trunc(firstRun))
+
+
+def test_scenariosWithoutMigrationMatchReference():
+    foodWebGraph = makeRandomFoodWeb(15, 4)
+    vectorCalculator = VectorPopSimCalculator(foodWebGraph)
+    speciesIDList = vectorCalculator.getSpeciesIDList()
+    initialPopulations = np.random.default_rng(9).integers(0, 100000, (3, len(speciesIDList))).astype(np.float64)
+
+    batch = vectorCalculator.runSimulationArray(initialPopulations, 50)
+
+    for scenarioIdx in range(3):
+        startPopulations = dict(zip(speciesIDList, initialPopulations[scenarioIdx].astype(int).tolist()))
+        for yearIdx, expectedPopulations in enumerate(runReference(foodWebGraph, startPopulations, 50)):
+            assert vectorCalculator.arrayToPopulations(batch[scenarioIdx, yearIdx]) == expectedPopulations
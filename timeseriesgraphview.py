@@ -10,90 +10,210 @@
 import tkinter as tk
 
 from baseview import BaseView
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from timeseriesplot import TimeSeriesPlot
 
 
 class TimeSeriesGraphView(BaseView):
+    """Graph of one time series, drawn by a TimeSeriesPlot onto a Tk canvas.
+
+    The matplotlib figure is only created once the view is first shown (its
+    frame gets a size), and then from the Tk event loop, so the window appears
+    before any graphs are built and graphs never shown are never built.
+    matplotlib itself is only imported then.  The series history is read from
+    the model when the graph is created, or when the view is switched to show
+    another series (see setSeriesID), so views can be reused for any series.
+
+    Resizes are debounced: the graph is only resized and redrawn once no
+    more resize events have come for RESIZE_DEBOUNCE_DELAY ms.
+
+    If a RenderScheduler is given, updates only mark the graph dirty and the
+    scheduler redraws it at a capped frame rate; otherwise it redraws on every
+    update.
+
+    Ensemble statistics sent by the controller are shown as a confidence band
+    between BAND_QUANTILES.
+
+    If a SharedFigureView is given, the view draws nothing itself: it drives
+    the plot in slot slotIdx of the shared figure instead, which it gets once
+    that figure is created, and its updates mark the shared figure dirty.
+    """
     DPI = 72
-    FONT_SIZE = 18
+    BAND_QUANTILES = (0.05, 0.5, 0.95)
+    RESIZE_DEBOUNCE_DELAY = 150
 
-    def __init__(self, tkRoot, model, seriesID, controller):
+    def __init__(self, tkRoot, model, seriesID, controller, renderScheduler=None,
+                 sharedFigure=None, slotIdx=None):
         super().__init__(tkRoot)
+        self.__tkRoot = tkRoot
         self.__model = model
         self.__controller = controller
+        self.__renderScheduler = renderScheduler
+        self.__sharedFigure = sharedFigure
+        self.__slotIdx = slotIdx
 
         self.__seriesID = seriesID
 
-        # create the canvas on which to draw the graph
-        self.__graphCanvas = tk.Canvas(self.getWidget())
-        self.__graphCanvas.pack(fill=tk.BOTH)
-
-        self.getWidget().bind("<Configure>", lambda event: self.widgetResized(event))
-
-        # create the matplotlib link
-        self.__figure = Figure(dpi=TimeSeriesGraphView.DPI)
+        # create the canvas on which to draw the graph (unless drawn in the shared figure)
+        self.__graphCanvas = None
+        if sharedFigure is None:
+            self.__graphCanvas = tk.Canvas(self.getWidget())
+            self.__graphCanvas.pack(fill=tk.BOTH)
 
-        self.__graph = FigureCanvasTkAgg(self.__figure, self.__graphCanvas)
-        self.__graph.get_tk_widget().bind("<Configure>", lambda event: self.canvasResized(event))
+            self.getWidget().bind("<Configure>", lambda event: self.widgetResized(event))
 
-        self.__plot = self.__figure.add_subplot(1, 1, 1)
-        self.__plot.set_aspect('auto')
-        self.__plot.spines['top'].set_visible(False)
-        self.__plot.spines['right'].set_visible(False)
+        # the matplotlib figure, canvas and plot, created when first shown
+        self.__figure = None
+        self.__graph = None
+        self.__timeSeriesPlot = None
+        self.__creationPending = False
 
-        self.__plot.set_title(seriesID, fontsize=TimeSeriesGraphView.FONT_SIZE)
-        self.__plot.set_xlabel("Year", fontsize=TimeSeriesGraphView.FONT_SIZE)
-        self.__plot.set_xlim([0, 10])
-        self.__plot.set_ylabel("Population", fontsize=TimeSeriesGraphView.FONT_SIZE)
-        self.__plot.set_ylim([0, 10])
+        # the latest ensemble statistics, kept for whichever series is shown
+        self.__statistics = None
 
-        self.__populationLine, = self.__plot.plot([0, 1], [0, 0]) # apparently plot returns a tuple
+        # the latest resize event, applied once resizing stops
+        self.__resizeEvent = None
+        self.__resizeAfterID = None
 
-        self.__graph.get_tk_widget().pack()
+        # subscribe to ensemble results
+        self.__controller.subscribeToEnsembleStatistics(self)
 
-        # subscribe to changes in the time series
-        self.__model.subscribeToSeries(self.__seriesID, self)
+        if sharedFigure is not None:
+            sharedFigure.addSlotGraph(slotIdx, self)
 
         # for layout debug
         # self.getWidget().config(bg='red')
         # label = tk.Label(self.getWidget(), text=str(seriesID))
         # label.grid(row=0, column=0, sticky=tk.N+tk.E+tk.S+tk.W)
 
-    def timeSeriesUpdated(self, seriesData):
-        """Re-plot time series to canvas"""
-
-        popValues = seriesData["seriesValues"]
+    def isGraphCreated(self):
+        return self.__timeSeriesPlot is not None
 
-        # calc x bounds
-        startYear, endYear = seriesData["startYear"], seriesData["endYear"]
-        upperXBound = endYear
-        if endYear - startYear < 10:
-            upperXBound = startYear + 10
-        self.__plot.set_xlim([startYear, upperXBound])
+    def getSeriesID(self):
+        return self.__seriesID
 
-        # calc y bounds
-        maxPop = max(popValues)
-        lowerYBound, upperYBound = self.__plot.get_ylim()
-        if maxPop > 0:
-            while upperYBound > 2*maxPop:
-                upperYBound /= 1.5
-        while upperYBound < maxPop:
-            upperYBound *= 1.5
-        self.__plot.set_ylim([lowerYBound, upperYBound])
+    def setSeriesID(self, seriesID):
+        """Switches the graph to show another series (or none, if None)"""
+        if seriesID == self.__seriesID:
+            return
 
-        # update the data
-        self.__populationLine.set_xdata(list(range(startYear, endYear+1)))
-        self.__populationLine.set_ydata(popValues)
-
-        self.__graph.draw()
-        self.__graph.flush_events()
+        if self.__timeSeriesPlot is not None and self.__seriesID is not None:
+            self.__model.unsubscribeFromSeriesDeltas(self.__seriesID, self)
+        self.__seriesID = seriesID
+        if self.__sharedFigure is not None:
+            self.__sharedFigure.setSlotShown(self.__slotIdx, seriesID is not None)
+
+        if self.__timeSeriesPlot is not None and self.__seriesID is not None:
+            self.__loadSeries()
+            self.__requestRender()
+
+    def sharedFigureCreated(self, timeSeriesPlot):
+        """Takes on the plot in this view's slot of the shared figure"""
+        self.__timeSeriesPlot = timeSeriesPlot
+        if self.__seriesID is not None:
+            self.__sharedFigure.setSlotShown(self.__slotIdx, True)
+            self.__loadSeries()
+            self.__requestRender()
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        """Merge the changed values into the plotted history and re-plot"""
+        self.__timeSeriesPlot.mergeDelta(deltaData)
+        self.__requestRender()
+
+    def ensembleStatisticsUpdated(self, statistics):
+        """Show the series' confidence band from an EnsembleStatistics (or clear it, if None)"""
+        self.__statistics = statistics
+        if self.__timeSeriesPlot is not None and self.__seriesID is not None:
+            self.__showConfidenceBand()
+            self.__requestRender()
+
+    def render(self):
+        """Re-plot time series to canvas"""
+        if self.__sharedFigure is not None:
+            self.__sharedFigure.render()
+        elif self.__timeSeriesPlot is not None and self.__seriesID is not None:
+            self.__timeSeriesPlot.render()
 
     def canvasResized(self, event):
         #print(f"Resized canvas to:{event.width},{event.height}")
         pass
 
     def widgetResized(self, event):
+        """Keeps the latest size, to apply once the resizing stops"""
+        if event.width <= 1 or event.height <= 1:
+            return
+
+        self.__resizeEvent = event
+        if self.__timeSeriesPlot is None:
+            if not self.__creationPending:
+                # let the window finish appearing (and any other events through) first
+                self.__creationPending = True
+                self.__tkRoot.after(0, lambda: self.__tkRoot.after_idle(self.__createGraph))
+            return
+
+        if self.__resizeAfterID is not None:
+            self.__tkRoot.after_cancel(self.__resizeAfterID)
+        self.__resizeAfterID = self.__tkRoot.after(TimeSeriesGraphView.RESIZE_DEBOUNCE_DELAY,
+                                                   self.__applyResize)
+
+    def __requestRender(self):
+        if self.__sharedFigure is not None:
+            self.__sharedFigure.markDirty()
+        elif self.__renderScheduler is None:
+            self.render()
+        else:
+            self.__renderScheduler.markDirty(self)
+
+    def __createGraph(self):
+        """Creates the matplotlib figure and plot, loaded with the series so far"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.__creationPending = False
+
+        # create the matplotlib link
+        self.__figure = Figure(dpi=TimeSeriesGraphView.DPI)
+
+        self.__graph = FigureCanvasTkAgg(self.__figure, self.__graphCanvas)
+        self.__graph.get_tk_widget().bind("<Configure>", lambda event: self.canvasResized(event))
+
+        self.__timeSeriesPlot = TimeSeriesPlot(self.__figure, self.__graph, self.__seriesID)
+
+        self.__graph.get_tk_widget().pack()
+
+        if self.__seriesID is not None:
+            self.__loadSeries()
+
+        self.__applyResize()
+
+    def __loadSeries(self):
+        """Starts the plot from the series' history so far, then subscribes to
+        changes in the time series after it"""
+        firstStoredYear = self.__model.getFirstStoredYear()
+        currentYear = self.__model.getCurrentYear()
+        self.__timeSeriesPlot.setSeriesID(self.__seriesID)
+        self.__timeSeriesPlot.mergeDelta({
+            "startYear": firstStoredYear,
+            "endYear": currentYear,
+            "seriesID": self.__seriesID,
+            "fromYear": firstStoredYear,
+            "reset": True,
+            "seriesValues": self.__model.getSeriesValues(self.__seriesID)
+        })
+        self.__model.subscribeToSeriesDeltas(self.__seriesID, self, sinceYear=currentYear+1)
+
+        self.__showConfidenceBand()
+
+    def __showConfidenceBand(self):
+        if self.__statistics is None:
+            self.__timeSeriesPlot.clearConfidenceBand()
+        else:
+            seriesStats = self.__statistics.getSeriesStats(self.__seriesID, TimeSeriesGraphView.BAND_QUANTILES)
+            lowerValues, medianValues, upperValues = seriesStats["quantiles"].values()
+            self.__timeSeriesPlot.setConfidenceBand(seriesStats["years"], lowerValues, medianValues, upperValues)
+
+    def __applyResize(self):
+        self.__resizeAfterID = None
+        event = self.__resizeEvent
         #print(f"Resizing widget to:{event.width},{event.height}")
         self.__figure.set_size_inches(event.width/TimeSeriesGraphView.DPI,
                                       event.height/TimeSeriesGraphView.DPI)
@@ -102,5 +222,5 @@ class TimeSeriesGraphView(BaseView):
         #print("Calling resize on graph")
         self.__graph.resize(event)
         #print("Calling draw on graph")
-        self.__graph.draw()
-
+        self.__timeSeriesPlot.invalidateBackground()
+        self.render()
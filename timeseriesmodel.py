@@ -8,45 +8,136 @@
 #
 #========================================================================
 
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+from phasetimer import PHASE_TIMER
+from timeseriesstorage import ArrayTimeSeriesStorage
+
+
 class TimeSeriesModel:
-    def __init__(self):
+    """Holds a named collection of yearly time series.
+
+    Subscribers are sent only what changed since they were last informed:
+    deltas carry the values from "fromYear" to "endYear" (a read-only view
+    into the storage), which replace anything the subscriber held for those
+    years.  When "reset" is set, anything held for earlier years is stale too.
+    A subscriber may instead ask for a fixed trailing window of values.
+
+    Values are held in a storage object (ArrayTimeSeriesStorage by default,
+    or e.g. a file-backed MemmapTimeSeriesStorage).  With restore set, the
+    model takes its series, start year and values from the storage as it is
+    (e.g. a reopened file) rather than clearing it.
+
+    Changes made inside a batchUpdate() block are sent once at the end of the
+    block, as a single timeSeriesBatchUpdated(...) call per subscriber where
+    the subscriber supports it.
+    """
+    def __init__(self, storage=None, restore=False):
+        if storage is None:
+            storage = ArrayTimeSeriesStorage()
+
         self.__startYear = 0
         self.__endYear = self.__startYear
-        self.__timeSeriesDict = {}
+        self.__storage = storage
+        self.__seriesColumns = {}
         self.__timeSeriesSubscribers = {}
         self.__yearSubscribers = []
+        self.__version = 0
+
+        if restore:
+            self.__startYear = self.__storage.getStartYear()
+            self.__endYear = self.__startYear + self.__storage.getNumRows() - 1
+            for column, seriesID in enumerate(self.__storage.getColumnIDs()):
+                self.__seriesColumns[seriesID] = column
+                self.__timeSeriesSubscribers[seriesID] = []
+        else:
+            self.__storage.clear()
+            self.__storage.setStartYear(self.__startYear)
+
+        # deferred notifications while inside batchUpdate()
+        self.__batchDepth = 0
+        self.__batchYearChanged = False
+        self.__batchSeriesIDs = {}
 
     def reset(self, startYear=0):
         self.__startYear = startYear
         self.__endYear = self.__startYear
-        self.__timeSeriesDict = {}
+        self.__version += 1
+        self.__storage.clear()
+        self.__storage.setStartYear(startYear)
+        self.__seriesColumns = {}
         self.__timeSeriesSubscribers = {}
         self.__yearSubscribers = []
 
     def addTimeSeries(self, seriesID):
         """Creates a new time series and associated subscriber list"""
-        self.__timeSeriesDict[seriesID] = [0]
+        self.__seriesColumns[seriesID] = self.__storage.addColumn(seriesID)
         self.__timeSeriesSubscribers[seriesID] = []
 
     def getSeriesIDList(self):
         """Get the list of time series that exist in the model"""
-        return list(self.__timeSeriesDict.keys())
+        return list(self.__seriesColumns.keys())
 
     def subscribeToSeries(self, seriesID, subscriber):
-        """registers the subscriber to get timeSeriesUpdated(...) calls when it is changed"""
-        if seriesID in self.__timeSeriesDict:
-            self.__timeSeriesSubscribers[seriesID].append(subscriber)
+        """registers the subscriber to get timeSeriesUpdated(...) calls, with
+        the whole series history, when it is changed"""
+        self.subscribeToSeriesDeltas(seriesID, _FullSeriesAdapter(self, subscriber))
 
     def subscribeToAllSeries(self, subscriber):
-        for seriesID in self.__timeSeriesDict:
+        for seriesID in self.__seriesColumns:
             self.subscribeToSeries(seriesID, subscriber)
 
+    def subscribeToSeriesDeltas(self, seriesID, subscriber, windowSize=None, sinceYear=None):
+        """registers the subscriber to get timeSeriesDeltaUpdated(...) calls with
+        only the values changed since it was last informed.
+        If windowSize is given, each call instead carries the most recent
+        windowSize values.  If sinceYear is given, the first call starts from
+        that year rather than sending the whole stored history.
+        """
+        if seriesID in self.__seriesColumns:
+            self.__timeSeriesSubscribers[seriesID].append(_SeriesSubscription(subscriber, windowSize, sinceYear))
+
+    def unsubscribeFromSeriesDeltas(self, seriesID, subscriber):
+        """stops the subscriber getting timeSeriesDeltaUpdated(...) calls for the series"""
+        if seriesID in self.__timeSeriesSubscribers:
+            self.__timeSeriesSubscribers[seriesID] = [subscription
+                                                      for subscription in self.__timeSeriesSubscribers[seriesID]
+                                                      if subscription.getSubscriber() is not subscriber]
+
+    def subscribeToAllSeriesDeltas(self, subscriber, windowSize=None):
+        for seriesID in self.__seriesColumns:
+            self.subscribeToSeriesDeltas(seriesID, subscriber, windowSize)
+
     def subscribeToYearChange(self, subscriber):
         self.__yearSubscribers.append(subscriber)
 
+    @contextmanager
+    def batchUpdate(self):
+        """Defers all subscriber updates until the end of the with-block, then
+        sends each subscriber one consolidated update"""
+        self.__batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.__batchDepth -= 1
+            if self.__batchDepth == 0:
+                self.__informBatchSubscribers()
+
     def getStartYear(self):
         return self.__startYear
 
+    def getFirstStoredYear(self):
+        """returns the oldest year whose values are still held (later than the
+        start year only if the storage is a bounded ring buffer)"""
+        return self.__startYear + self.__storage.getFirstRow()
+
+    def getVersion(self):
+        """returns a number that increases every time the model's values change"""
+        return self.__version
+
     def getCurrentYear(self):
         """returns most recent year in model's timeseries"""
         return self.__endYear
@@ -56,19 +147,51 @@ class TimeSeriesModel:
         Does not trigger subscriber update.
         """
         self.__endYear += 1
+        self.__version += 1
+        # new year starts with a copy of the most recent values
+        self.__storage.appendRows(1)
+
+        self.__informYearSubscribers()
 
-        numSeriesEntries = (self.__endYear - self.__startYear)+1
-        for seriesID, values in self.__timeSeriesDict.items():
-            # if list is empty, extend with 0, otherwise, copy most recent value
-            valueToAdd = 0
-            if len(values) > 0:
-                valueToAdd = values[-1]
+    def extendSeries(self, newValuesDict):
+        """Appends several years to the time series in one go, informing
+        subscribers once rather than once per year.
+        newValuesDict maps seriesIDs to equal-length sequences of values for
+        the years following the current year.  Series not in newValuesDict
+        repeat their most recent value.
+        """
+        numNewYears = max([len(values) for values in newValuesDict.values()], default=0)
+        if numNewYears == 0:
+            return
 
-            if len(values) < numSeriesEntries:
-                numToAdd = numSeriesEntries - len(values)
-                self.__timeSeriesDict[seriesID] += [valueToAdd]*numToAdd
+        newRows = np.empty((numNewYears, self.__storage.getNumColumns()))
+        newRows[:] = self.__storage.getLastRow()
+        for seriesID, values in newValuesDict.items():
+            if seriesID in self.__seriesColumns:
+                newRows[:, self.__seriesColumns[seriesID]] = values
 
-        self.__informYearSubscribers()
+        self.__endYear += numNewYears
+        self.__version += 1
+        self.__storage.appendRows(numNewYears, newRows)
+
+        self.informAllSubscribers()
+
+    def truncate(self, endYear):
+        """Drops every year after endYear, making it the current year.
+        Subscribers are sent endYear again, which replaces (and so ends)
+        whatever they held from it onwards."""
+        endYear = max(endYear, self.getFirstStoredYear())
+        if endYear >= self.__endYear:
+            return
+
+        self.__endYear = endYear
+        self.__version += 1
+        self.__storage.truncateRows(endYear - self.__startYear + 1)
+        for subscriptions in self.__timeSeriesSubscribers.values():
+            for subscription in subscriptions:
+                subscription.valueChanged(endYear)
+
+        self.informAllSubscribers()
 
     def getSeriesValue(self, seriesID, year=None):
         """Get a value from a time series.
@@ -78,31 +201,42 @@ class TimeSeriesModel:
         if year is None:
             year = self.__endYear
 
-        if seriesID in self.__timeSeriesDict.keys():
-            series = self.__timeSeriesDict[seriesID]
-            idx = year - self.__startYear
-            if idx < len(series):
-                result = series[idx]
+        if seriesID in self.__seriesColumns.keys():
+            value = self.__storage.getValue(year - self.__startYear, self.__seriesColumns[seriesID])
+            if value is not None:
+                result = int(value)
 
         return result
 
+    def getSeriesValues(self, seriesID):
+        """Get a read-only view of all the stored values of a time series,
+        starting at getFirstStoredYear()"""
+        return self.__storage.getColumn(self.__seriesColumns[seriesID])
+
+    def getValuesForYears(self, firstYear, lastYear):
+        """Get a read-only view, of shape (years, series) with columns ordered as
+        getSeriesIDList(), of the stored values from firstYear to lastYear
+        inclusive.  Only those years are read from the storage."""
+        return self.__storage.getRows(firstYear - self.__startYear, lastYear - self.__startYear + 1)
+
     def setSeriesValue(self, seriesID, newValue, year=None):
         if year is None:
             year = self.__endYear
 
-        if seriesID in self.__timeSeriesDict.keys():
-            series = self.__timeSeriesDict[seriesID]
-            idx = year - self.__startYear
-            if idx < len(series):
-                series[idx] = newValue
+        if seriesID in self.__seriesColumns.keys():
+            self.__storage.setValue(year - self.__startYear, self.__seriesColumns[seriesID], newValue)
+            self.__version += 1
+            for subscription in self.__timeSeriesSubscribers[seriesID]:
+                subscription.valueChanged(year)
 
             # inform subscribers of change in time series
             self.__informTimeSeriesSubscribers(seriesID)
 
     def getCurrentValues(self):
         result = {}
-        for seriesID, valueList in self.__timeSeriesDict.items():
-            result[seriesID] = valueList[-1]
+        lastRow = self.__storage.getLastRow()
+        for seriesID, column in self.__seriesColumns.items():
+            result[seriesID] = int(lastRow[column])
         return result
 
     def setCurrentValues(self, newValuesDict):
@@ -116,34 +250,166 @@ class TimeSeriesModel:
         # reset start and end year
         self.__startYear = startYear
         self.__endYear = self.__startYear
+        self.__version += 1
 
         # reset all time series
-        for seriesID in self.__timeSeriesDict.keys():
-            self.__timeSeriesDict[seriesID] = [0]
+        self.__storage.clear(len(self.__seriesColumns))
+        self.__storage.setStartYear(startYear)
+        for subscriptions in self.__timeSeriesSubscribers.values():
+            for subscription in subscriptions:
+                subscription.invalidate()
 
         # inform all subsribers
-        self.__informYearSubscribers()
-        for seriesID in self.__timeSeriesDict.keys():
-            self.__informTimeSeriesSubscribers(seriesID)
+        self.informAllSubscribers()
 
     def informAllSubscribers(self):
-        self.__informYearSubscribers()
-        for seriesID in self.__timeSeriesDict:
-            self.__informTimeSeriesSubscribers(seriesID)
+        with self.batchUpdate():
+            self.__informYearSubscribers()
+            for seriesID in self.__seriesColumns:
+                self.__informTimeSeriesSubscribers(seriesID)
 
     def __informYearSubscribers(self):
+        if self.__batchDepth > 0:
+            self.__batchYearChanged = True
+            return
+
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
         yearData = { "startYear": self.__startYear,
                      "endYear": self.__endYear
                      }
         for subscriber in self.__yearSubscribers:
             subscriber.yearsUpdated(yearData)
 
+        if timing:
+            PHASE_TIMER.record("TimeSeriesModel.yearNotification", startTime)
+
     def __informTimeSeriesSubscribers(self, seriesID):
+        if self.__batchDepth > 0:
+            self.__batchSeriesIDs[seriesID] = True
+            return
+
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        for subscriber, deltaData in self.__collectSeriesDeltas(seriesID):
+            subscriber.timeSeriesDeltaUpdated(deltaData)
+
+        if timing:
+            PHASE_TIMER.record("TimeSeriesModel.seriesNotification", startTime)
+
+    def __informBatchSubscribers(self):
+        if self.__batchYearChanged:
+            self.__batchYearChanged = False
+            self.__informYearSubscribers()
+
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        # gather each subscriber's deltas across all the changed series
+        deltasBySubscriber = {}
+        for seriesID in self.__batchSeriesIDs:
+            for subscriber, deltaData in self.__collectSeriesDeltas(seriesID):
+                subscriberDeltas = deltasBySubscriber.setdefault(id(subscriber), (subscriber, {}))[1]
+                subscriberDeltas[seriesID] = deltaData
+        self.__batchSeriesIDs = {}
+
+        for subscriber, deltas in deltasBySubscriber.values():
+            if hasattr(subscriber, "timeSeriesBatchUpdated"):
+                batchData = {
+                    "startYear": self.getFirstStoredYear(),
+                    "endYear": self.__endYear,
+                    "version": self.__version,
+                    "deltas": deltas
+                }
+                subscriber.timeSeriesBatchUpdated(batchData)
+            else:
+                for deltaData in deltas.values():
+                    subscriber.timeSeriesDeltaUpdated(deltaData)
+
+        if timing:
+            PHASE_TIMER.record("TimeSeriesModel.batchNotification", startTime)
+
+    def __collectSeriesDeltas(self, seriesID):
+        """returns (subscriber, deltaData) for each subscriber with something new to be sent"""
+        result = []
+        firstStoredYear = self.getFirstStoredYear()
+        seriesValues = self.__storage.getColumn(self.__seriesColumns[seriesID])
+
+        for subscription in self.__timeSeriesSubscribers[seriesID]:
+            fromYear, reset = subscription.getPendingYears(firstStoredYear, self.__endYear)
+            if fromYear is None:
+                continue
+
+            # seriesValues is a read-only view into the storage, only valid until the model next changes
+            deltaData = {
+                "startYear": firstStoredYear,
+                "endYear": self.__endYear,
+                "seriesID": seriesID,
+                "fromYear": fromYear,
+                "reset": reset,
+                "version": self.__version,
+                "seriesValues": seriesValues[fromYear - firstStoredYear:]
+            }
+            subscription.informed(self.__endYear)
+            result.append((subscription.getSubscriber(), deltaData))
+
+        return result
+
+
+class _SeriesSubscription:
+    """Keeps track of which years of a series one subscriber has been sent"""
+    def __init__(self, subscriber, windowSize=None, sinceYear=None):
+        self.__subscriber = subscriber
+        self.__windowSize = windowSize
+        # first year the subscriber does not yet have (None means it has nothing)
+        self.__nextYear = sinceYear
+
+    def getSubscriber(self):
+        return self.__subscriber
+
+    def valueChanged(self, year):
+        if self.__nextYear is not None:
+            self.__nextYear = min(self.__nextYear, year)
+
+    def invalidate(self):
+        self.__nextYear = None
+
+    def informed(self, endYear):
+        self.__nextYear = endYear + 1
+
+    def getPendingYears(self, firstStoredYear, endYear):
+        """returns (fromYear, reset), or (None, False) if there is nothing new to send"""
+        reset = self.__nextYear is None or self.__nextYear < firstStoredYear
+        if not reset and self.__nextYear > endYear:
+            return None, False
+
+        if self.__windowSize is not None:
+            fromYear = max(firstStoredYear, endYear - self.__windowSize + 1)
+        elif reset:
+            fromYear = firstStoredYear
+        else:
+            fromYear = self.__nextYear
+
+        return fromYear, reset
+
+
+class _FullSeriesAdapter:
+    """Passes deltas on to an old-style subscriber as the whole series history"""
+    def __init__(self, model, subscriber):
+        self.__model = model
+        self.__subscriber = subscriber
+
+    def timeSeriesDeltaUpdated(self, deltaData):
+        seriesID = deltaData["seriesID"]
         seriesData = {
-            "startYear": self.__startYear,
-            "endYear": self.__endYear,
+            "startYear": deltaData["startYear"],
+            "endYear": deltaData["endYear"],
             "seriesID": seriesID,
-            "seriesValues": list(self.__timeSeriesDict[seriesID])
+            "seriesValues": self.__model.getSeriesValues(seriesID)
         }
-        for subscriber in self.__timeSeriesSubscribers[seriesID]:
-            subscriber.timeSeriesUpdated(seriesData)
+        self.__subscriber.timeSeriesUpdated(seriesData)
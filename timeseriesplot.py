@@ -0,0 +1,260 @@
+#========================================================================
+#
+# timeseriesplot.py - class to plot one time series onto a matplotlib
+#   figure canvas
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+from time import perf_counter
+
+import numpy as np
+
+from minmaxpyramid import MinMaxPyramid
+from phasetimer import PHASE_TIMER
+
+
+class TimeSeriesPlot:
+    """Plots one time series onto a matplotlib figure and canvas.
+
+    Needs no Tk, so runs on any Agg-based canvas.  The axes, titles and labels
+    are rendered once into a cached background, and only the population line
+    is blitted over it until the axis limits or the figure size change.  Long
+    histories are decimated (by block min/max) to about two points per pixel
+    of plot width.
+
+    An ensemble's confidence band (lower and upper quantiles, plus the
+    median) can be shown behind the line, as part of the background.
+
+    Several plots can share one figure (see SharedFigureRenderer), each on
+    axes of its own or overlaid on the same axes.  With normalise set, values
+    are shown as a share of a scale between the largest and twice it (so
+    overlaid series are comparable), and the axes' title and labels are left
+    to the figure's owner.
+    """
+    FONT_SIZE = 18
+    MIN_YEARS_SHOWN = 10
+    MIN_POINTS = 100
+    BAND_ALPHA = 0.3
+    NORMALISED_Y_LIMIT = 1.05
+
+    def __init__(self, figure, canvas, seriesID, axes=None, normalise=False):
+        """axes defaults to a subplot filling the whole figure"""
+        self.__figure = figure
+        self.__canvas = canvas
+        self.__normalise = normalise
+
+        # the plot builds up its own level-of-detail copy of the history from the model's deltas
+        self.__historyStartYear = 0
+        self.__history = MinMaxPyramid()
+        # the first year the model still stores (years before it are dropped from the history in batches)
+        self.__firstShownYear = 0
+
+        if axes is None:
+            axes = self.__figure.add_subplot(1, 1, 1)
+        self.__plot = axes
+        self.__plot.set_aspect('auto')
+        self.__plot.spines['top'].set_visible(False)
+        self.__plot.spines['right'].set_visible(False)
+
+        self.__plot.set_xlim([0, 10])
+        if normalise:
+            self.__plot.set_ylim([0, TimeSeriesPlot.NORMALISED_Y_LIMIT])
+        else:
+            self.__plot.set_title(seriesID, fontsize=TimeSeriesPlot.FONT_SIZE)
+            self.__plot.set_xlabel("Year", fontsize=TimeSeriesPlot.FONT_SIZE)
+            self.__plot.set_ylabel("Population", fontsize=TimeSeriesPlot.FONT_SIZE)
+            self.__plot.set_ylim([0, 10])
+
+        # apparently plot returns a tuple
+        self.__populationLine, = self.__plot.plot([0, 1], [0, 0], label=seriesID)
+        # the line is drawn separately from the cached background
+        self.__populationLine.set_animated(True)
+        self.__background = None
+        self.__backgroundStale = True
+        self.__endYear = 0
+        # the value shown at the top of normalised plots
+        self.__scale = 1
+
+        # ensemble confidence band artists, and the extent of the band
+        self.__bandArtists = []
+        self.__bandEndYear = None
+        self.__bandMax = 0
+
+    def setSeriesID(self, seriesID):
+        """Retitles the plot for another series, whose history should then be
+        merged in with a reset delta"""
+        if not self.__normalise:
+            self.__plot.set_title(seriesID, fontsize=TimeSeriesPlot.FONT_SIZE)
+        self.__populationLine.set_label(seriesID)
+        self.invalidateBackground()
+
+    def getLine(self):
+        return self.__populationLine
+
+    def setVisible(self, visible):
+        """Shows or hides the line and band (but not the axes, which may be shared)"""
+        for artist in [self.__populationLine] + self.__bandArtists:
+            artist.set_visible(visible)
+        self.invalidateBackground()
+
+    def mergeDelta(self, deltaData):
+        """Merge the changed values from a model delta into the plotted history"""
+        fromYear = deltaData["fromYear"]
+        if deltaData["reset"] or fromYear < self.__historyStartYear:
+            self.__historyStartYear = fromYear
+            self.__history.clear()
+
+        # replace everything from fromYear onwards
+        self.__history.setValues(fromYear - self.__historyStartYear, deltaData["seriesValues"])
+
+        # drop the years the model no longer stores, once they are at least half the history, so
+        # that the history stays within twice the model's and the cost of trimming is spread out
+        self.__firstShownYear = max(deltaData["startYear"], self.__historyStartYear)
+        numStaleYears = self.__firstShownYear - self.__historyStartYear
+        if numStaleYears > 0 and 2*numStaleYears >= len(self.__history):
+            self.__history.dropFirst(numStaleYears)
+            self.__historyStartYear = self.__firstShownYear
+
+        self.__endYear = deltaData["endYear"]
+
+    def setConfidenceBand(self, years, lowerValues, medianValues, upperValues):
+        """Shows a band between lowerValues and upperValues (and a line along
+        medianValues) for the years given, replacing any band already shown"""
+        self.clearConfidenceBand()
+
+        colour = self.__populationLine.get_color()
+        self.__bandArtists.append(self.__plot.fill_between(years, lowerValues, upperValues,
+                                                           color=colour, alpha=TimeSeriesPlot.BAND_ALPHA,
+                                                           linewidth=0))
+        self.__bandArtists += self.__plot.plot(years, medianValues, color=colour, linestyle='--')
+        for artist in self.__bandArtists:
+            artist.set_visible(self.__populationLine.get_visible())
+            if self.__normalise:
+                artist.set_transform(self.__getScaleTransform())
+
+        self.__bandEndYear = years[-1]
+        finiteUpperValues = np.asarray(upperValues)[np.isfinite(upperValues)]
+        self.__bandMax = max(finiteUpperValues.max(), 0) if len(finiteUpperValues) > 0 else 0
+        self.invalidateBackground()
+
+    def clearConfidenceBand(self):
+        for artist in self.__bandArtists:
+            artist.remove()
+        self.__bandArtists = []
+        self.__bandEndYear = None
+        self.__bandMax = 0
+        self.invalidateBackground()
+
+    def invalidateBackground(self):
+        """Makes the next render() redraw everything, e.g. after the figure is resized"""
+        self.__background = None
+        self.__backgroundStale = True
+
+    def render(self):
+        """Re-plot time series to canvas"""
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        if self.prepareRender() or self.__background is None:
+            self.redraw()
+        else:
+            self.__drawLineOnly()
+
+        if timing:
+            PHASE_TIMER.record("TimeSeriesPlot.render", startTime)
+
+    def prepareRender(self):
+        """Updates the axis limits and the line's data, returning True if the
+        static artists need to be drawn again (which the caller must then do)"""
+        limitsChanged = self.__updateAxisLimits()
+
+        # update the data, with only as much detail as there are pixels to show it
+        maxPoints = max(2*int(self.__plot.bbox.width), TimeSeriesPlot.MIN_POINTS)
+        yearOffsets, popValues = self.__history.getDecimated(maxPoints)
+        self.__populationLine.set_xdata(self.__historyStartYear + yearOffsets)
+        self.__populationLine.set_ydata(popValues)
+
+        backgroundStale = self.__backgroundStale
+        self.__backgroundStale = False
+        return limitsChanged or backgroundStale
+
+    def drawLine(self):
+        """Draws the (animated) line onto the canvas' renderer, ready to blit"""
+        self.__plot.draw_artist(self.__populationLine)
+
+    def redraw(self):
+        """Renders the static artists, caches them, then blits the line on top"""
+        timing = PHASE_TIMER.enabled
+        if timing:
+            startTime = perf_counter()
+
+        self.__canvas.draw()
+        self.__background = self.__canvas.copy_from_bbox(self.__figure.bbox)
+        self.__backgroundStale = False
+        self.__plot.draw_artist(self.__populationLine)
+        self.__canvas.blit(self.__figure.bbox)
+
+        if timing:
+            PHASE_TIMER.record("TimeSeriesPlot.redraw", startTime)
+
+    def __drawLineOnly(self):
+        self.__canvas.restore_region(self.__background)
+        self.__plot.draw_artist(self.__populationLine)
+        self.__canvas.blit(self.__plot.bbox)
+
+    def __updateAxisLimits(self):
+        """Grows/shrinks the axis limits in steps, returning True if they changed"""
+        prevLimits = (self.__plot.get_xlim(), self.__plot.get_ylim())
+
+        # calc x bounds (grown in steps, so that the background can be reused in between)
+        startYear = self.__firstShownYear
+        endYear = self.__endYear
+        if self.__bandEndYear is not None:
+            endYear = max(endYear, self.__bandEndYear)
+        yearsShown = max(endYear - startYear, TimeSeriesPlot.MIN_YEARS_SHOWN)
+        lowerXBound, upperXBound = self.__plot.get_xlim()
+        xRange = upperXBound - lowerXBound
+        if lowerXBound != startYear:
+            xRange = TimeSeriesPlot.MIN_YEARS_SHOWN
+        while xRange > 2*yearsShown:
+            xRange /= 1.5
+        while xRange < yearsShown:
+            xRange *= 1.5
+        self.__plot.set_xlim([startYear, startYear + xRange])
+
+        # calc y bounds (or, for normalised plots, the value at the top)
+        maxPop = max(self.__history.getMax(), self.__bandMax)
+        if self.__normalise:
+            # like the y bounds, the scale is stepped so that the background can be reused
+            scale = self.__scale
+            if maxPop > 0:
+                while scale > 2*maxPop:
+                    scale /= 1.5
+            while scale < maxPop:
+                scale *= 1.5
+            scaleChanged = scale != self.__scale
+            if scaleChanged:
+                self.__scale = scale
+                for artist in [self.__populationLine] + self.__bandArtists:
+                    artist.set_transform(self.__getScaleTransform())
+            return scaleChanged or (self.__plot.get_xlim(), self.__plot.get_ylim()) != prevLimits
+
+        lowerYBound, upperYBound = self.__plot.get_ylim()
+        if maxPop > 0:
+            while upperYBound > 2*maxPop:
+                upperYBound /= 1.5
+        while upperYBound < maxPop:
+            upperYBound *= 1.5
+        self.__plot.set_ylim([lowerYBound, upperYBound])
+
+        return (self.__plot.get_xlim(), self.__plot.get_ylim()) != prevLimits
+
+    def __getScaleTransform(self):
+        """Returns the transform showing values as a share of the scale"""
+        from matplotlib.transforms import Affine2D
+
+        return Affine2D().scale(1, 1/self.__scale) + self.__plot.transData
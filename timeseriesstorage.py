@@ -0,0 +1,188 @@
+#========================================================================
+#
+# timeseriesstorage.py - class to hold the values of a collection of time
+#   series in a single preallocated array
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+
+class ArrayTimeSeriesStorage:
+    """Holds all time series as the columns of one 2-D array (rows are years).
+
+    Rows are addressed by absolute index (0 is the first row ever appended).
+    Capacity doubles as rows are appended, so appending is amortised O(1).
+    If maxRows is given, the storage becomes a ring buffer that only retains
+    the most recent maxRows rows.  The ring is mirrored (each row is written
+    twice) so that the retained rows are always one contiguous block and can
+    be handed out as zero-copy views.  The very first row is always kept, so
+    that the starting values survive however long the run.
+
+    Values default to float64 holding whole numbers, which never overflow
+    but are only exact up to 2**53; larger values are rounded.
+    """
+    def __init__(self, initialCapacity=64, maxRows=None, dtype=np.float64):
+        self.__initialCapacity = max(1, initialCapacity)
+        self.__maxRows = maxRows
+        self.__dtype = dtype
+        self.__startYear = 0
+        self.__columnIDs = []
+        self.clear()
+
+    def clear(self, numColumns=0):
+        """Removes all rows, leaving a single row of zeros in numColumns columns"""
+        if self.__maxRows is None:
+            capacity = self.__initialCapacity
+        else:
+            capacity = 2*self.__maxRows
+
+        self.__buffer = np.zeros((capacity, numColumns), dtype=self.__dtype)
+        self.__firstRowValues = np.zeros(numColumns, dtype=self.__dtype)
+        self.__numRows = 1
+        self.__oldestRow = 0
+        self.__columnIDs = (self.__columnIDs + [None]*numColumns)[:numColumns]
+
+    def isRingBuffer(self):
+        return self.__maxRows is not None
+
+    def getNumColumns(self):
+        return self.__buffer.shape[1]
+
+    def getNumRows(self):
+        """Returns the total number of rows appended (including any no longer retained)"""
+        return self.__numRows
+
+    def getFirstRow(self):
+        """Returns the absolute index of the oldest retained row"""
+        return self.__oldestRow
+
+    def getStartYear(self):
+        """Returns the year of row 0 (only recorded here, for the model)"""
+        return self.__startYear
+
+    def setStartYear(self, startYear):
+        self.__startYear = startYear
+
+    def getColumnIDs(self):
+        return list(self.__columnIDs)
+
+    def addColumn(self, columnID=None):
+        """Adds a column of zeros, returning its index"""
+        numRowsInBuffer, numColumns = self.__buffer.shape
+        self.__buffer = np.hstack([self.__buffer, np.zeros((numRowsInBuffer, 1), dtype=self.__dtype)])
+        self.__firstRowValues = np.append(self.__firstRowValues, self.__buffer.dtype.type(0))
+        self.__columnIDs.append(columnID)
+        return numColumns
+
+    def appendRows(self, numRows, values=None):
+        """Appends numRows rows.  values is an array of shape (numRows, columns);
+        if it is None, the new rows repeat the most recent row.
+        """
+        if numRows <= 0:
+            return
+
+        if values is None:
+            values = np.broadcast_to(np.array(self.getLastRow()), (numRows, self.getNumColumns()))
+        else:
+            values = np.asarray(values, dtype=self.__dtype).reshape(numRows, self.getNumColumns())
+
+        if self.__maxRows is None:
+            self.__ensureCapacity(self.__numRows + numRows)
+            self.__buffer[self.__numRows:self.__numRows+numRows] = values
+        else:
+            # only the last maxRows of the new rows can survive
+            skippedRows = max(0, numRows - self.__maxRows)
+            for rowOffset in range(skippedRows, numRows):
+                self.__writeRingRow(self.__numRows + rowOffset, values[rowOffset])
+
+        self.__numRows += numRows
+        if self.__maxRows is not None:
+            self.__oldestRow = max(self.__oldestRow, self.__numRows - self.__maxRows)
+
+    def truncateRows(self, numRows):
+        """Drops all rows from the absolute row numRows onwards.  At least the
+        oldest retained row is always kept."""
+        self.__numRows = max(self.__oldestRow + 1, min(numRows, self.__numRows))
+
+    def getValue(self, row, column):
+        """Returns the value at the absolute row, or None if it is not retained"""
+        if row == 0:
+            return self.__firstRowValues[column]
+        if self.getFirstRow() <= row < self.__numRows:
+            return self.__buffer[self.__bufferIndex(row), column]
+        return None
+
+    def setValue(self, row, column, value):
+        if row == 0:
+            self.__firstRowValues[column] = value
+        if self.getFirstRow() <= row < self.__numRows:
+            bufferIdx = self.__bufferIndex(row)
+            self.__buffer[bufferIdx, column] = value
+            if self.__maxRows is not None:
+                self.__buffer[bufferIdx + self.__maxRows, column] = value
+
+    def getColumn(self, column):
+        """Returns a read-only view of the retained rows of a column, oldest first"""
+        return self.__readOnly(self.__retainedRows()[:, column])
+
+    def getRows(self, firstRow=None, endRow=None):
+        """Returns a read-only view of the retained rows from the absolute row
+        firstRow up to (not including) endRow, oldest first.  By default all
+        retained rows are returned."""
+        retainedFirstRow = self.getFirstRow()
+        if firstRow is None:
+            firstRow = retainedFirstRow
+        if endRow is None:
+            endRow = self.__numRows
+        firstRow = max(firstRow, retainedFirstRow)
+        endRow = max(firstRow, min(endRow, self.__numRows))
+        return self.__readOnly(self.__retainedRows()[firstRow - retainedFirstRow:endRow - retainedFirstRow])
+
+    def getLastRow(self):
+        return self.__readOnly(self.__buffer[self.__bufferIndex(self.__numRows-1)])
+
+    def setLastRow(self, values):
+        values = np.asarray(values, dtype=self.__dtype)
+        lastRow = self.__numRows-1
+        if lastRow == 0:
+            self.__firstRowValues[:] = values
+        if self.__maxRows is None:
+            self.__buffer[lastRow] = values
+        else:
+            self.__writeRingRow(lastRow, values)
+
+    def __retainedRows(self):
+        firstRow = self.getFirstRow()
+        startIdx = self.__bufferIndex(firstRow)
+        return self.__buffer[startIdx:startIdx + (self.__numRows - firstRow)]
+
+    def __bufferIndex(self, row):
+        if self.__maxRows is None:
+            return row
+        return row % self.__maxRows
+
+    def __writeRingRow(self, row, values):
+        bufferIdx = row % self.__maxRows
+        self.__buffer[bufferIdx] = values
+        self.__buffer[bufferIdx + self.__maxRows] = values
+        if row == 0:
+            self.__firstRowValues[:] = values
+
+    def __ensureCapacity(self, numRowsNeeded):
+        capacity = len(self.__buffer)
+        if numRowsNeeded > capacity:
+            while capacity < numRowsNeeded:
+                capacity *= 2
+            newBuffer = np.zeros((capacity, self.getNumColumns()), dtype=self.__dtype)
+            newBuffer[:self.__numRows] = self.__buffer[:self.__numRows]
+            self.__buffer = newBuffer
+
+    @staticmethod
+    def __readOnly(array):
+        view = array.view()
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,198 @@
+#========================================================================
+#
+# vectorpopsimcalculator.py - array-backed alternative to PopSimCalculator
+#
+# Copyright Greg King 2024
+# distributed under the MIT licence (see LICENCE.TXT)
+#
+#========================================================================
+
+import numpy as np
+
+from popsimcalculator import *
+from compiledfoodweb import CompiledFoodWeb
+from migrationmodel import MigrationModel
+
+
+class VectorPopSimCalculator:
+    """Calculates the same populations as PopSimCalculator, but with the food
+    web compiled once into index arrays so each year is a fixed number of
+    whole-array operations instead of nested dict walks.
+
+    Every sum is accumulated in the same order as the food web's predator and
+    prey lists, so the resulting integer populations match the dict-based
+    PopSimCalculator exactly.  Population arrays hold whole numbers as float64,
+    which are only exact up to 2**53; larger populations are rounded, so past
+    that point results may drift from PopSimCalculator's ints.
+
+    Migration (see MigrationModel) is drawn for every scenario at once, each
+    scenario getting its own draws, so ensembles of many replicates stay
+    both fast and reproducible from migrationSeed.
+    """
+    def __init__(self, foodWebGraph=FOOD_WEB_GRAPH,
+                 minPredationFactor=MIN_PREDATION_FACTOR, maxPredationFactor=MAX_PREDATION_FACTOR,
+                 migrationSeed=None, includeMigration=True):
+        """foodWebGraph may be a graph dict or a CompiledFoodWeb.  With
+        includeMigration False, migration is left for the caller to draw."""
+        if not isinstance(foodWebGraph, CompiledFoodWeb):
+            foodWebGraph = CompiledFoodWeb(foodWebGraph)
+
+        self.__minPredationFactor = minPredationFactor
+        self.__maxPredationFactor = maxPredationFactor
+        self.__foodWeb = foodWebGraph
+        self.__speciesIDList = foodWebGraph.getSpeciesIDList()
+        self.__speciesIndex = {speciesID: idx for idx, speciesID in enumerate(self.__speciesIDList)}
+        self.__prepareEdgeArrays()
+
+        self.__migrationModel = None
+        if includeMigration and MigrationModel.hasMigration(foodWebGraph):
+            self.__migrationModel = MigrationModel(foodWebGraph, migrationSeed)
+
+    def getSpeciesIDList(self):
+        return list(self.__speciesIDList)
+
+    def getCompiledFoodWeb(self):
+        return self.__foodWeb
+
+    def getMigrationSeed(self):
+        """Returns the seed of the migration draws, or None if there is no migration"""
+        if self.__migrationModel is None:
+            return None
+        return self.__migrationModel.getSeed()
+
+    def getSpeciesIndex(self, speciesID):
+        return self.__speciesIndex[speciesID]
+
+    def populationsToArray(self, populations):
+        """Converts a {speciesID: population} dict into a population array"""
+        result = np.zeros(len(self.__speciesIDList))
+        for speciesID, population in populations.items():
+            result[self.__speciesIndex[speciesID]] = population
+        return result
+
+    def arrayToPopulations(self, populationArray):
+        """Converts a population array back into a {speciesID: population} dict"""
+        return {speciesID: int(population)
+                for speciesID, population in zip(self.__speciesIDList, populationArray)}
+
+    def doSimulation(self, prevYearPopulations, year=None):
+        prevYearArray = self.populationsToArray(prevYearPopulations)
+        return self.arrayToPopulations(self.doSimulationArray(prevYearArray, year))
+
+    def doSimulationArray(self, prevYearPopulations, year=None):
+        """Advances a population array by one year.
+        The last axis is ordered as getSpeciesIDList(); a 2-D array of shape
+        (scenarios, species) advances every scenario independently in one step.
+        year is the year being calculated, which picks its migration draws; by
+        default it follows on from the previous call.
+        """
+        population = np.asarray(prevYearPopulations, dtype=np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # biomass of each species
+            biomass = population * self.__individualBiomass
+
+            # total predator biomass for each prey, and the share each predator gets
+            totalPredatorBiomass = self.__sumOverEdges(self.__preyEdgePrey,
+                                                       biomass[..., self.__preyEdgePredator])
+            edgeTotalPredatorBiomass = totalPredatorBiomass[..., self.__preyEdgePrey]
+            biomassPerPredator = np.where(edgeTotalPredatorBiomass > 0,
+                                          biomass[..., self.__preyEdgePrey] * biomass[..., self.__preyEdgePredator]
+                                          / edgeTotalPredatorBiomass,
+                                          0.0)
+
+            # adjust growth for food availability
+            totalAvailableBiomass = self.__sumOverEdges(self.__predatorEdgePredator,
+                                                        biomassPerPredator[..., self.__predatorEdgeToPreyEdge])
+            alive = population > 0
+            feedingPredator = alive & self.__hasPrey
+            hasFood = feedingPredator & (totalAvailableBiomass > 0)
+            predationPressure = np.where(hasFood,
+                                         biomass * self.__requiredBiomassFactor / totalAvailableBiomass,
+                                         0.0)
+            newPopulationLimit = np.trunc(totalAvailableBiomass / self.__requiredBiomassForIndividual)
+
+            popChangeFactor = np.ones(population.shape)
+            popChangeFactor = np.where(feedingPredator & (newPopulationLimit < population),
+                                       popChangeFactor * self.__declineRateFactor, popChangeFactor)
+            popChangeFactor = np.where(feedingPredator & (newPopulationLimit > population),
+                                       popChangeFactor * self.__growthRateFactor, popChangeFactor)
+            popChangeFactor = np.where(alive & ~self.__hasPrey,
+                                       popChangeFactor * self.__growthRateFactor, popChangeFactor)
+
+            # adjust growth for predator pressure (weighted average across predators)
+            predatorEdgeApplies = (hasFood[..., self.__preyEdgePredator]
+                                   & self.__preyEdgeHasPressure
+                                   & (edgeTotalPredatorBiomass > 0))
+            predationContribution = np.where(predatorEdgeApplies,
+                                             predationPressure[..., self.__preyEdgePredator]
+                                             * biomass[..., self.__preyEdgePredator]
+                                             / edgeTotalPredatorBiomass,
+                                             0.0)
+            totalPredationFactor = self.__sumOverEdges(self.__preyEdgePrey, predationContribution)
+            totalPredationFactor = np.clip(totalPredationFactor,
+                                           self.__minPredationFactor, self.__maxPredationFactor)
+            popChangeFactor = np.where(self.__hasPredators,
+                                       popChangeFactor / totalPredationFactor, popChangeFactor)
+
+        # produce new populations, nudging by one where rounding would stall a change
+        newPopulation = np.trunc(population * popChangeFactor)
+        unchanged = newPopulation == population
+        newPopulation += unchanged & (popChangeFactor > 1)
+        newPopulation -= unchanged & (popChangeFactor < 1) & (newPopulation > 0)
+
+        if self.__migrationModel is not None:
+            newPopulation += self.__migrationModel.drawMigration(newPopulation, year)
+
+        return newPopulation
+
+    def runSimulationArray(self, initialPopulations, numYears, startYear=None):
+        """Runs numYears years from initialPopulations of shape (scenarios, species).
+        Returns an array of shape (scenarios, numYears+1, species) whose first
+        year holds the initial populations.  startYear is the year of the
+        initial populations; by default it follows on from the previous run.
+        """
+        initialPopulations = np.asarray(initialPopulations, dtype=np.float64)
+        numScenarios, numSpecies = initialPopulations.shape
+        result = np.empty((numScenarios, numYears+1, numSpecies))
+        result[:, 0, :] = initialPopulations
+        for yearIdx in range(numYears):
+            year = None if startYear is None else startYear + yearIdx + 1
+            result[:, yearIdx+1, :] = self.doSimulationArray(result[:, yearIdx, :], year)
+        return result
+
+    def __sumOverEdges(self, edgeSpecies, edgeValues):
+        """Sums edge values into their species (in edge order), for each scenario"""
+        numSpecies = len(self.__speciesIDList)
+        if edgeValues.ndim == 1:
+            return np.bincount(edgeSpecies, weights=edgeValues, minlength=numSpecies)
+
+        # offset each scenario's species indices so a single bincount covers every scenario
+        numScenarios = edgeValues.shape[0]
+        scenarioOffsets = (np.arange(numScenarios) * numSpecies)[:, np.newaxis]
+        totals = np.bincount((scenarioOffsets + edgeSpecies).ravel(),
+                             weights=edgeValues.ravel(),
+                             minlength=numScenarios*numSpecies)
+        return totals.reshape(numScenarios, numSpecies)
+
+    def __prepareEdgeArrays(self):
+        foodWeb = self.__foodWeb
+        numSpecies = foodWeb.getNumSpecies()
+
+        self.__individualBiomass = foodWeb.getSpeciesArray(INDIVIDUAL_BIOMASS)
+        self.__requiredBiomassFactor = foodWeb.getSpeciesArray(REQUIRED_BIOMASS_FACTOR)
+        self.__growthRateFactor = foodWeb.getSpeciesArray(GROWTH_RATE_FACTOR)
+        self.__declineRateFactor = foodWeb.getSpeciesArray(DECLINE_RATE_FACTOR)
+        self.__requiredBiomassForIndividual = self.__individualBiomass * self.__requiredBiomassFactor
+
+        # expand the CSR rows into one species index per edge
+        predatorIndptr, predatorIndices = foodWeb.getPredatorCSR()
+        preyIndptr, preyIndices = foodWeb.getPreyCSR()
+        self.__hasPredators = np.diff(predatorIndptr) > 0
+        self.__hasPrey = np.diff(preyIndptr) > 0
+
+        self.__preyEdgePrey = np.repeat(np.arange(numSpecies), np.diff(predatorIndptr))
+        self.__preyEdgePredator = predatorIndices
+        self.__preyEdgeHasPressure = np.array(foodWeb.getPreyEdgeHasPressure(), dtype=bool)
+        self.__predatorEdgePredator = np.repeat(np.arange(numSpecies), np.diff(preyIndptr))
+        self.__predatorEdgeToPreyEdge = np.array(foodWeb.getPredatorEdgeToPreyEdge(), dtype=np.intp)